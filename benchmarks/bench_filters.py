@@ -0,0 +1,302 @@
+'''
+Benchmarks for :mod:`deimos.filters`.
+
+Run with ``python -m benchmarks.bench_filters``.
+
+'''
+
+import tracemalloc
+
+import numpy as np
+import scipy.ndimage as ndi
+
+import deimos
+from benchmarks.synthetic import timeit
+
+
+def make_lattice(n=1000000, shape=(2000, 200, 100), seed=0):
+    '''
+    Builds sparse integer lattice indices and intensities.
+
+    '''
+
+    rng = np.random.default_rng(seed)
+    flat = rng.choice(np.prod(shape), n, replace=False)
+    idx = np.column_stack(np.unravel_index(flat, shape)).astype(np.float32)
+    V = rng.gamma(2, 500, n).astype(np.float32)
+
+    return idx, V
+
+
+def bench_sparse_neighbors(n=1000000,
+                           radii=[[0, 1, 1], [1, 1, 1], [2, 10, 0]]):
+    '''
+    Compares lattice and KD-tree neighbor enumeration.
+
+    '''
+
+    idx, V = make_lattice(n=n)
+
+    print('sparse_neighbors ({} points)'.format(n))
+    for radius in radii:
+        t_tree = timeit(deimos.filters.sparse_neighbors, idx, radius=radius,
+                        backend='kdtree', repeat=1)
+        t_lat = timeit(deimos.filters.sparse_neighbors, idx, radius=radius,
+                       backend='lattice', repeat=1)
+        print('  radius={}: kdtree {:.3f} s, lattice {:.3f} s '
+              '({:.1f}x)'.format(radius, t_tree, t_lat, t_tree / t_lat))
+
+
+def median_loop(op, V):
+    '''
+    Reference per-row median over the operator adjacency.
+
+    '''
+
+    indptr = op.adjacency.indptr
+    values = V[op.adjacency.indices]
+
+    return np.array([np.median(values[a:b])
+                     for a, b in zip(indptr[:-1], indptr[1:])])
+
+
+def bench_sparse_median(n=200000, radius=[0, 1, 1], workers=[1, 2, 4]):
+    '''
+    Compares the segmented median to a per-row loop.
+
+    '''
+
+    idx, V = make_lattice(n=n)
+    op = deimos.filters.SparseLatticeOperator(idx, radius=radius)
+
+    t_loop = timeit(median_loop, op, V, repeat=1)
+    print('sparse median ({} points, radius={})'.format(n, radius))
+    print('  loop:      {:.3f} s'.format(t_loop))
+    for w in workers:
+        t = timeit(op.median, V, workers=w)
+        print('  workers={}: {:.3f} s ({:.0f}x)'.format(w, t, t_loop / t))
+
+
+def peak_memory(func, *args, **kwargs):
+    '''
+    Peak traced memory of a single call, in MB.
+
+    '''
+
+    tracemalloc.start()
+    func(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak / 2 ** 20
+
+
+def meshgrid_moments(edges, a, size, order):
+    '''
+    Reference moment filter over full-size edge grids, one filter pass per
+    weighted term.
+
+    '''
+
+    edges = np.meshgrid(*edges, indexing='ij')
+    f = ndi.uniform_filter(a, size=size, mode='constant')
+
+    res = []
+    for e in edges:
+        mu = ndi.uniform_filter(a * e, size=size, mode='constant') / f
+        if order == 1:
+            res.append(mu)
+            continue
+
+        var = ndi.uniform_filter(a * (e - mu) ** 2, size=size,
+                                 mode='constant') / f
+        if order == 2:
+            res.append(np.sqrt(var))
+            continue
+
+        x = ndi.uniform_filter(a * ((e - mu) / np.sqrt(var)) ** order,
+                               size=size, mode='constant') / f
+        res.append(x - 3 if order == 4 else x)
+
+    return res
+
+
+def bench_moments_pdf(shape=(400, 100, 60), size=[37, 9, 37]):
+    '''
+    Compares fused moment filters to meshgrid filters per moment.
+
+    '''
+
+    rng = np.random.default_rng(0)
+    a = rng.gamma(2, 500, shape)
+    edges = [np.linspace(100, 1000, shape[0]),
+             np.linspace(0, 50, shape[1]),
+             np.linspace(0, 30, shape[2])]
+
+    print('moments_pdf ({} grid, size={})'.format(
+        'x'.join(str(x) for x in shape), size))
+    for order in [1, 2, 3, 4]:
+        t_mesh = timeit(meshgrid_moments, edges, a, size, order, repeat=1)
+        t_fused = timeit(deimos.filters.moments_pdf, edges, a, size,
+                         orders=order, repeat=1)
+        print('  order {}: meshgrid {:.3f} s, fused {:.3f} s'.format(
+            order, t_mesh, t_fused))
+
+    def meshgrid_all():
+        return [meshgrid_moments(edges, a, size, k) for k in [1, 2, 3, 4]]
+
+    t = timeit(meshgrid_all, repeat=1)
+    m = peak_memory(meshgrid_all)
+    print('  all, meshgrid: {:.3f} s, {:.0f} MB'.format(t, m))
+
+    for dtype in [np.float64, np.float32]:
+        t = timeit(deimos.filters.moments_pdf, edges, a, size, dtype=dtype,
+                   repeat=1)
+        m = peak_memory(deimos.filters.moments_pdf, edges, a, size,
+                        dtype=dtype)
+        print('  all, fused {}: {:.3f} s, {:.0f} MB'.format(
+            np.dtype(dtype).name, t, m))
+
+
+def bench_tiled(shape=(800, 300, 300), size=[9, 3, 9], workers=[1, 2, 4]):
+    '''
+    Compares tiled and whole-grid maximum filtering.
+
+    '''
+
+    rng = np.random.default_rng(0)
+    a = rng.random(shape).astype(np.float32)
+
+    print('tiled maximum ({} grid)'.format('x'.join(str(x) for x in shape)))
+    t = timeit(deimos.filters.maximum, a, size, repeat=1)
+    m = peak_memory(deimos.filters.maximum, a, size)
+    print('  whole grid: {:.3f} s, {:.0f} MB'.format(t, m))
+
+    out = np.empty_like(a)
+    for w in workers:
+        t = timeit(deimos.filters.tiled, deimos.filters.maximum, a, size,
+                   workers=w, out=out, repeat=1)
+        m = peak_memory(deimos.filters.tiled, deimos.filters.maximum, a, size,
+                        workers=w, out=out)
+        print('  tiled, workers={}: {:.3f} s, {:.0f} MB'.format(w, t, m))
+
+
+def bench_sparse_local_maxima(n=1000000,
+                              shapes=[(2000, 200, 100), (20000, 200, 100)],
+                              bins=[37, 9, 37]):
+    '''
+    Compares sparse non-maximum suppression to the dense maximum filter.
+
+    '''
+
+    print('sparse_local_maxima ({} points, footprint {})'.format(n, bins))
+    for shape in shapes:
+        idx, V = make_lattice(n=n, shape=shape)
+        radius = [x // 2 for x in bins]
+        t_sparse = timeit(deimos.filters.sparse_local_maxima, idx, V, radius,
+                          repeat=1)
+
+        # Dense grid, if it fits
+        if np.prod(shape) <= 2 ** 28:
+            def dense():
+                H = np.zeros(shape, dtype=np.float32)
+                H[tuple(idx.astype(int).T)] = V
+                return H == deimos.filters.maximum(H, bins)
+
+            t_dense = '{:.3f} s'.format(timeit(dense, repeat=1))
+        else:
+            t_dense = 'skipped'
+
+        print('  grid {}: dense {}, sparse {:.3f} s'.format(
+            'x'.join(str(x) for x in shape), t_dense, t_sparse))
+
+
+def bench_smooth_active(n=[1000000, 8000000], radius=[0, 1, 0], iterations=7,
+                        atol=[0, 1.0]):
+    '''
+    Compares full and active-set iterated smoothing.
+
+    '''
+
+    for m in n:
+        idx, V = make_lattice(n=m)
+        op = deimos.filters.SparseLatticeOperator(idx, radius=radius)
+
+        print('smooth ({} points, {} iterations)'.format(m, iterations))
+        t = timeit(op.mean, V, iterations=iterations)
+        print('  full: {:.3f} s'.format(t))
+
+        for a in atol:
+            t = timeit(op.mean, V, iterations=iterations, atol=a)
+            counts = op.mean(V, iterations=iterations, atol=a,
+                             return_active=True)[1]
+            print('  atol={}: {:.3f} s, active {}'.format(
+                a, t, counts.tolist()))
+
+
+def van_herk_1d(a, w, axis, func=np.maximum, cval=-np.inf):
+    '''
+    Reference van Herk/Gil-Werman sliding extremum along one axis, with
+    constant padding and the window alignment of :mod:`scipy.ndimage`.
+
+    '''
+
+    if w <= 1:
+        return a
+
+    pre = int(np.prod(a.shape[:axis]))
+    n = a.shape[axis]
+    post = int(np.prod(a.shape[axis + 1:]))
+
+    # Pad to whole blocks of window length
+    nb = -(-(n + w - 1) // w)
+    p = np.full((pre, nb * w, post), cval, dtype=a.dtype)
+    p[:, w // 2:w // 2 + n] = a.reshape(pre, n, post)
+
+    # Prefix and suffix extrema within blocks
+    b = p.reshape(pre, nb, w, post)
+    g = func.accumulate(b, axis=2).reshape(p.shape)
+    h = func.accumulate(b[:, :, ::-1], axis=2)[:, :, ::-1].reshape(p.shape)
+
+    return func(h[:, :n], g[:, w - 1:w - 1 + n]).reshape(a.shape)
+
+
+def van_herk_maximum(a, size):
+    '''
+    Reference separable van Herk/Gil-Werman maximum filter.
+
+    '''
+
+    for axis, w in enumerate(size):
+        a = van_herk_1d(a, int(w), axis)
+
+    return a
+
+
+def bench_maximum(shape=(400, 200, 200),
+                  sizes=[[3, 3, 3], [9, 3, 9], [37, 9, 37], [101, 9, 101]]):
+    '''
+    Compares the ndimage maximum filter to a NumPy van Herk/Gil-Werman
+    implementation across footprint sizes.
+
+    '''
+
+    rng = np.random.default_rng(0)
+    a = rng.random(shape).astype(np.float32)
+
+    print('maximum ({} grid)'.format('x'.join(str(x) for x in shape)))
+    for size in sizes:
+        t_ndi = timeit(deimos.filters.maximum, a, size, repeat=1)
+        t_vhgw = timeit(van_herk_maximum, a, size, repeat=1)
+        print('  size={}: ndimage {:.3f} s, van Herk {:.3f} s'.format(
+            size, t_ndi, t_vhgw))
+
+
+if __name__ == '__main__':
+    bench_sparse_neighbors()
+    bench_sparse_median()
+    bench_moments_pdf()
+    bench_tiled()
+    bench_sparse_local_maxima()
+    bench_smooth_active()
+    bench_maximum()
@@ -0,0 +1,363 @@
+'''
+I/O benchmarks. Run from the repository root:
+
+    python -m benchmarks.bench_io
+
+'''
+
+import os
+import tempfile
+import tracemalloc
+import warnings
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+import pymzml
+
+import deimos
+from benchmarks.synthetic import make_features, timeit, write_mzml
+
+ACCESSION = {'drift_time': 'MS:1002476', 'retention_time': 'MS:1000016'}
+
+
+def load_mzml_two_pass(path, accession={}, dtype=np.float32):
+    '''
+    Reference two-pass loader, as shipped prior to single-pass ingest.
+
+    '''
+
+    data = pymzml.run.Reader(path)
+    accession = OrderedDict(accession)
+    res = {}
+    counter = {}
+    cols = {}
+
+    # First pass: get nrows
+    N = defaultdict(lambda: 0)
+    for spec in data:
+        N['ms{}'.format(spec.ms_level)] += spec.mz.shape[0]
+
+    # Second pass: parse
+    for spec in data:
+        n = spec.mz.shape[0]
+        if n == 0:
+            continue
+
+        if len(spec.mz) != len(spec.i):
+            warnings.warn("m/z and intensity array dimension mismatch")
+            continue
+
+        id_dict = spec.id_dict
+        precursor_info = {}
+        if spec.selected_precursors:
+            precursor_info = {
+                'precursor_mz': spec.selected_precursors[0].get('mz', None)}
+
+        level = 'ms{}'.format(spec.ms_level)
+        cols[level] = list(id_dict.keys()) + list(accession.keys()) \
+            + ['mz', 'intensity'] + list(precursor_info.keys())
+
+        arr = np.empty((n, len(cols[level])), dtype=dtype)
+        values = list(id_dict.values()) \
+            + [spec.get(v) for v in accession.values()]
+        for inx, v in enumerate(values):
+            arr[:, inx] = v
+        arr[:, len(values)] = spec.mz
+        arr[:, len(values) + 1] = spec.i
+        for inx, v in enumerate(precursor_info.values()):
+            arr[:, len(values) + 2 + inx] = v
+
+        if level not in res:
+            res[level] = np.empty((N[level], arr.shape[1]), dtype=dtype)
+            counter[level] = 0
+
+        res[level][counter[level]:counter[level] + n, :] = arr
+        counter[level] += n
+
+    return {level: pd.DataFrame(res[level], columns=cols[level])
+            for level in res.keys()}
+
+
+def save_mgf_groupby(path, features, groupby='index_ms1',
+                     precursor_mz='mz_ms1', fragment_mz='mz_ms2',
+                     fragment_intensity='intensity_ms2'):
+    '''
+    Reference per-group MGF writer, as shipped prior to bulk formatting.
+
+    '''
+
+    template = 'BEGIN IONS\nPEPMASS={}\n{}\nEND IONS\n\n'
+    with open(path, 'w') as f:
+        for name, grp in features.groupby(by=groupby):
+            ms2_str = '\n'.join('{}\t{}'.format(a, b) for a, b
+                                in zip(grp[fragment_mz].values,
+                                       grp[fragment_intensity].values))
+            values = list(grp[[precursor_mz]].values[0]) + [ms2_str]
+            f.write(template.format(*values))
+
+
+def make_pairs(spectra=20000, peaks=50, seed=0):
+    '''
+    Builds a synthetic MS1:MS2 pair table.
+
+    '''
+
+    rng = np.random.default_rng(seed)
+    n = spectra * peaks
+    idx = rng.permutation(np.repeat(np.arange(spectra), peaks))
+
+    return pd.DataFrame({'index_ms1': idx,
+                         'mz_ms1': (idx * 0.37 + 100).astype(np.float32),
+                         'mz_ms2': rng.uniform(50, 1500, n).astype(np.float32),
+                         'intensity_ms2': rng.integers(1, 10000, n).astype(
+                             np.float32)})
+
+
+def bench_save_mgf(spectra=20000, peaks=50):
+    '''
+    Compares bulk :func:`~deimos.io.save_mgf` to the per-group reference
+    writer.
+
+    '''
+
+    data = make_pairs(spectra=spectra, peaks=peaks)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        a = os.path.join(tmp, 'a.mgf')
+        b = os.path.join(tmp, 'b.mgf')
+
+        t_grp = timeit(save_mgf_groupby, a, data, repeat=1)
+        t_bulk = timeit(deimos.io.save_mgf, b, data, repeat=1)
+
+        with open(a) as fa, open(b) as fb:
+            identical = fa.read() == fb.read()
+
+    print('save_mgf ({} spectra, {} peaks each, identical: {})'.format(
+        spectra, peaks, identical))
+    print('  groupby: {:.3f} s'.format(t_grp))
+    print('  bulk:    {:.3f} s ({:.1f}x)'.format(t_bulk, t_grp / t_bulk))
+
+
+def bench_load_mgf(spectra=100000, peaks=50):
+    '''
+    Measures :func:`~deimos.io.load_mgf` and :func:`~deimos.io.load_msp`
+    throughput against reading the raw bytes.
+
+    '''
+
+    data = make_pairs(spectra=spectra, peaks=peaks)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext in ['.mgf', '.msp']:
+            path = os.path.join(tmp, 'bench' + ext)
+            deimos.save(path, data)
+            size = os.path.getsize(path) / 2 ** 20
+
+            def read(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+
+            t_read = timeit(read, path)
+            t_load = timeit(deimos.load, path)
+
+            print('load {} ({} spectra, {} peaks each, {:.0f} MB)'.format(
+                ext, spectra, peaks, size))
+            print('  read bytes: {:.3f} s'.format(t_read))
+            print('  load:       {:.3f} s ({:.0f} MB/s)'.format(
+                t_load, size / t_load))
+
+
+def bench_load_mzml(frames=40, scans=200, peaks=500):
+    '''
+    Compares single-pass :func:`~deimos.io.load_mzml` to the two-pass
+    reference loader.
+
+    '''
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.mzML')
+        write_mzml(path, frames=frames, scans=scans, peaks=peaks)
+        size = os.path.getsize(path) / 1E6
+
+        t_two = timeit(load_mzml_two_pass, path, accession=ACCESSION)
+        t_one = timeit(deimos.io.load_mzml, path, accession=ACCESSION)
+
+    print('load_mzml ({:.1f} MB, {} spectra)'.format(size, frames * scans))
+    print('  two-pass:    {:.3f} s'.format(t_two))
+    print('  single-pass: {:.3f} s ({:.2f}x)'.format(t_one, t_two / t_one))
+
+
+def bench_load_mzml_dtype(frames=40, scans=200, peaks=500):
+    '''
+    Peak traced memory and frame size of :func:`~deimos.io.load_mzml` per
+    dtype policy, against the two-pass reference loader.
+
+    '''
+
+    def peak(func, *args, **kwargs):
+        tracemalloc.start()
+        res = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = sum(v.memory_usage(index=False).sum() for v in res.values())
+        return peak / 1E6, size / 1E6
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.mzML')
+        write_mzml(path, frames=frames, scans=scans, peaks=peaks)
+
+        print('load_mzml dtype (peak / frame MB)')
+        print('  two-pass float32: {:.1f} / {:.1f}'.format(
+            *peak(load_mzml_two_pass, path, accession=ACCESSION)))
+        print('  float32:          {:.1f} / {:.1f}'.format(
+            *peak(deimos.io.load_mzml, path, accession=ACCESSION,
+                  dtype=np.float32)))
+        print('  float64:          {:.1f} / {:.1f}'.format(
+            *peak(deimos.io.load_mzml, path, accession=ACCESSION,
+                  dtype=np.float64)))
+        print('  default policy:   {:.1f} / {:.1f}'.format(
+            *peak(deimos.io.load_mzml, path, accession=ACCESSION)))
+
+
+def bench_load_mzml_workers(frames=40, scans=200, peaks=500,
+                            workers=[1, 2, 4]):
+    '''
+    Scaling of :func:`~deimos.io.load_mzml` with decoding processes.
+
+    '''
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.mzML')
+        write_mzml(path, frames=frames, scans=scans, peaks=peaks)
+
+        print('load_mzml workers ({} cores)'.format(os.cpu_count()))
+        for n in workers:
+            t = timeit(deimos.io.load_mzml, path, accession=ACCESSION,
+                       workers=n)
+            print('  workers={}: {:.3f} s'.format(n, t))
+
+
+def bench_load_formats(n=10000000):
+    '''
+    Compares HDF5 and DEIMoS container load times, for all columns and for a
+    column subset.
+
+    '''
+
+    data = make_features(n)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print('load formats ({} rows)'.format(n))
+        for ext in ['.h5', '.deimos']:
+            path = os.path.join(tmp, 'bench' + ext)
+            deimos.save(path, data, key='ms1')
+
+            def load_all():
+                return deimos.load(path, key='ms1')['intensity'].sum()
+
+            def load_subset():
+                res = deimos.load(path, key='ms1', columns=['mz', 'intensity'])
+                return res['intensity'].sum()
+
+            t_all = timeit(load_all)
+            t_sub = timeit(load_subset)
+            print('  {:8s} all: {:.3f} s, subset: {:.3f} s'.format(
+                ext, t_all, t_sub))
+
+
+def bench_load_hdf_multi(samples=20, n=1000000):
+    '''
+    Per-row memory of sample label columns from
+    :func:`~deimos.io.load_hdf_multi`.
+
+    '''
+
+    data = make_features(n=n)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, 'sample_{}.h5'.format(i))
+                 for i in range(samples)]
+        for path in paths:
+            deimos.save(path, data, key='ms1')
+
+        meta = {'group': ['control' if i % 2 else 'treated'
+                          for i in range(samples)]}
+        df = deimos.load(paths, key='ms1', meta=meta).compute()
+
+    usage = df.memory_usage(index=False, deep=True) / len(df.index)
+    print('load_hdf_multi labels ({} samples, bytes per row)'.format(samples))
+    for col in ['sample_idx', 'sample_id', 'group']:
+        print('  {:<10} {:.1f}'.format(col, usage[col]))
+    print('  {:<10} {:.1f}'.format('total', usage.sum()))
+
+
+def bench_save_hdf_profiles(frames=40, scans=200, peaks=500,
+                            profiles=['default', 'fast-write', 'balanced',
+                                      'archive']):
+    '''
+    Write throughput, read throughput, and compression ratio of
+    :func:`~deimos.io.save_hdf` profiles on decoded IMS data.
+
+    '''
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mzml = os.path.join(tmp, 'bench.mzML')
+        write_mzml(mzml, frames=frames, scans=scans, peaks=peaks)
+        data = deimos.io.load_mzml(mzml, accession=ACCESSION)['ms1']
+        size = data.memory_usage(index=False).sum() / 1E6
+
+        print('save_hdf profiles ({} rows, {:.1f} MB)'.format(
+            len(data.index), size))
+        for profile in profiles:
+            path = os.path.join(tmp, '{}.h5'.format(profile))
+
+            def write():
+                if os.path.exists(path):
+                    os.remove(path)
+                deimos.save(path, data, key='ms1', profile=profile)
+
+            t_write = timeit(write, repeat=1)
+            t_read = timeit(deimos.load, path, key='ms1')
+            ratio = size * 1E6 / os.path.getsize(path)
+
+            print('  {:<10}  write {:6.1f} MB/s  read {:6.1f} MB/s  '
+                  'ratio {:.2f}'.format(profile, size / t_write,
+                                        size / t_read, ratio))
+
+
+def bench_load_where(n=5000000, width=0.5):
+    '''
+    Compares a narrow m/z window read by slicing after a full load against
+    a pushed-down `where` selection on an indexed, m/z-sorted HDF5 table.
+
+    '''
+
+    data = make_features(n).sort_values(by='mz', ignore_index=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.h5')
+        deimos.save(path, data, key='ms1', data_columns=['mz'])
+
+        t_full = timeit(lambda: deimos.slice(deimos.load(path, key='ms1'),
+                                             by='mz', low=500,
+                                             high=500 + width))
+        t_where = timeit(lambda: deimos.load(path, key='ms1',
+                                             where={'mz': (500, 500 + width)}))
+
+    print('load where ({} rows, {} m/z window)'.format(n, width))
+    print('  load + slice: {:.3f} s'.format(t_full))
+    print('  where:        {:.3f} s ({:.1f}x)'.format(
+        t_where, t_full / t_where))
+
+
+if __name__ == '__main__':
+    bench_load_mzml()
+    bench_load_mzml_dtype()
+    bench_load_mzml_workers()
+    bench_load_formats()
+    bench_load_where()
+    bench_save_hdf_profiles()
+    bench_load_hdf_multi()
+    bench_save_mgf()
+    bench_load_mgf()
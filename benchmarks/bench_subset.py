@@ -0,0 +1,168 @@
+'''
+Benchmarks for :mod:`deimos.subset`.
+
+Run with ``python -m benchmarks.bench_subset``.
+
+'''
+
+import numpy as np
+import pandas as pd
+
+import deimos
+from benchmarks.synthetic import make_features, timeit
+
+
+def locate_loop(features, targets, tol):
+    '''
+    Locates each target in turn.
+
+    '''
+
+    return [deimos.locate(features, by=['mz', 'drift_time', 'retention_time'],
+                          loc=loc, tol=tol) for loc in targets]
+
+
+def bench_feature_index(n=2000000, queries=1000, tol=[0.01, 0.5, 0.3]):
+    '''
+    Compares repeated locate queries with and without a prebuilt index.
+
+    '''
+
+    features = make_features(n=n)
+    rng = np.random.default_rng(1)
+    targets = features[['mz', 'drift_time', 'retention_time']].values[
+        rng.choice(n, queries)]
+
+    print('locate ({} rows, {} queries)'.format(n, queries))
+    t_scan = timeit(locate_loop, features, targets[:queries // 10], tol,
+                    repeat=1) * 10
+    t_build = timeit(deimos.subset.FeatureIndex, features, by='mz', repeat=1)
+    index = deimos.subset.FeatureIndex(features, by='mz')
+    t_index = timeit(locate_loop, index, targets, tol, repeat=1)
+    print('  full scan: {:.3f} s (extrapolated)'.format(t_scan))
+    print('  index: build {:.3f} s, queries {:.3f} s'.format(t_build, t_index))
+
+
+def bench_locate_many(n=2000000, queries=10000, tol=[5E-6, 0.01, 0.3]):
+    '''
+    Compares batch locate to a loop over locate.
+
+    '''
+
+    features = make_features(n=n)
+    rng = np.random.default_rng(1)
+    by = ['mz', 'drift_time', 'retention_time']
+    targets = features[by].values[rng.choice(n, queries)]
+
+    def loop(features, targets):
+        return [deimos.locate(features, by=by, loc=loc,
+                              tol=[tol[0] * loc[0], tol[1] * loc[1], tol[2]])
+                for loc in targets]
+
+    print('locate_many ({} rows, {} queries)'.format(n, queries))
+    t_loop = timeit(loop, features, targets[:queries // 100], repeat=1) * 100
+    t_batch = timeit(deimos.locate_many, features, by=by, locs=targets,
+                     tol=tol, relative=[True, True, False], repeat=1)
+    print('  locate loop: {:.3f} s (extrapolated)'.format(t_loop))
+    print('  locate_many: {:.3f} s'.format(t_batch))
+
+
+def bench_collapse(n=2000000,
+                   keeps=[['mz', 'drift_time'],
+                          ['drift_time', 'retention_time'],
+                          ['mz', 'drift_time', 'retention_time']]):
+    '''
+    Compares groupby collapse to collapse over a prebuilt index.
+
+    '''
+
+    rng = np.random.default_rng(0)
+    dims = ['mz', 'drift_time', 'retention_time']
+    features = pd.DataFrame({'mz': rng.integers(0, 160000, n) / 128 + 100,
+                             'drift_time': rng.integers(0, 200, n) * 0.25 + 10,
+                             'retention_time': rng.integers(0, 40, n) * 0.5,
+                             'intensity': rng.gamma(2, 500, n).astype(
+                                 np.float32)})
+    factors = deimos.build_factors(features, dims=dims)
+    index = deimos.build_index(features, factors)
+
+    print('collapse ({} rows)'.format(n))
+    for keep in keeps:
+        t_groupby = timeit(deimos.collapse, features, keep=keep)
+        t_index = timeit(deimos.collapse, features, keep=keep, index=index)
+        print('  keep={}: groupby {:.3f} s, index {:.3f} s ({:.1f}x)'.format(
+            keep, t_groupby, t_index, t_groupby / t_index))
+
+
+def slice_partitions(partitions):
+    '''
+    Slices each partition bound from the full data.
+
+    '''
+
+    return [deimos.slice(partitions.features, by=partitions.split_on,
+                         low=a, high=b)
+            for a, b in partitions.bounds]
+
+
+def bench_partition(n=2000000, sizes=[1000, 100]):
+    '''
+    Compares sort-once partitioning to slicing each partition bound.
+
+    '''
+
+    features = make_features(n=n)
+
+    print('partition ({} rows)'.format(n))
+    for size in sizes:
+        partitions = deimos.partition(features, size=size)
+        t_slice = timeit(slice_partitions, partitions, repeat=1)
+        t_sort = timeit(lambda: list(deimos.partition(features, size=size)),
+                        repeat=1)
+        print('  size={} ({} partitions): slice {:.3f} s, sorted {:.3f} s '
+              '({:.1f}x)'.format(size, len(partitions.bounds), t_slice,
+                                 t_sort, t_slice / t_sort))
+
+
+def log_intensity(features):
+    '''
+    Same-length map function, replaces intensities by their logarithm.
+
+    '''
+
+    return features.assign(intensity=np.log1p(features['intensity'].values))
+
+
+def bench_shared_map(n=8000000, size=20000, processes=2):
+    '''
+    Compares pickled and shared memory dispatch of partitions to workers, and
+    pickled and shared output of same-length results.
+
+    '''
+
+    features = make_features(n=n)
+    partitions = deimos.partition(features, size=size)
+
+    print('map ({} rows, {} partitions, {} processes)'.format(
+        n, len(partitions.bounds), processes))
+    t_pickle = timeit(partitions.map, deimos.threshold, processes=processes,
+                      by='intensity', threshold=1E3, repeat=1)
+    t_shared = timeit(partitions.map, deimos.threshold, processes=processes,
+                      shared=True, by='intensity', threshold=1E3, repeat=1)
+    print('  pickled: {:.3f} s, shared: {:.3f} s ({:.1f}x)'.format(
+        t_pickle, t_shared, t_pickle / t_shared))
+
+    t_pickle = timeit(partitions.map, log_intensity, processes=processes,
+                      shared=True, repeat=1)
+    t_shared = timeit(partitions.map, log_intensity, processes=processes,
+                      shared=True, same_length=True, repeat=1)
+    print('  same length, pickled output: {:.3f} s, shared output: {:.3f} s '
+          '({:.1f}x)'.format(t_pickle, t_shared, t_pickle / t_shared))
+
+
+if __name__ == '__main__':
+    bench_feature_index()
+    bench_locate_many()
+    bench_collapse()
+    bench_partition()
+    bench_shared_map()
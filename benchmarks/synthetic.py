@@ -0,0 +1,191 @@
+import base64
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+_HEADER = '''<?xml version="1.0" encoding="utf-8"?>
+<indexedmzML xmlns="http://psi.hupo.org/ms/mzml" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<mzML xmlns="http://psi.hupo.org/ms/mzml" version="1.1.0">
+<cvList count="2">
+<cv id="MS" fullName="Proteomics Standards Initiative Mass Spectrometry Ontology" version="4.1.30"/>
+<cv id="UO" fullName="Unit Ontology"/>
+</cvList>
+<run id="synthetic">
+<spectrumList count="{count}">
+'''
+
+_SPECTRUM = '''<spectrum index="{index}" id="frame={frame} scan={scan}" defaultArrayLength="{n}">
+<cvParam cvRef="MS" accession="MS:1000511" name="ms level" value="{level}"/>
+<scanList count="1">
+<scan>
+<cvParam cvRef="MS" accession="MS:1000016" name="scan start time" value="{rt}" unitCvRef="UO" unitAccession="UO:0000031" unitName="minute"/>
+<cvParam cvRef="MS" accession="MS:1002476" name="ion mobility drift time" value="{dt}" unitCvRef="UO" unitAccession="UO:0000028" unitName="millisecond"/>
+</scan>
+</scanList>
+{precursor}<binaryDataArrayList count="2">
+<binaryDataArray encodedLength="{mz_len}">
+<cvParam cvRef="MS" accession="MS:1000523" name="64-bit float" value=""/>
+<cvParam cvRef="MS" accession="MS:1000574" name="zlib compression" value=""/>
+<cvParam cvRef="MS" accession="MS:1000514" name="m/z array" value="" unitCvRef="MS" unitAccession="MS:1000040" unitName="m/z"/>
+<binary>{mz}</binary>
+</binaryDataArray>
+<binaryDataArray encodedLength="{i_len}">
+<cvParam cvRef="MS" accession="MS:1000521" name="32-bit float" value=""/>
+<cvParam cvRef="MS" accession="MS:1000574" name="zlib compression" value=""/>
+<cvParam cvRef="MS" accession="MS:1000515" name="intensity array" value="" unitCvRef="MS" unitAccession="MS:1000131" unitName="number of detector counts"/>
+<binary>{i}</binary>
+</binaryDataArray>
+</binaryDataArrayList>
+</spectrum>
+'''
+
+_PRECURSOR = '''<precursorList count="1">
+<precursor>
+<selectedIonList count="1">
+<selectedIon>
+<cvParam cvRef="MS" accession="MS:1000744" name="selected ion m/z" value="{mz}" unitCvRef="MS" unitAccession="MS:1000040" unitName="m/z"/>
+</selectedIon>
+</selectedIonList>
+</precursor>
+</precursorList>
+'''
+
+_FOOTER = '''</spectrumList>
+</run>
+</mzML>
+'''
+
+
+def _encode(a, dtype):
+    a = np.asarray(a, dtype=dtype)
+    return base64.b64encode(zlib.compress(a.tobytes())).decode('ascii')
+
+
+def write_mzml(path, frames=10, scans=20, peaks=100, seed=0):
+    '''
+    Writes a synthetic, indexed IMS-MS mzML file with alternating MS1 and
+    MS2 frames.
+
+    Parameters
+    ----------
+    path : str
+        Path to output mzML file.
+    frames : int
+        Number of frames (retention time steps).
+    scans : int
+        Number of scans (drift time steps) per frame.
+    peaks : int
+        Maximum number of peaks per spectrum.
+    seed : int
+        Random seed.
+
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    body = []
+    offsets = []
+    index = 0
+    for frame in range(1, frames + 1):
+        level = 1 if frame % 2 else 2
+        for scan in range(1, scans + 1):
+            n = int(rng.integers(0, peaks + 1))
+            mz = np.sort(rng.uniform(50, 1500, n))
+            i = rng.integers(1, 5000, n)
+
+            precursor = ''
+            if level == 2:
+                precursor = _PRECURSOR.format(mz=rng.uniform(50, 1500))
+
+            mz = _encode(mz, '<f8')
+            i = _encode(i, '<f4')
+            body.append(_SPECTRUM.format(index=index, frame=frame, scan=scan,
+                                         n=n, level=level,
+                                         rt=frame * 0.05, dt=scan * 0.15,
+                                         precursor=precursor,
+                                         mz=mz, mz_len=len(mz),
+                                         i=i, i_len=len(i)))
+            index += 1
+
+    # Assemble and compute offsets
+    out = _HEADER.format(count=index).encode('utf-8')
+    for spec in body:
+        offsets.append(len(out))
+        out += spec.encode('utf-8')
+    out += _FOOTER.encode('utf-8')
+
+    index_offset = len(out)
+    index = ['<indexList count="1">\n<index name="spectrum">\n']
+    for k, o in enumerate(offsets):
+        frame = k // scans + 1
+        scan = k % scans + 1
+        index.append('<offset idRef="frame={} scan={}">{}</offset>\n'.format(
+            frame, scan, o))
+    index.append('</index>\n</indexList>\n')
+    index.append('<indexListOffset>{}</indexListOffset>\n'.format(
+        index_offset))
+    index.append('</indexedmzML>\n')
+    out += ''.join(index).encode('utf-8')
+
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def make_features(n=1000000, seed=0):
+    '''
+    Builds a synthetic IMS-MS feature table.
+
+    Parameters
+    ----------
+    n : int
+        Number of rows.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    :obj:`~pandas.DataFrame`
+        Feature coordinates and intensities.
+
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame({'mz': np.round(rng.uniform(50, 1500, n), 4),
+                         'drift_time': np.round(rng.uniform(10, 50, n), 2),
+                         'retention_time': np.round(rng.uniform(0, 30, n), 2),
+                         'intensity': rng.integers(1, 10000, n).astype(
+                             np.float32)})
+
+
+def timeit(func, *args, repeat=3, **kwargs):
+    '''
+    Best wall time of repeated calls.
+
+    Parameters
+    ----------
+    func : function
+        Function to time.
+    args
+        Positional arguments passed to `func`.
+    repeat : int
+        Number of calls.
+    kwargs
+        Keyword arguments passed to `func`.
+
+    Returns
+    -------
+    float
+        Shortest wall time, in seconds.
+
+    '''
+
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+
+    return best
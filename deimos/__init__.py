@@ -1,7 +1,7 @@
 from deimos import (alignment, calibration, deconvolution, filters, grid,
                     isotopes, peakpick, plot, utils)
 from deimos.io import get_accessions, load, save, build_factors, build_index
-from deimos.subset import (collapse, locate, locate_asym,
+from deimos.subset import (collapse, locate, locate_asym, locate_many,
                            multi_sample_partition, partition, slice, threshold)
 
 __version__ = "1.3.2"
@@ -289,11 +289,14 @@ def tunemix(features,
     # Check lengths
     deimos.utils.check_length([mz, ccs, q])
 
+    # Sort by m/z once for repeated queries
+    index = deimos.subset.FeatureIndex(features, by='mz')
+
     # Iterate tune ions
     ta = []
     for mz_i, ccs_i, q_i in zip(mz, ccs, q):
         # Slice ms1
-        subset = deimos.slice(features, by='mz',
+        subset = deimos.slice(index, by='mz',
                               low=mz_i - 0.1 * mz_tol,
                               high=mz_i + mz_i * 0.9 * mz_tol)
 
@@ -272,6 +272,9 @@ class MS2Deconvolution:
 
             '''
 
+            # Sort data once for repeated queries
+            data = deimos.subset.FeatureIndex(data, by=dims[0])
+
             res = []
             for i, row in features.iterrows():
                 subset = deimos.locate_asym(data, by=dims, loc=row[dims].values,
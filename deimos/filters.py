@@ -1,10 +1,11 @@
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 import pandas as pd
 import scipy.ndimage as ndi
-from ripser import ripser
 from scipy import sparse
 from scipy.spatial import KDTree
-from sklearn.utils.sparsefuncs import _get_median
 
 import deimos
 
@@ -53,25 +54,14 @@ def std_pdf(edges, a, size):
 
     '''
 
-    edges = np.meshgrid(*edges, indexing='ij')
-    f = ndi.uniform_filter(a, size=size, mode='constant')
-
-    res = []
-    for e in edges:
-        wmu = ndi.uniform_filter(a * e, size=size, mode='constant')
-        mu = wmu / f
-
-        wvar = ndi.uniform_filter(
-            a * (e - mu) ** 2, size=size, mode='constant')
-        var = wvar / f
-        res.append(np.sqrt(var))
-
-    return res
+    return moments_pdf(edges, a, size, orders=2)[2]
 
 
 def maximum(a, size):
     '''
-    N-dimensional convolution of a maximum filter.
+    N-dimensional convolution of a maximum filter. The box footprint is
+    applied axis by axis, each pass costing amortized constant time per
+    element regardless of window length.
 
     Parameters
     ----------
@@ -92,7 +82,9 @@ def maximum(a, size):
 
 def minimum(a, size):
     '''
-    N-dimensional convolution of a minimum filter.
+    N-dimensional convolution of a minimum filter. The box footprint is
+    applied axis by axis, each pass costing amortized constant time per
+    element regardless of window length.
 
     Parameters
     ----------
@@ -181,15 +173,7 @@ def mean_pdf(edges, a, size):
 
     '''
 
-    edges = np.meshgrid(*edges, indexing='ij')
-    f = ndi.uniform_filter(a, size=size, mode='constant')
-
-    res = []
-    for e in edges:
-        w = ndi.uniform_filter(a * e, size=size, mode='constant')
-        res.append(w / f)
-
-    return res
+    return moments_pdf(edges, a, size, orders=1)[1]
 
 
 def matched_gaussian(a, size):
@@ -261,25 +245,7 @@ def skew_pdf(edges, a, size):
 
     '''
 
-    edges = np.meshgrid(*edges, indexing='ij')
-    f = ndi.uniform_filter(a, size=size, mode='constant')
-
-    res = []
-    for e in edges:
-        wmu = ndi.uniform_filter(a * e, size=size, mode='constant')
-        mu = wmu / f
-
-        wvar = ndi.uniform_filter(
-            a * (e - mu) ** 2, size=size, mode='constant')
-        var = wvar / f
-        sigma = np.sqrt(var)
-
-        wskew = ndi.uniform_filter(
-            a * ((e - mu) / sigma) ** 3, size=size, mode='constant')
-        skew = wskew / f
-        res.append(skew)
-
-    return res
+    return moments_pdf(edges, a, size, orders=3)[3]
 
 
 def kurtosis_pdf(edges, a, size):
@@ -303,300 +269,1199 @@ def kurtosis_pdf(edges, a, size):
 
     '''
 
-    edges = np.meshgrid(*edges, indexing='ij')
-    f = ndi.uniform_filter(a, size=size, mode='constant')
+    return moments_pdf(edges, a, size, orders=4)[4]
+
+
+def moments_pdf(edges, a, size, orders=(1, 2, 3, 4), dtype=np.float64):
+    '''
+    N-dimensional convolution of mean, standard deviation, skew, and
+    kurtosis probability density function filters, computed together.
+    Within each window, edge coordinates are weighted by intensity. Raw
+    power sums of edge offsets are computed per axis by uniform filter
+    passes, after averaging over the remaining axes, and central moments
+    are derived from them. Offsets are taken from a local origin per block
+    of the axis, a few windows long, to limit cancellation. Edges are
+    broadcast as 1D vectors, so no full-size coordinate grids are built.
+
+    Parameters
+    ----------
+    edges : list of :obj:`~numpy.array`
+        Edges coordinates along each grid axis.
+    a : :obj:`~numpy.array`
+        N-dimensional array of intensity data.
+    size : int or list
+        Size of the convolution kernel in each dimension.
+    orders : int or list
+        Moments to compute: 1 (mean), 2 (standard deviation), 3 (skew),
+        and/or 4 (excess kurtosis).
+    dtype : data-type
+        Floating point type of computation and output.
 
-    res = []
-    for e in edges:
-        wmu = ndi.uniform_filter(a * e, size=size, mode='constant')
-        mu = wmu / f
+    Returns
+    -------
+    dict of list of :obj:`~numpy.array`
+        Filtered edge data per dimension, keyed by order.
+
+    '''
+
+    # Safely cast to list
+    edges = deimos.utils.safelist(edges)
+    orders = np.atleast_1d(orders).tolist()
+    size = deimos.utils.safelist(size)
 
-        wvar = ndi.uniform_filter(
-            a * (e - mu) ** 2, size=size, mode='constant')
-        var = wvar / f
-        sigma = np.sqrt(var)
+    # Check orders
+    if not set(orders).issubset({1, 2, 3, 4}):
+        raise ValueError('Moment orders must be in {1, 2, 3, 4}.')
 
-        wkurtosis = ndi.uniform_filter(
-            a * ((e - mu) / sigma) ** 4, size=size, mode='constant')
-        kurtosis = wkurtosis / f
-        res.append(kurtosis - 3)
+    a = np.asarray(a, dtype=dtype)
+
+    # Check dims
+    if len(size) == 1:
+        size = size * a.ndim
+    deimos.utils.check_length([edges, size, a.shape])
+    for e, n in zip(edges, a.shape):
+        if len(e) != n:
+            raise ValueError('Edges must match the shape of `a`.')
+
+    pmax = max(orders)
+    f = None
+
+    # Average over last axis, shared by all but the last dimension
+    if a.ndim > 2:
+        last = ndi.uniform_filter1d(a, size[-1], axis=-1, mode='constant')
+
+    res = {k: [] for k in orders}
+    for i, e in enumerate(edges):
+        e = np.asarray(e, dtype=dtype)
+        n = len(e)
+        h = size[i]
+
+        # Average over remaining axes
+        if a.ndim > 2 and i < a.ndim - 1:
+            b = ndi.uniform_filter(last,
+                                   size=[1 if j in [i, a.ndim - 1] else x for j, x in enumerate(size)],
+                                   mode='constant')
+        elif a.ndim > 1:
+            b = ndi.uniform_filter(a,
+                                   size=[1 if j == i else x for j, x in enumerate(size)],
+                                   mode='constant')
+        else:
+            b = a
+        if (a.ndim > 2) and (i == a.ndim - 2):
+            del last
+
+        # Average over full window
+        if f is None:
+            f = ndi.uniform_filter1d(b, h, axis=i, mode='constant')
+
+        # Raw power sums by separable passes over blocks along the axis,
+        # offsets taken from a local origin per block for stability. The
+        # mean alone does not cancel, so needs a single block
+        step = max(4 * h, 64) if pmax > 1 else n
+        sums = [np.empty_like(a) for p in range(pmax)]
+        origin = np.empty(n, dtype=dtype)
+        shape = [1] * a.ndim
+        shape[i] = -1
+        for start in range(0, n, step):
+            stop = min(start + step, n)
+            lo = max(start - h // 2, 0)
+            hi = min(stop + h - h // 2 - 1, n)
+
+            src = [slice(None)] * a.ndim
+            dst = [slice(None)] * a.ndim
+            inner = [slice(None)] * a.ndim
+            src[i] = slice(lo, hi)
+            dst[i] = slice(start, stop)
+            inner[i] = slice(start - lo, stop - lo)
+
+            origin[start:stop] = e[(start + stop - 1) // 2]
+            d = (e[lo:hi] - origin[start]).reshape(shape)
+
+            x = b[tuple(src)]
+            for p in range(pmax):
+                x = x * d
+                sums[p][tuple(dst)] = ndi.uniform_filter1d(x, h, axis=i,
+                                                           mode='constant')[tuple(inner)]
+            del x
+
+        # Windows with weight at a single position have zero variance
+        if pmax > 2:
+            nz = ndi.uniform_filter((a != 0).view(np.uint8),
+                                    size=[1 if j == i else x for j, x in enumerate(size)],
+                                    mode='constant', output=np.float32) > 0
+            degenerate = ndi.uniform_filter1d(nz.view(np.uint8), h, axis=i,
+                                              mode='constant', output=np.float32) * h < 1.5
+            del nz
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for x in sums:
+                x /= f
+
+            # Central moments, in place where possible
+            m = sums[0]
+            if pmax > 1:
+                m2 = np.square(m)
+
+                # Zero variance within rounding of raw sums
+                c2 = sums[1] - m2
+                c2[c2 <= 8 * np.finfo(dtype).eps * sums[1]] = 0
+                if pmax > 2:
+                    c2[degenerate] = 0
+            if 4 in orders:
+                # r3 - m * (4 * r2 - m * (6 * r1 - 3 * m ** 2))
+                c4 = 6 * sums[1] - 3 * m2
+                c4 *= m
+                c4 = np.subtract(4 * sums[2], c4, out=c4)
+                c4 *= m
+                c4 = np.subtract(sums[3], c4, out=c4)
+                c4 /= np.square(c2)
+                c4 -= 3
+                c4[degenerate] = np.nan
+                res[4].append(c4)
+            if 3 in orders:
+                # r2 - m * (3 * r1 - 2 * m ** 2)
+                c3 = sums[2]
+                c3 -= m * (3 * sums[1] - 2 * m2)
+                c3 /= c2 ** 1.5
+                c3[degenerate] = np.nan
+                res[3].append(c3)
+            if 2 in orders:
+                res[2].append(np.sqrt(c2, out=c2))
+            if 1 in orders:
+                m += origin.reshape(shape)
+                res[1].append(m)
+            del sums
 
     return res
 
 
-def embed_unique_indices(a):
+def _halo(func, size, ndim):
+    '''
+    Kernel reach of a dense filter in each dimension.
 
-    def count_tens(n):
-        # Count tens
-        ntens = (n - 1) // 10
+    '''
 
-        while True:
-            ntens_test = (ntens + n - 1) // 10
+    size = deimos.utils.safelist(size)
+    if len(size) == 1:
+        size = size * ndim
 
-            if ntens_test == ntens:
-                return ntens
-            else:
-                ntens = ntens_test
+    # Gaussian truncated at four standard deviations
+    if func is matched_gaussian:
+        return [int(4.0 * x + 0.5) for x in size]
 
-    def arange_exclude_10s(n):
-        # How many 10s will there be?
-        ntens = count_tens(n)
+    return [int(x) // 2 for x in size]
 
-        # Base array
-        arr = np.arange(0, n + ntens)
 
-        # Exclude 10s
-        arr = arr[(arr == 0) | (arr % 10 != 0)][:n]
+def tiled(func, a, size, tile_shape=None, workers=1, out=None, halo=None,
+          **kwargs):
+    '''
+    Tiled execution of an N-dimensional dense filter. The grid is split into
+    blocks, each extended by a halo sized from the kernel, and blocks are
+    filtered independently across a thread pool. Only the interior of each
+    block is written to the output, so results match filtering the full
+    grid. Tiling bounds only the working memory of `func`: `a` and `out`
+    remain full size, so peak memory is unchanged unless both are
+    memory-mapped.
 
-        return arr
+    Parameters
+    ----------
+    func : function
+        Dense filter with signature `func(a, size, **kwargs)`, e.g.
+        :func:`~deimos.filters.maximum`.
+    a : :obj:`~numpy.array`
+        N-dimensional array of intensity data. May be memory-mapped.
+    size : int or list
+        Size of the convolution kernel in each dimension.
+    tile_shape : int, list, or None
+        Shape of each block, excluding halo. If None, blocks span all but
+        the first dimension.
+    workers : int
+        Number of threads.
+    out : :obj:`~numpy.array` or None
+        Output array, e.g. a :obj:`~numpy.memmap`. Allocated if None.
+    halo : int, list, or None
+        Halo width in each dimension. If None, inferred from `func` and
+        `size`.
+    kwargs
+        Keyword arguments passed to `func`.
 
-    # Creates an array of indices, sorted by unique element
-    idx_sort = np.argsort(a)
-    idx_unsort = np.argsort(idx_sort)
+    Returns
+    -------
+    :obj:`~numpy.array`
+        Filtered intensity data.
 
-    # Sorts records array so all unique elements are together
-    sorted_a = a[idx_sort]
+    '''
 
-    # Returns the unique values, the index of the first occurrence,
-    # and the count for each element
-    vals, idx_start, count = np.unique(sorted_a, return_index=True, return_counts=True)
+    shape = a.shape
+    ndim = len(shape)
 
-    # Splits the indices into separate arrays
-    splits = np.split(idx_sort, idx_start[1:])
+    # Default blocks of ~2^22 elements along the first dimension
+    if tile_shape is None:
+        inner = int(np.prod(shape[1:]))
+        tile_shape = [max(1, 2 ** 22 // max(inner, 1))] + list(shape[1:])
 
-    # Creates unique indices for each split
-    idx_unq = np.concatenate([arange_exclude_10s(len(x)) for x in splits])
+    # Safely cast to list
+    tile_shape = deimos.utils.safelist(tile_shape)
+    if len(tile_shape) == 1:
+        tile_shape = tile_shape * ndim
 
-    # Reorders according to input array
-    idx_unq = idx_unq[idx_unsort]
+    if halo is None:
+        halo = _halo(func, size, ndim)
+    halo = deimos.utils.safelist(halo)
+    if len(halo) == 1:
+        halo = halo * ndim
 
-    # Magnitude of each index
-    exp = np.log10(idx_unq,
-                   where=idx_unq > 0,
-                   out=np.zeros_like(idx_unq, dtype=np.float64))
-    idx_unq_mag = np.power(10, np.floor(exp) + 1)
+    # Check dims
+    deimos.utils.check_length([tile_shape, halo, shape])
+    if any([x < 1 for x in tile_shape]):
+        raise ValueError('Tile shape must be positive.')
+
+    # Block bounds
+    starts = [range(0, n, int(t)) for n, t in zip(shape, tile_shape)]
+    blocks = []
+    for corner in np.ndindex(*[len(x) for x in starts]):
+        lo = [x[c] for x, c in zip(starts, corner)]
+        hi = [min(x + int(t), n) for x, t, n in zip(lo, tile_shape, shape)]
+        blocks.append((lo, hi))
+
+    def run(block):
+        lo, hi = block
+
+        # Extend by halo, clipped to grid
+        outer = tuple(slice(max(x - h, 0), min(y + h, n))
+                      for x, y, h, n in zip(lo, hi, halo, shape))
+        inner = tuple(slice(x - o.start, y - o.start)
+                      for x, y, o in zip(lo, hi, outer))
+
+        res = func(np.asarray(a[outer]), size, **kwargs)[inner]
+        return tuple(slice(x, y) for x, y in zip(lo, hi)), res
+
+    # First block determines output type
+    idx, res = run(blocks[0])
+    if out is None:
+        out = np.empty(shape, dtype=res.dtype)
+    out[idx] = res
+
+    def write(block):
+        idx, res = run(block)
+        out[idx] = res
+
+    if workers > 1:
+        with ThreadPool(processes=workers) as p:
+            p.map(write, blocks[1:])
+    else:
+        for block in blocks[1:]:
+            write(block)
 
-    # Result
-    return a + idx_unq / idx_unq_mag
+    return out
 
 
-def sparse_upper_star(idx, V):
+def sparse_upper_star(idx, V, return_labels=False, backend='lattice'):
     '''
-    Sparse implementation of an upper star filtration.
+    Sparse implementation of an upper star filtration. Zero-dimensional
+    persistence is computed by union-find over steepest-ascent basins.
+    Points are ranked by descending intensity once, with ties broken by
+    position, and each point is assigned to the basin of the local maximum
+    reached by steepest ascent. Basins are then merged at their highest
+    connecting saddle, the basin with the lower peak dying at the merge.
+
     Parameters
     ----------
     idx : :obj:`~numpy.array`
         Edge indices for each dimension (MxN).
     V : :obj:`~numpy.array`
         Array of intensity data (Mx1).
+    return_labels : bool
+        Signal whether to return the basin label of each point.
+    backend : str
+        Neighbor search backend. See
+        :func:`~deimos.filters.sparse_neighbors`.
+
     Returns
     -------
     idx : :obj:`~numpy.array`
-        Index of filtered points (Mx1).
+        Index of filtered points (Px1), by descending intensity.
     persistence : :obj:`~numpy.array`
-        Persistence of each filtered point (Mx1).
+        Persistence of each filtered point (Px1). Peaks that never merge
+        persist to the minimum intensity.
+    labels : :obj:`~numpy.array`
+        Index of the basin peak of each point (Mx1). Only returned if
+        `return_labels` is True.
+
     '''
 
-    # Invert
-    V = -1 * V.copy().astype(int)
+    V = np.asarray(V)
+    n = len(V)
+
+    # Rank by descending intensity, ties by position
+    order = np.argsort(-V, kind='stable')
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+
+    # Lattice neighbor pairs
+    I, J = sparse_neighbors(idx, radius=[1] * idx.shape[1], half=True,
+                            backend=backend)
+
+    # Orient pairs from lower to higher rank
+    swap = rank[I] < rank[J]
+    lo = np.where(swap, J, I)
+    hi = np.where(swap, I, J)
+
+    # Steepest-ascent neighbor by rank
+    best = rank.copy()
+    np.minimum.at(best, lo, rank[hi])
+    parent = order[best]
+
+    # Pointer jumping to basin peaks
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            break
+        parent = grandparent
+    labels = parent
+
+    # Peaks, by descending intensity
+    peaks = order[labels[order] == order]
+
+    # Saddles between neighboring basins
+    a = labels[lo]
+    b = labels[hi]
+    cross = a != b
+    a, b = np.minimum(a[cross], b[cross]), np.maximum(a[cross], b[cross])
+    saddle = lo[cross]
+    del I, J, lo, hi, swap, cross
+
+    # Highest saddle per basin pair, by descending saddle intensity
+    s = np.lexsort((rank[saddle], b, a))
+    a, b, saddle = a[s], b[s], saddle[s]
+    first = np.concatenate(([True], (a[1:] != a[:-1]) | (b[1:] != b[:-1])))
+    a, b, saddle = a[first], b[first], saddle[first]
+    s = np.argsort(rank[saddle], kind='stable')
+    a, b, saddle = a[s], b[s], saddle[s]
+
+    # Persistence, bounded by minimum intensity
+    persistence = np.full(n, np.nan, dtype=np.float64)
+    persistence[peaks] = V[peaks] - (V.min() if n > 0 else 0)
+
+    # Union-find with path compression
+    root = {}
+
+    def find(x):
+        path = []
+        while x in root:
+            path.append(x)
+            x = root[x]
+        for p in path:
+            root[p] = x
+        return x
+
+    # Merge basins at saddles, elder rule
+    for x, y, z in zip(a.tolist(), b.tolist(), saddle.tolist()):
+        x = find(x)
+        y = find(y)
+        if x == y:
+            continue
+
+        # Younger peak dies
+        if rank[x] > rank[y]:
+            x, y = y, x
+        root[y] = x
+        persistence[y] = V[y] - V[z]
+
+    if return_labels is True:
+        return peaks, persistence[peaks], labels
+
+    return peaks, persistence[peaks]
+
+
+def _lattice_keys(idx, k):
+    '''
+    Linearizes integer lattice indices, padded by the integer radius in each
+    dimension. Dimensions are permuted so that the largest radius is last,
+    allowing it to be searched as one contiguous key range.
 
-    # Embed indices
-    V = embed_unique_indices(V)
+    Parameters
+    ----------
+    idx : :obj:`~numpy.array`
+        Edge indices for each dimension (MxN).
+    k : :obj:`~numpy.array`
+        Integer radius in each dimension.
 
-    # Connectivity matrix
-    cmat = KDTree(idx)
-    cmat = cmat.sparse_distance_matrix(
-        cmat, 1, p=np.inf, output_type='coo_matrix')
-    cmat.setdiag(1)
-    cmat = sparse.triu(cmat)
+    Returns
+    -------
+    keys : :obj:`~numpy.array`
+        Linear key of each point.
+    strides : :obj:`~numpy.array`
+        Key stride of each permuted dimension.
+    k : :obj:`~numpy.array`
+        Permuted integer radius.
 
-    # Pairwise minimums
-    I, J = cmat.nonzero()
-    d = np.maximum(V[I], V[J])
+    None is returned if indices are not integer or the padded lattice is
+    too large to linearize.
 
-    # Delete connectiity matrix
-    cmat_shape = cmat.shape
-    del cmat
+    '''
 
-    # Sparse distance matrix
-    sdm = sparse.coo_matrix((d, (I, J)), shape=cmat_shape)
+    # Not a lattice
+    L = np.rint(idx).astype(np.int64)
+    if not np.array_equal(L, idx):
+        return None
 
-    # Delete pairwise mins
-    del d, I, J
+    # Padded lattice shape
+    if len(L) > 0:
+        L -= L.min(axis=0) - k
+        shape = L.max(axis=0) + 1 + k
+    else:
+        shape = np.ones(len(k), dtype=np.int64)
 
-    # Persistence homology
-    ph = ripser(sdm, distance_matrix=True, maxdim=0)['dgms'][0]
+    # Too large to linearize
+    if np.sum(np.log2(shape.astype(np.float64))) >= 62:
+        return None
 
-    # Bound death values
-    ph[ph[:, 1] == np.inf, 1] = np.max(V)
+    # Largest radius last
+    perm = np.argsort(k, kind='stable')
+    L, k, shape = L[:, perm], k[perm], shape[perm]
 
-    # Construct tree to query against
-    tree = KDTree(V.reshape((-1, 1)))
+    # Linearize
+    strides = np.append(np.cumprod(shape[::-1])[:-1][::-1], 1)
 
-    # Get the indexes of the first nearest neighbor by birth
-    _, nn = tree.query(ph[:, 0].reshape((-1, 1)), k=1, workers=-1)
+    return L @ strides, strides, k
 
-    return nn, -(ph[:, 0] // 1 - ph[:, 1] // 1)
 
+def _stencil_offsets(k):
+    '''
+    Box stencil offsets for the given integer radius in each dimension.
 
-def sparse_mean_filter(idx, V, radius=[0, 1, 1]):
     '''
-    Sparse implementation of a mean filter.
+
+    if len(k) == 0:
+        return np.zeros((1, 0), dtype=np.int64)
+
+    return np.stack(np.meshgrid(*[np.arange(-x, x + 1) for x in k],
+                                indexing='ij'), axis=-1).reshape(-1, len(k))
+
+
+def sparse_neighbors(idx, radius=[0, 1, 1], pindex=None, half=False,
+                     backend='lattice'):
+    '''
+    Enumerates neighbor pairs of points on an integer lattice. Neighbors
+    lie within the per-dimension radius of each point, i.e. within a box
+    stencil.
 
     Parameters
     ----------
     idx : :obj:`~numpy.array`
         Edge indices for each dimension (MxN).
-    V : :obj:`~numpy.array`
-        Array of intensity data (Mx1).
     radius : float or list
-        Radius of the sparse filter in each dimension. Values less than
-        zero indicate no connectivity in that dimension.
+        Radius in each dimension. Values less than one indicate no
+        connectivity in that dimension; otherwise rounded down.
+    pindex : :obj:`~numpy.array`
+        Index of points to find neighbors of. All points if unspecified.
+    half : bool
+        Signal whether to return each unordered pair once, excluding self
+        pairs. Requires all points.
+    backend : str
+        "lattice" linearizes the indices and finds neighbors by binary search
+        of each stencil offset, the dimension of largest radius searched as
+        one contiguous key range. Memory scales with the number of pairs,
+        without tree overhead. "kdtree" queries a
+        :obj:`~scipy.spatial.KDTree`, also supporting non-integer indices.
+        The lattice backend falls back to the KD-tree if indices are not
+        integer or the padded lattice is too large to linearize.
 
     Returns
     -------
-    :obj:`~numpy.array`
-        Filtered intensities (Mx1).
+    I : :obj:`~numpy.array`
+        Index into `pindex` of each pair.
+    J : :obj:`~numpy.array`
+        Index into all points of each pair.
 
     '''
 
-    # Copy indices
-    idx = idx.copy().astype(V.dtype)
+    # Safely cast to list
+    radius = deimos.utils.safelist(radius)
 
-    # Scale
-    for i, r in enumerate(radius):
-        # Increase inter-index distance
-        if r < 1:
-            idx[:, i] *= 2
+    # Check inputs
+    if backend not in ['lattice', 'kdtree']:
+        raise ValueError('Backend must be "lattice" or "kdtree".')
 
-        # Do nothing
-        elif r == 1:
-            pass
+    if half & (pindex is not None):
+        raise ValueError('Half stencil requires all points.')
 
-        # Decrease inter-index distance
-        else:
-            idx[:, i] /= r
+    # Integer radius
+    k = np.array([int(np.floor(r)) if r >= 1 else 0 for r in radius], dtype=np.int64)
 
-    # Connectivity matrix
-    cmat = KDTree(idx)
-    cmat = cmat.sparse_distance_matrix(
-        cmat, 1, p=np.inf, output_type='coo_matrix')
-    cmat.setdiag(1)
+    # Evaluated points
+    n = len(idx)
+    if pindex is None:
+        pindex = np.arange(n)
+    else:
+        pindex = np.asarray(pindex)
 
-    # Pair indices
-    I, J = cmat.nonzero()
+    if backend == 'lattice':
+        lattice = _lattice_keys(idx, k)
 
-    # Delete cmat
-    cmat_shape = cmat.shape
-    del cmat
+        # Not integer or too large to linearize
+        if lattice is None:
+            backend = 'kdtree'
 
-    # Sum over columns
-    V_sum = sparse.bsr_matrix((V[J], (I, I)),
-                              shape=cmat_shape,
-                              dtype=V.dtype).diagonal(0)
+    if backend == 'kdtree':
+        # Scale to unit Chebyshev radius
+        scale = np.array([r if r >= 1 else 0.5 for r in radius])
+        scaled = idx.astype(np.float64) / scale
 
-    # Count over columns
-    V_count = sparse.bsr_matrix((np.ones_like(J), (I, I)),
-                                shape=cmat_shape,
-                                dtype=V.dtype).diagonal(0)
+        # Tolerate rounding at the stencil boundary
+        r = 1 + 1E-9
 
-    return V_sum / V_count
+        tree = KDTree(scaled)
+        if half:
+            pairs = tree.query_pairs(r, p=np.inf, output_type='ndarray')
+            return pairs[:, 0], pairs[:, 1]
 
+        pairs = KDTree(scaled[pindex]).sparse_distance_matrix(
+            tree, r, p=np.inf, output_type='ndarray')
+        return pairs['i'], pairs['j']
+
+    keys, strides, k = lattice
+
+    # Sort once
+    order = np.argsort(keys, kind='stable')
+    skeys = keys[order]
+
+    # Queries in key order
+    if half:
+        rows = order
+        qkeys = skeys
+    else:
+        qorder = np.argsort(keys[pindex], kind='stable')
+        rows = qorder
+        qkeys = keys[pindex][qorder]
+
+    # Stencil offsets over leading dimensions
+    offsets = _stencil_offsets(k[:-1])
+
+    # Positive half, by first nonzero offset, and zero offset
+    if half & (offsets.shape[1] > 0):
+        nz = offsets != 0
+        first = np.take_along_axis(offsets, np.argmax(nz, axis=1)[:, None], axis=1)
+        offsets = offsets[(first[:, 0] > 0) | ~nz.any(axis=1)]
+
+    I = []
+    J = []
+    for offset in offsets:
+        target = qkeys + offset @ strides[:-1]
+
+        # Key range along last dimension
+        lo = np.searchsorted(skeys, target - k[-1], side='left')
+        hi = np.searchsorted(skeys, target + k[-1], side='right')
+
+        # Zero offset in half stencil, later positions only
+        if half & (not offset.any()):
+            lo = np.arange(1, n + 1)
+
+        # Expand ranges
+        cnt = np.maximum(hi - lo, 0)
+        start = np.repeat(lo - np.cumsum(cnt) + cnt, cnt)
+        I.append(np.repeat(rows, cnt))
+        J.append(order[start + np.arange(cnt.sum())])
+
+    return np.concatenate(I), np.concatenate(J)
+
+
+def _sparse_box_max(idx, V, radius, prune=False):
+    '''
+    Maximum over the box stencil of each point on an integer lattice. Each
+    stencil offset over leading dimensions is a contiguous key range along
+    the last, evaluated by binary search and a sparse table of range maxima.
+    If pruned, points stop being evaluated once a neighbor exceeds them, so
+    only whether each point is a maximum is exact.
 
-def sparse_weighted_mean_filter(idx, V, w, radius=[1, 1, 1], pindex=None):
     '''
-    Sparse implementation of a weighted mean filter.
+
+    # Safely cast to list
+    radius = deimos.utils.safelist(radius)
+
+    # Integer radius
+    k = np.array([int(np.floor(r)) if r >= 1 else 0 for r in radius], dtype=np.int64)
+
+    V = np.asarray(V)
+    n = len(V)
+    out = np.full(n, -np.inf, dtype=np.result_type(V.dtype, np.float32))
+
+    lattice = _lattice_keys(idx, k)
+
+    # Not integer or too large to linearize
+    if lattice is None:
+        I, J = sparse_neighbors(idx, radius=radius, backend='kdtree')
+        np.maximum.at(out, I, V[J])
+        return out
+
+    keys, strides, k = lattice
+
+    # Sort once
+    order = np.argsort(keys, kind='stable')
+    skeys = keys[order]
+    sV = V[order]
+
+    # Sparse table levels, built as needed
+    table = [sV]
+
+    def range_max(lo, hi):
+        res = np.full(len(lo), -np.inf, dtype=out.dtype)
+        valid = hi > lo
+        lo, hi = lo[valid], hi[valid]
+
+        # Largest power of two within each range
+        level = np.floor(np.log2(hi - lo)).astype(np.int64)
+        while len(table) <= level.max(initial=0):
+            step = 1 << (len(table) - 1)
+            table.append(np.maximum(table[-1][:-step], table[-1][step:]))
+
+        vals = np.empty(len(lo), dtype=out.dtype)
+        for j in np.unique(level):
+            m = level == j
+            vals[m] = np.maximum(table[j][lo[m]], table[j][hi[m] - (1 << j)])
+
+        res[valid] = vals
+        return res
+
+    # Nearest offsets first, so pruning is early
+    offsets = _stencil_offsets(k[:-1])
+    offsets = offsets[np.argsort(np.abs(offsets).sum(axis=1), kind='stable')]
+
+    smax = np.full(n, -np.inf, dtype=out.dtype)
+    active = np.arange(n)
+    for offset in offsets:
+        target = skeys[active] + offset @ strides[:-1]
+
+        # Key range along last dimension
+        lo = np.searchsorted(skeys, target - k[-1], side='left')
+        hi = np.searchsorted(skeys, target + k[-1], side='right')
+
+        smax[active] = np.maximum(smax[active], range_max(lo, hi))
+
+        # Drop points exceeded by a neighbor
+        if prune:
+            active = active[smax[active] <= sV[active]]
+            if len(active) == 0:
+                break
+
+    out[order] = smax
+    return out
+
+
+def sparse_maximum_filter(idx, V, radius=[0, 1, 1]):
+    '''
+    Sparse implementation of a maximum filter over a box stencil. Cost
+    scales with the number of points rather than the number of grid cells.
 
     Parameters
     ----------
     idx : :obj:`~numpy.array`
         Edge indices for each dimension (MxN).
     V : :obj:`~numpy.array`
-        Array of edge data (MxN).
-    w : :obj:`~numpy.array`
         Array of intensity data (Mx1).
     radius : float or list
-        Radius of the sparse filter in each dimension. Values less than
-        one indicate no connectivity in that dimension.
-    pindex : :obj:`~numpy.array`
-        Index of points to evaluate the weighted mean.
+        Radius of the sparse filter in each dimension. Values less than one
+        indicate no connectivity in that dimension.
 
     Returns
     -------
     :obj:`~numpy.array`
-        Filtered edges (MxN).
+        Filtered intensities (Mx1).
+
+    '''
+
+    return _sparse_box_max(idx, V, radius=radius)
+
+
+def sparse_local_maxima(idx, V, radius=[0, 1, 1]):
+    '''
+    Sparse non-maximum suppression over a box stencil. Neighbors are
+    compared nearest first, and points are dropped once exceeded, so most
+    points are resolved after a few stencil offsets.
+
+    Parameters
+    ----------
+    idx : :obj:`~numpy.array`
+        Edge indices for each dimension (MxN).
+    V : :obj:`~numpy.array`
+        Array of intensity data (Mx1).
+    radius : float or list
+        Radius of the sparse filter in each dimension. Values less than one
+        indicate no connectivity in that dimension.
+
+    Returns
+    -------
+    :obj:`~numpy.array`
+        Mask of points not exceeded by any neighbor (Mx1).
 
     '''
 
-    # Copy indices
-    idx = idx.copy().astype(w.dtype)
+    return V >= _sparse_box_max(idx, V, radius=radius, prune=True)
 
-    # Scale
-    for i, r in enumerate(radius):
-        # Increase inter-index distance
-        if r < 1:
-            idx[:, i] *= 2
 
-        # Do nothing
-        elif r == 1:
-            pass
+class SparseLatticeOperator:
+    '''
+    Sparse neighbor graph over lattice indices. The graph is built once and
+    applied as sparse matrix products, such that repeated filtering of
+    the same points does not rebuild the neighbor search.
 
-        # Decrease inter-index distance
+    Attributes
+    ----------
+    adjacency : :obj:`~scipy.sparse.csr_matrix`
+        Binary adjacency, including self, of evaluated points (rows) to all
+        points (columns) (PxM).
+    operator : :obj:`~scipy.sparse.csr_matrix`
+        Row-normalized adjacency, i.e. the mean filter (PxM).
+    pindex : :obj:`~numpy.array`
+        Index of evaluated points (Px1).
+    radius : list
+        Radius of the sparse filter in each dimension.
+    backend : str
+        Neighbor search backend.
+
+    '''
+
+    def __init__(self, idx, radius=[0, 1, 1], pindex=None, backend='lattice'):
+        '''
+        Initialize :obj:`~deimos.filters.SparseLatticeOperator` instance.
+
+        Parameters
+        ----------
+        idx : :obj:`~numpy.array`
+            Edge indices for each dimension (MxN).
+        radius : float or list
+            Radius of the sparse filter in each dimension. Values less than
+            one indicate no connectivity in that dimension.
+        pindex : :obj:`~numpy.array`
+            Index of points to evaluate the filter at. All points if
+            unspecified.
+        backend : str
+            Neighbor search backend. See
+            :func:`~deimos.filters.sparse_neighbors`.
+
+        '''
+
+        # Safely cast to list
+        radius = deimos.utils.safelist(radius)
+
+        self.radius = radius
+        self.pindex = pindex
+        self.backend = backend
+
+        self._build(idx)
+
+    def _build(self, idx):
+        '''
+        Builds the adjacency and normalized operator.
+
+        '''
+
+        # Evaluated points
+        n = len(idx)
+        m = n if self.pindex is None else len(self.pindex)
+
+        # Neighbor pairs, including self
+        I, J = sparse_neighbors(idx, radius=self.radius, pindex=self.pindex,
+                                backend=self.backend)
+
+        # Binary adjacency
+        adj = sparse.csr_matrix((np.ones(len(I), dtype=np.float32), (I, J)),
+                                shape=(m, n))
+        del I, J
+
+        # Row-normalized operator sharing structure
+        count = np.diff(adj.indptr)
+        norm = sparse.csr_matrix((np.repeat(1 / count, count),
+                                  adj.indices, adj.indptr),
+                                 shape=adj.shape, copy=False)
+
+        self.adjacency = adj
+        self.operator = norm
+
+    @property
+    def shape(self):
+        '''
+        Shape of the operator (PxM).
+
+        '''
+
+        return self.operator.shape
+
+    def mean(self, V, iterations=1, tol=0.0, atol=None, return_active=False):
+        '''
+        Applies the mean filter, optionally iterated.
+
+        Parameters
+        ----------
+        V : :obj:`~numpy.array`
+            Array of intensity data (Mx1).
+        iterations : int
+            Maximum number of iterations to perform. Requires all points
+            to be evaluated if greater than one.
+        tol : float
+            Stopping criteria based on residual with previous iteration.
+            Selecting zero will perform all specified iterations.
+        atol : float or None
+            Per-point tolerance. If specified, each iteration after the first
+            only recomputes points with a neighbor that changed by more than
+            `atol` in the previous iteration. Iteration stops once no points
+            remain active.
+        return_active : bool
+            Signal whether to return the number of points computed in each
+            iteration.
+
+        Returns
+        -------
+        :obj:`~numpy.array`
+            Filtered intensities (Px1).
+        :obj:`~numpy.array`
+            Number of points computed per iteration, if `return_active` is
+            True.
+
+        '''
+
+        if (iterations > 1) & (self.shape[0] != self.shape[1]):
+            raise ValueError('Iterations require all points to be evaluated.')
+
+        # Output precision
+        dtype = np.result_type(V.dtype, np.float32)
+
+        # Residual exit criteria
+        resid = np.inf
+
+        # Points computed per iteration
+        counts = []
+        active = None
+
+        for i in range(iterations):
+            # Previous iteration
+            resid_prev = resid
+
+            # Full mat-vec unless few points are active
+            if (active is not None) and (len(active) > len(V) // 8):
+                active = None
+
+            if active is None:
+                # Sparse mat-vec
+                V_prev = V
+                V = (self.operator @ V).astype(dtype, copy=False)
+                delta = V - V_prev
+                counts.append(len(V))
+            else:
+                # Sparse mat-vec over active rows, updated in place
+                V_active = (self.operator[active] @ V).astype(dtype, copy=False)
+                delta = V_active - V[active]
+                V[active] = V_active
+                counts.append(len(active))
+
+            # Calculate residual with previous iteration
+            resid = np.sqrt(np.sum(np.square(delta)) / len(V))
+
+            # Evaluate convergence
+            if i > 0:
+                # Percent change in residual
+                test = np.abs(resid - resid_prev) / resid_prev
+
+                # Exit criteria
+                if test <= tol:
+                    break
+
+            # Neighbors of points changed by more than tolerance
+            if (atol is not None) & (i < iterations - 1):
+                changed = np.abs(delta) > atol
+                changed = np.flatnonzero(changed) if active is None else active[changed]
+
+                # Symmetric adjacency, neighbors of changed rows
+                mask = np.zeros(len(V), dtype=bool)
+                mask[self.adjacency[changed].indices] = True
+                active = np.flatnonzero(mask)
+
+                # Exit criteria
+                if len(active) == 0:
+                    break
+
+        if return_active:
+            return V, np.array(counts)
+
+        return V
+
+    def weighted_mean(self, V, w):
+        '''
+        Applies the weighted mean filter to all value columns in a single
+        sparse product. The neighborhood is weighted and row-normalized as
+        one CSR matrix sharing the adjacency index arrays, such that memory
+        beyond the adjacency is one weight per neighbor pair plus the PxN
+        output. No MxN weighted copy of the values is formed.
+
+        Parameters
+        ----------
+        V : :obj:`~numpy.array`
+            Array of edge data (MxN).
+        w : :obj:`~numpy.array`
+            Array of intensity data (Mx1).
+
+        Returns
+        -------
+        :obj:`~numpy.array`
+            Filtered edges (PxN).
+
+        '''
+
+        indptr = self.adjacency.indptr
+        indices = self.adjacency.indices
+
+        # Neighbor weights
+        data = w[indices].astype(np.result_type(w.dtype, np.float32))
+
+        # Normalize by row sums, each row holding at least itself
+        if len(data) > 0:
+            w_sum = np.add.reduceat(data, indptr[:-1])
+            data /= np.repeat(w_sum, np.diff(indptr))
+
+        # Weighted, normalized neighborhood
+        W = sparse.csr_matrix((data, indices, indptr), shape=self.shape,
+                              copy=False)
+
+        # All columns at once
+        V_out = W @ V.reshape((len(w), -1))
+
+        # Flatten if 1D
+        if V.ndim == 1:
+            return V_out.flatten()
+
+        return V_out
+
+    def median(self, V, workers=1):
+        '''
+        Applies the median filter.
+
+        Parameters
+        ----------
+        V : :obj:`~numpy.array`
+            Array of intensity data (Mx1).
+        workers : int
+            Number of threads to process row chunks.
+
+        Returns
+        -------
+        :obj:`~numpy.array`
+            Filtered intensities (Px1).
+
+        '''
+
+        return self.quantile(V, q=0.5, workers=workers)
+
+    def quantile(self, V, q=0.5, workers=1):
+        '''
+        Applies a quantile filter, interpolating linearly between order
+        statistics as :func:`~numpy.quantile`.
+
+        Parameters
+        ----------
+        V : :obj:`~numpy.array`
+            Array of intensity data (Mx1).
+        q : float
+            Quantile, 0-1.
+        workers : int
+            Number of threads to process row chunks.
+
+        Returns
+        -------
+        :obj:`~numpy.array`
+            Filtered intensities (Px1).
+
+        '''
+
+        if (q < 0) | (q > 1):
+            raise ValueError('Quantile must be between 0 and 1.')
+
+        return self._order_statistic(V, partial(_segmented_quantile, q=q),
+                                     workers=workers)
+
+    def trimmed_mean(self, V, proportion=0.1, workers=1):
+        '''
+        Applies a trimmed mean filter, cutting the given proportion of
+        neighbors from each end as :func:`~scipy.stats.trim_mean`.
+
+        Parameters
+        ----------
+        V : :obj:`~numpy.array`
+            Array of intensity data (Mx1).
+        proportion : float
+            Proportion of neighbors cut from each end, 0-0.5.
+        workers : int
+            Number of threads to process row chunks.
+
+        Returns
+        -------
+        :obj:`~numpy.array`
+            Filtered intensities (Px1).
+
+        '''
+
+        if (proportion < 0) | (proportion >= 0.5):
+            raise ValueError('Proportion must be at least 0 and less than 0.5.')
+
+        return self._order_statistic(V, partial(_segmented_trimmed_mean,
+                                                proportion=proportion),
+                                     workers=workers)
+
+    def _order_statistic(self, V, func, workers=1):
+        '''
+        Evaluates a segmented order statistic over neighbor values, in row
+        chunks of similar size across a thread pool.
+
+        '''
+
+        indptr = self.adjacency.indptr
+        indices = self.adjacency.indices
+        m = self.shape[0]
+
+        # Output container
+        out = np.empty(m, dtype=np.result_type(V.dtype, np.float32))
+
+        def run(bounds):
+            a, b = bounds
+            out[a:b] = func(V[indices[indptr[a]:indptr[b]]],
+                            indptr[a:b + 1] - indptr[a])
+
+        # Row chunks of similar number of neighbors
+        nchunks = max(1, 4 * workers if workers > 1 else 1)
+        bounds = np.searchsorted(indptr, np.linspace(0, indptr[-1], nchunks + 1))
+        bounds = np.unique(np.clip(bounds, 0, m))
+        bounds[0], bounds[-1] = 0, m
+        chunks = list(zip(bounds[:-1], bounds[1:]))
+
+        if workers > 1:
+            with ThreadPool(processes=workers) as p:
+                p.map(run, chunks)
         else:
-            idx[:, i] /= r
+            for chunk in chunks:
+                run(chunk)
 
-    # If not supplied, index is all points
-    if pindex is None:
-        pindex = np.arange(len(idx))
+        return out
+
+
+def _segment_sort(values, indptr):
+    '''
+    Sorts values within contiguous segments.
+
+    Parameters
+    ----------
+    values : :obj:`~numpy.array`
+        Values of all segments, concatenated.
+    indptr : :obj:`~numpy.array`
+        Segment boundaries, as CSR row pointers.
+
+    Returns
+    -------
+    values : :obj:`~numpy.array`
+        Values sorted within each segment.
+    count : :obj:`~numpy.array`
+        Number of values per segment.
 
-    # Connectivity matrix
-    tree_all = KDTree(idx)
-    tree_subset = KDTree(idx[pindex])
-    cmat = tree_subset.sparse_distance_matrix(
-        tree_all, 1, p=np.inf, output_type='coo_matrix')
-    del tree_all, tree_subset
+    '''
+
+    count = np.diff(indptr)
+    segment = np.repeat(np.arange(len(count)), count)
 
-    # Pair indices
-    I, J = cmat.nonzero()
+    return values[np.lexsort((values, segment))], count
 
-    # Self
-    I = np.concatenate((I, np.arange(len(pindex))))
-    J = np.concatenate((J, pindex))
 
-    # Delete connectivity matrix
-    cmat_shape = cmat.shape
-    del cmat
+def _segmented_quantile(values, indptr, q=0.5):
+    '''
+    Quantile per segment, by lexsort and offset arithmetic.
+
+    '''
 
-    # Sum weights over columns
-    # Only need to do this once
-    V_count = sparse.bsr_matrix((w[J], (I, I)),
-                                shape=cmat_shape,
-                                dtype=w.dtype).diagonal(0)
+    values, count = _segment_sort(values, indptr)
 
-    # Reshape V if 1D
-    if V.ndim == 1:
-        V = V.reshape((-1, 1))
+    # Fractional position within each segment
+    h = (count - 1) * q
+    lo = np.floor(h).astype(np.int64)
+    frac = h - lo
+    hi = np.minimum(lo + 1, count - 1)
 
-    # Output container
-    V_out = np.empty_like(V[pindex, :], dtype=w.dtype)
+    a = values[indptr[:-1] + lo]
+    b = values[indptr[:-1] + hi]
 
-    # Enumerate value columns
-    for i in range(V_out.shape[1]):
-        # Sum weighted values over columns
-        V_sum = sparse.bsr_matrix((w[J] * V[J, i], (I, I)),
-                                  shape=cmat_shape,
-                                  dtype=w.dtype).diagonal(0)
+    return a + frac * (b.astype(np.float64) - a)
 
-        V_out[:, i] = V_sum / V_count
 
-    # Flatten if 1D
-    if V_out.shape[1] == 1:
-        return V_out.flatten()
+def _segmented_trimmed_mean(values, indptr, proportion=0.1):
+    '''
+    Trimmed mean per segment, by lexsort and cumulative sums.
+
+    '''
+
+    values, count = _segment_sort(values, indptr)
+
+    # Cut from each end
+    cut = np.floor(proportion * count).astype(np.int64)
+
+    csum = np.concatenate(([0], np.cumsum(values, dtype=np.float64)))
+    start = indptr[:-1] + cut
+    stop = indptr[1:] - cut
+
+    return (csum[stop] - csum[start]) / (stop - start)
+
+
+def sparse_mean_filter(idx, V, radius=[0, 1, 1]):
+    '''
+    Sparse implementation of a mean filter.
 
-    return V_out
+    Parameters
+    ----------
+    idx : :obj:`~numpy.array`
+        Edge indices for each dimension (MxN).
+    V : :obj:`~numpy.array`
+        Array of intensity data (Mx1).
+    radius : float or list
+        Radius of the sparse filter in each dimension. Values less than
+        zero indicate no connectivity in that dimension.
 
+    Returns
+    -------
+    :obj:`~numpy.array`
+        Filtered intensities (Mx1).
 
-def sparse_median_filter(idx, V, radius=[0, 1, 1]):
+    '''
+
+    return SparseLatticeOperator(idx, radius=radius).mean(V)
+
+
+def sparse_weighted_mean_filter(idx, V, w, radius=[1, 1, 1], pindex=None):
+    '''
+    Sparse implementation of a weighted mean filter. All columns of `V` are
+    filtered in one sparse product; beyond the inputs, memory scales with the
+    number of neighbor pairs of the evaluated points plus the output.
+
+    Parameters
+    ----------
+    idx : :obj:`~numpy.array`
+        Edge indices for each dimension (MxN).
+    V : :obj:`~numpy.array`
+        Array of edge data (MxN).
+    w : :obj:`~numpy.array`
+        Array of intensity data (Mx1).
+    radius : float or list
+        Radius of the sparse filter in each dimension. Values less than
+        one indicate no connectivity in that dimension.
+    pindex : :obj:`~numpy.array`
+        Index of points to evaluate the weighted mean.
+
+    Returns
+    -------
+    :obj:`~numpy.array`
+        Filtered edges (MxN).
+
+    '''
+
+    return SparseLatticeOperator(idx, radius=radius, pindex=pindex).weighted_mean(V, w)
+
+
+def sparse_median_filter(idx, V, radius=[0, 1, 1], workers=1):
     '''
     Sparse implementation of a median filter.
 
@@ -609,6 +1474,8 @@ def sparse_median_filter(idx, V, radius=[0, 1, 1]):
     radius : float or list
         Radius of the sparse filter in each dimension. Values less than
         zero indicate no connectivity in that dimension.
+    workers : int
+        Number of threads to process row chunks.
 
     Returns
     -------
@@ -617,54 +1484,68 @@ def sparse_median_filter(idx, V, radius=[0, 1, 1]):
 
     '''
 
-    # Copy indices
-    idx = idx.copy().astype(V.dtype)
+    return SparseLatticeOperator(idx, radius=radius).median(V, workers=workers)
 
-    # Scale
-    for i, r in enumerate(radius):
-        # Increase inter-index distance
-        if r < 1:
-            idx[:, i] *= 2
 
-        # Do nothing
-        elif r == 1:
-            pass
+def sparse_quantile_filter(idx, V, q=0.5, radius=[0, 1, 1], workers=1):
+    '''
+    Sparse implementation of a quantile filter.
 
-        # Decrease inter-index distance
-        else:
-            idx[:, i] /= r
+    Parameters
+    ----------
+    idx : :obj:`~numpy.array`
+        Edge indices for each dimension (MxN).
+    V : :obj:`~numpy.array`
+        Array of intensity data (Mx1).
+    q : float
+        Quantile, 0-1.
+    radius : float or list
+        Radius of the sparse filter in each dimension. Values less than
+        zero indicate no connectivity in that dimension.
+    workers : int
+        Number of threads to process row chunks.
 
-    # Connectivity matrix
-    cmat = KDTree(idx)
-    cmat = cmat.sparse_distance_matrix(
-        cmat, 1, p=np.inf, output_type='coo_matrix')
-    cmat.setdiag(1)
+    Returns
+    -------
+    :obj:`~numpy.array`
+        Filtered intensities (Mx1).
 
-    # Pair indices
-    I, J = cmat.nonzero()
+    '''
 
-    # Delete cmat
-    cmat_shape = cmat.shape
-    del cmat
+    return SparseLatticeOperator(idx, radius=radius).quantile(V, q=q, workers=workers)
 
-    X = sparse.csc_matrix((V[I], (I, J)),
-                          shape=cmat_shape,
-                          dtype=V.dtype)
 
-    indptr = X.indptr
-    n_samples, n_features = X.shape
-    median = np.empty(n_features, dtype=V.dtype)
+def sparse_trimmed_mean_filter(idx, V, proportion=0.1, radius=[0, 1, 1], workers=1):
+    '''
+    Sparse implementation of a trimmed mean filter.
 
-    for f_ind, (start, end) in enumerate(zip(indptr[:-1], indptr[1:])):
-        # Prevent modifying X in place
-        data = np.copy(X.data[start:end])
-        median[f_ind] = _get_median(data, 0)
+    Parameters
+    ----------
+    idx : :obj:`~numpy.array`
+        Edge indices for each dimension (MxN).
+    V : :obj:`~numpy.array`
+        Array of intensity data (Mx1).
+    proportion : float
+        Proportion of neighbors cut from each end, 0-0.5.
+    radius : float or list
+        Radius of the sparse filter in each dimension. Values less than
+        zero indicate no connectivity in that dimension.
+    workers : int
+        Number of threads to process row chunks.
+
+    Returns
+    -------
+    :obj:`~numpy.array`
+        Filtered intensities (Mx1).
+
+    '''
 
-    return median
+    return SparseLatticeOperator(idx, radius=radius).trimmed_mean(
+        V, proportion=proportion, workers=workers)
 
 
 def smooth(features, index=None, factors=None, dims=['mz', 'drift_time', 'retention_time'],
-           radius=[0, 1, 1], iterations=1, tol=0.0):
+           radius=[0, 1, 1], iterations=1, tol=0.0, atol=None, return_active=False):
     '''
     Smooth data by sparse mean filtration.
 
@@ -686,11 +1567,19 @@ def smooth(features, index=None, factors=None, dims=['mz', 'drift_time', 'retent
     tol : float
         Stopping criteria based on residual with previous iteration.
         Selecting zero will perform all specified iterations.
+    atol : float or None
+        Per-point tolerance. If specified, each iteration after the first only
+        recomputes points with a neighbor that changed by more than `atol`.
+    return_active : bool
+        Signal whether to return the number of points computed in each
+        iteration.
 
     Returns
     -------
     :obj:`~pandas.DataFrame`
         Smoothed feature coordinates and intensities.
+    :obj:`~numpy.array`
+        Number of points computed per iteration, if `return_active` is True.
 
     '''
 
@@ -723,31 +1612,15 @@ def smooth(features, index=None, factors=None, dims=['mz', 'drift_time', 'retent
     # Values
     V = features['intensity'].values
 
-    # Residual exit criteria
-    resid = np.inf
-
-    # Sparse mean filtration iterations
-    for i in range(iterations):
-        # Previous iteration
-        V_prev = V.copy()
-        resid_prev = resid
-
-        # Compute smooth
-        V = deimos.filters.sparse_mean_filter(index, V, radius=radius)
-
-        # Calculate residual with previous iteration
-        resid = np.sqrt(np.mean(np.square(V - V_prev)))
-
-        # Evaluate convergence
-        if i > 0:
-            # Percent change in residual
-            test = np.abs(resid - resid_prev) / resid_prev
-
-            # Exit criteria
-            if test <= tol:
-                break
+    # Build neighbor graph once, iterate sparse mean filtration
+    V, counts = SparseLatticeOperator(index, radius=radius).mean(V, iterations=iterations,
+                                                                  tol=tol, atol=atol,
+                                                                  return_active=True)
 
     # Overwrite values
     features['intensity'] = V
 
+    if return_active:
+        return features, counts
+
     return features
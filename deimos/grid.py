@@ -14,7 +14,7 @@ def data2grid(features, dims=['mz', 'drift_time', 'retention_time']):
         Input feature coordinates and intensities.
     dims : str or list
         Dimension(s) to create the dense grid (omitted dimensions will
-        be collapsed and summed accross).
+        be collapsed and summed across).
 
     Returns
     -------
@@ -28,19 +28,25 @@ def data2grid(features, dims=['mz', 'drift_time', 'retention_time']):
     # Safely cast to list
     dims = deimos.utils.safelist(dims)
 
-    # Collapse data if necessary
-    if len(dims) < len(deimos.utils.detect_dims(features)):
-        features = deimos.collapse(features, keep=dims, how=np.sum)
+    # Omitted dimensions are summed across
+    collapse = len(dims) < len(deimos.utils.detect_dims(features))
 
     # Unique indices
     idx = [np.unique(features.loc[:, d].values,
                      return_inverse=True) for d in dims]
     idx_i = [x[-1] for x in idx]
     idx = [x[0] for x in idx]
+    shape = [len(x) for x in idx]
 
     # Populate grid
-    grid = np.zeros([len(x) for x in idx], dtype=float)
-    grid[tuple(idx_i)] = features.loc[:, 'intensity'].values
+    if collapse:
+        # Skip missing intensities, as collapse
+        grid = np.bincount(np.ravel_multi_index(idx_i, shape),
+                           weights=np.nan_to_num(features.loc[:, 'intensity'].values),
+                           minlength=int(np.prod(shape))).reshape(shape)
+    else:
+        grid = np.zeros(shape, dtype=float)
+        grid[tuple(idx_i)] = features.loc[:, 'intensity'].values
 
     return idx, grid
 
@@ -1,29 +1,44 @@
+import itertools
+import json
+import multiprocessing as mp
 import os
+import re
+import shutil
 import warnings
+import xml.etree.ElementTree as ElementTree
 from collections import OrderedDict, defaultdict
+from functools import partial
+from io import BytesIO
 
 import dask.dataframe as dd
 import h5py
 import numpy as np
 import pandas as pd
 import pymzml
+import tables
 
 import deimos
 
 
-def load(path, key='ms1', columns=None, chunksize=1E7, meta=None, accession={}, dtype=np.float32):
+def load(path, key='ms1', columns=None, where=None, chunksize=1E7, meta=None,
+         accession={}, dtype=None, workers=1):
     '''
-    Loads data from HDF5 or mzML file.
+    Loads data from HDF5, DEIMoS, mzML, MGF, or MSP file.
 
     Parameters
     ----------
     path : str or list of str
         Path to input file (or files if HDF5).
     key : str
-        Access this level (group) of the HDF5 container. E.g., "ms1" or "ms2"
-        for MS levels 1 or 2, respectively. HDF5 format only.
+        Access this level (group) of the HDF5 or DEIMoS container. E.g., "ms1"
+        or "ms2" for MS levels 1 or 2, respectively. HDF5 and DEIMoS formats
+        only.
     columns : list
-        A list of columns names to return. HDF5 format only.
+        A list of columns names to return. HDF5 and DEIMoS formats only.
+    where : dict
+        Inclusive (low, high) bounds per column, e.g.
+        ``{'mz': (lo, hi), 'retention_time': (a, b)}``, used to select rows
+        while loading. HDF5 and DEIMoS formats only.
     chunksize : int
         Dask partition chunksize. HDF5 format only. Unused when loading single
         file.
@@ -34,8 +49,12 @@ def load(path, key='ms1', columns=None, chunksize=1E7, meta=None, accession={},
         Key-value pairs signaling which features to parse for in the mzML file.
         mzML format only. See :func:`~deimos.io.get_accessions` to obtain
         available values.
-    dtype : data type
-        Data type to encode values. mzML format only.
+    dtype : data type or dict
+        Data type for all columns, or per-column data types. Defaults to
+        uint32 for scan/frame indices, float64 for m/z, and float32
+        otherwise. mzML, MGF, and MSP formats only.
+    workers : int
+        Number of parallel decoding processes. mzML format only.
 
     Returns
     -------
@@ -43,6 +62,9 @@ def load(path, key='ms1', columns=None, chunksize=1E7, meta=None, accession={},
         Feature coordinates and intensities for the specified level.
         Pandas is used when loading a single file, Dask for multiple files.
         Loading an mzML file returns a dictionary with keys per MS level.
+        Loading an MGF or MSP file returns a dictionary of per-spectrum header
+        entries ("spectra") and a flat peak table ("peaks"); see
+        :func:`~deimos.io.load_mgf`.
 
     '''
 
@@ -50,7 +72,7 @@ def load(path, key='ms1', columns=None, chunksize=1E7, meta=None, accession={},
     paths = deimos.utils.safelist(path)
 
     # Ensure extensions match
-    exts = [os.path.splitext(x)[-1].lower() for x in paths]
+    exts = [os.path.splitext(os.path.normpath(x))[-1].lower() for x in paths]
     if not all(x == exts[0] for x in exts):
         raise ValueError('All inputs must have same filetype extension.')
 
@@ -64,6 +86,7 @@ def load(path, key='ms1', columns=None, chunksize=1E7, meta=None, accession={},
             return deimos.io.load_hdf_multi(paths,
                                             key=key,
                                             columns=columns,
+                                            where=where,
                                             chunksize=chunksize,
                                             meta=meta)
 
@@ -74,14 +97,29 @@ def load(path, key='ms1', columns=None, chunksize=1E7, meta=None, accession={},
     # Single loader
     # Hdf5
     if ext in ['.h5', '.hdf']:
-        return deimos.io.load_hdf_single(path, key=key, columns=columns)
+        return deimos.io.load_hdf_single(paths[0], key=key, columns=columns,
+                                         where=where)
+
+    # Deimos
+    if ext in ['.deimos']:
+        return deimos.io.load_deimos(paths[0], key=key, columns=columns,
+                                     where=where)
 
     # Mzml
     if ext in ['.gz', '.mzml']:
-        return deimos.io.load_mzml(path, accession=accession, dtype=dtype)
+        return deimos.io.load_mzml(path, accession=accession, dtype=dtype,
+                                   workers=workers)
+
+    # MGF
+    if ext in ['.mgf']:
+        return deimos.io.load_mgf(paths[0], dtype=dtype)
+
+    # MSP
+    if ext in ['.msp']:
+        return deimos.io.load_msp(paths[0], dtype=dtype)
 
     # Other
-    raise ValueError('Only HDF5 and mzML currently supported.')
+    raise ValueError('Only HDF5, DEIMoS, mzML, MGF, and MSP currently supported.')
 
 
 def build_factors(data, dims='detect'):
@@ -110,8 +148,8 @@ def build_factors(data, dims='detect'):
     # Safely cast to list
     dims = deimos.utils.safelist(dims)
 
-    # Construct per-dimension factor arrays
-    return {dim: pd.factorize(data[dim], sort=True)[1].astype(np.float32) for dim in dims}
+    # Construct per-dimension factor arrays, in the dtype of each column
+    return {dim: np.asarray(pd.factorize(data[dim], sort=True)[1]) for dim in dims}
 
 
 def build_index(data, factors):
@@ -132,12 +170,15 @@ def build_index(data, factors):
 
     '''
 
-    return {dim: np.searchsorted(factors[dim], data[dim]).astype(np.float32) for dim in factors}
+    # Search in the dtype of the factors, such that values match exactly
+    return {dim: np.searchsorted(factors[dim],
+                                 data[dim].values.astype(factors[dim].dtype, copy=False)).astype(np.float32)
+            for dim in factors}
 
 
 def save(path, data, key='ms1', **kwargs):
     '''
-    Saves :obj:`~pandas.DataFrame` to HDF5 or MGF container.
+    Saves :obj:`~pandas.DataFrame` to HDF5, DEIMoS, or MGF container.
 
     Parameters
     ----------
@@ -147,21 +188,26 @@ def save(path, data, key='ms1', **kwargs):
         Feature coordinates and intensities to be saved. Precursor m/z and
         intensities should be paired to MS2 spectra for MGF format.
     key : str
-        Save to this level (group) of the HDF5 container. E.g., "ms1" or "ms2"
-        for MS levels 1 or 2, respectively. HDF5 format only.
+        Save to this level (group) of the HDF5 or DEIMoS container. E.g.,
+        "ms1" or "ms2" for MS levels 1 or 2, respectively. HDF5 and DEIMoS
+        formats only.
     kwargs
-        Keyword arguments exposed by :meth:`~pandas.DataFrame.to_hdf`
-        or :func:`~deimos.io.save_mgf`.
+        Keyword arguments exposed by :func:`~deimos.io.save_hdf`,
+        :meth:`~pandas.DataFrame.to_hdf`, or :func:`~deimos.io.save_mgf`.
 
     '''
 
     # Path extension
-    ext = os.path.splitext(path)[-1].lower()
+    ext = os.path.splitext(os.path.normpath(path))[-1].lower()
 
     # Hdf5
     if ext in ['.h5', '.hdf']:
         return deimos.io.save_hdf(path, data, key=key, **kwargs)
 
+    # Deimos
+    if ext in ['.deimos']:
+        return deimos.io.save_deimos(path, data, key=key)
+
     # MGF
     if ext in ['.mgf']:
         return deimos.io.save_mgf(path, data, **kwargs)
@@ -179,7 +225,7 @@ def save(path, data, key='ms1', **kwargs):
         return data.to_csv(path, sep='\t', index=False, **kwargs)
 
     # Other
-    raise ValueError('Only HDF5, MGF, MSP, TSV, and CSV formats currently supported.')
+    raise ValueError('Only HDF5, DEIMoS, MGF, MSP, TSV, and CSV formats currently supported.')
 
 
 def get_accessions(path):
@@ -199,21 +245,398 @@ def get_accessions(path):
     '''
 
     # Open file
-    data = pymzml.run.Reader(path)
-
-    # Iterate single spec instance
-    for spec in data:
-        spec._read_accessions()
-        break
+    with pymzml.run.Reader(path) as data:
+        # Iterate single spec instance
+        for spec in data:
+            spec._read_accessions()
+            break
 
     # Return accessions
     return spec.accessions
 
 
-def load_mzml(path, accession={}, dtype=np.float32):
+def _column_dtype(column, dtype=None, index=False):
+    '''
+    Resolves the data type of a parsed column.
+
+    Parameters
+    ----------
+    column : str
+        Column name.
+    dtype : data type or dict
+        Data type for all columns, or per-column data types. Unspecified
+        columns follow the default policy: uint32 for scan/frame indices,
+        float64 for m/z, and float32 otherwise.
+    index : bool
+        Signal whether the column holds scan/frame indices.
+
+    Returns
+    -------
+    data type
+        Data type of the column.
+
+    '''
+
+    # Per-column
+    if isinstance(dtype, dict):
+        if column in dtype:
+            return dtype[column]
+
+    # All columns
+    elif dtype is not None:
+        return dtype
+
+    # Default policy
+    if index is True:
+        return np.uint32
+
+    if column in ['mz', 'precursor_mz']:
+        return np.float64
+
+    return np.float32
+
+
+def _parse_spectrum(spec, accession, dtype=None):
+    '''
+    Decodes a single spectrum into per-column values.
+
+    Parameters
+    ----------
+    spec : :obj:`~pymzml.spec.Spectrum`
+        Spectrum to decode.
+    accession : :obj:`~collections.OrderedDict`
+        Key-value pairs signaling which features to parse for.
+    dtype : data type or dict
+        Data type for all columns, or per-column data types. See
+        :func:`~deimos.io._column_dtype`.
+
+    Returns
+    -------
+    level : str
+        MS level of the spectrum, e.g. "ms1".
+    cols : list
+        Column names.
+    dtypes : list
+        Data type per column.
+    record : tuple
+        Per-spectrum scalar values (all columns but m/z and intensity), m/z
+        array, and intensity array. None if the spectrum holds no
+        measurements.
+
+    '''
+
+    # Number of rows
+    n = spec.mz.shape[0]
+
+    # No measurements
+    if n == 0:
+        return None, None, None, None
+
+    # Dimension check
+    if len(spec.mz) != len(spec.i):
+        warnings.warn("m/z and intensity array dimension mismatch")
+        return None, None, None, None
+
+    # Scan/frame info
+    id_dict = spec.id_dict
+
+    # Check for precursor
+    precursor_info = {}
+    if spec.selected_precursors:
+        precursor_info = {
+            'precursor_mz': spec.selected_precursors[0].get('mz', None)}
+
+    # Get ms level
+    level = 'ms{}'.format(spec.ms_level)
+
+    # Columns
+    cols = list(id_dict.keys()) \
+        + list(accession.keys()) \
+        + ['mz', 'intensity'] \
+        + list(precursor_info.keys())
+
+    # Data types
+    dtypes = [_column_dtype(k, dtype, index=True) for k in id_dict.keys()] \
+        + [_column_dtype(k, dtype) for k in cols[len(id_dict):]]
+
+    # Scalar values
+    scalars = list(id_dict.values()) \
+        + [spec.get(v) for v in accession.values()] \
+        + list(precursor_info.values())
+
+    # Peak arrays
+    mz = np.asarray(spec.mz).astype(dtypes[cols.index('mz')], copy=False)
+    intensity = np.asarray(spec.i).astype(dtypes[cols.index('intensity')],
+                                          copy=False)
+
+    return level, cols, dtypes, (scalars, mz, intensity)
+
+
+def _build_frame(cols, dtypes, records, offset=0):
+    '''
+    Assembles decoded spectra into a :obj:`~pandas.DataFrame` column by
+    column. Scalar values are repeated per peak and peak arrays are
+    concatenated, so no intermediate 2-D array is formed.
+
+    Parameters
+    ----------
+    cols : list
+        Column names.
+    dtypes : list
+        Data type per column.
+    records : list of tuple
+        Decoded spectra, as returned by :func:`~deimos.io._parse_spectrum`.
+    offset : int
+        Start of the row index, e.g. rows already yielded in prior chunks.
+
+    Returns
+    -------
+    :obj:`~pandas.DataFrame`
+        Feature coordinates and intensities.
+
+    '''
+
+    # Peaks per spectrum
+    counts = np.array([len(x[1]) for x in records], dtype=np.int64)
+
+    data = {}
+    inx = 0
+    for col, dt in zip(cols, dtypes):
+        # Peak arrays
+        if col == 'mz':
+            data[col] = np.concatenate([x[1] for x in records]).astype(dt, copy=False)
+        elif col == 'intensity':
+            data[col] = np.concatenate([x[2] for x in records]).astype(dt, copy=False)
+
+        # Per-spectrum scalars
+        else:
+            data[col] = np.repeat(np.array([x[0][inx] for x in records], dtype=dt),
+                                  counts)
+            inx += 1
+
+    return pd.DataFrame(data, index=pd.RangeIndex(offset, offset + counts.sum()),
+                        copy=False)
+
+
+def _mzml_offsets(path):
+    '''
+    Reads spectrum byte offsets from the index of an indexed mzML file.
+
+    Parameters
+    ----------
+    path : str
+        Path to input mzML file.
+
+    Returns
+    -------
+    :obj:`~numpy.array` or None
+        Byte offset of each spectrum, in file order, followed by the byte
+        offset of the end of the spectrum list. None if the file is not
+        indexed.
+
+    '''
+
+    with open(path, 'rb') as f:
+        # Locate index list
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 4096))
+        match = re.search(rb'<indexListOffset>(\d+)</indexListOffset>', f.read())
+        if match is None:
+            return None
+
+        # Read spectrum index
+        index_offset = int(match.group(1))
+        f.seek(index_offset)
+        index = f.read()
+        match = re.search(rb'<index\s+name="spectrum"\s*>(.*?)</index>', index, re.S)
+        if match is None:
+            return None
+
+        offsets = [int(x) for x in re.findall(rb'<offset[^>]*>(\d+)</offset>',
+                                              match.group(1))]
+        if len(offsets) == 0:
+            return None
+
+        # Locate end of spectrum list
+        f.seek(offsets[-1])
+        tail = f.read(index_offset - offsets[-1])
+        end = tail.find(b'</spectrumList>')
+        if end < 0:
+            return None
+
+    return np.array(offsets + [offsets[-1] + end], dtype=np.int64)
+
+
+def _load_mzml_range(path, byte_range, accession={}, dtype=None,
+                     obo_version=None, ref_group=None):
+    '''
+    Decodes the spectra contained in a byte range of an mzML file.
+
+    Parameters
+    ----------
+    path : str
+        Path to input mzML file.
+    byte_range : tuple of int
+        Byte offsets of the first spectrum in the range and of the end of
+        the last spectrum in the range.
+    accession : :obj:`~collections.OrderedDict`
+        Key-value pairs signaling which features to parse for.
+    dtype : data type or dict
+        Data type for all columns, or per-column data types. See
+        :func:`~deimos.io._column_dtype`.
+    obo_version : str
+        OBO version of the mzML file.
+    ref_group : bytes
+        Serialized referenceable parameter group list, if present.
+
+    Returns
+    -------
+    res : :obj:`dict` of list
+        Decoded spectrum records, in file order, indexed by MS level.
+    cols : :obj:`dict` of list
+        Column names, indexed by MS level.
+    dtypes : :obj:`dict` of list
+        Data type per column, indexed by MS level.
+
+    '''
+
+    # Read byte range
+    start, stop = byte_range
+    with open(path, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(stop - start)
+
+    # Wrap in namespaced root
+    chunk = BytesIO(b'<mzML xmlns="http://psi.hupo.org/ms/mzml">'
+                    + chunk + b'</mzML>')
+
+    # Reference parameter groups
+    if ref_group is not None:
+        ref_group = ElementTree.fromstring(ref_group)
+
+    # Per-level chunk buffers
+    res = defaultdict(list)
+
+    # Column name and data type containers
+    cols = {}
+    dtypes = {}
+
+    for event, element in ElementTree.iterparse(chunk, events=('end',)):
+        if not element.tag.endswith('}spectrum'):
+            continue
+
+        spec = pymzml.spec.Spectrum(element, obo_version=obo_version)
+        if ref_group is not None:
+            spec._set_params_from_reference_group(ref_group)
+
+        # Decode
+        level, c, d, record = _parse_spectrum(spec, accession, dtype)
+
+        # Release element
+        element.clear()
+
+        if record is None:
+            continue
+
+        # Append record to level buffer
+        cols[level] = c
+        dtypes[level] = d
+        res[level].append(record)
+
+    return dict(res), cols, dtypes
+
+
+def _iter_spectra(path, accession, dtype=None, workers=1):
+    '''
+    Yields decoded spectrum records in file order. With multiple workers,
+    byte ranges of whole spectra are decoded in a process pool.
+
+    Parameters
+    ----------
+    path : str
+        Path to input mzML file.
+    accession : :obj:`~collections.OrderedDict`
+        Key-value pairs signaling which features to parse for.
+    dtype : data type or dict
+        Data type for all columns, or per-column data types. See
+        :func:`~deimos.io._column_dtype`.
+    workers : int
+        Number of parallel decoding processes.
+
+    Yields
+    ------
+    level : str
+        MS level of the spectrum, e.g. "ms1".
+    cols : list
+        Column names.
+    dtypes : list
+        Data type per column.
+    record : tuple
+        Decoded spectrum, as returned by :func:`~deimos.io._parse_spectrum`.
+
+    '''
+
+    # Spectrum byte offsets
+    offsets = None
+    if workers > 1:
+        # Compressed input cannot be split by byte offsets
+        if os.path.splitext(path)[-1].lower() != '.mzml':
+            warnings.warn('Parallel decoding requires uncompressed mzML, '
+                          'decoding serially')
+        else:
+            offsets = _mzml_offsets(path)
+
+            # Fall back to serial
+            if offsets is None:
+                warnings.warn('mzML offset index not found, decoding serially')
+
+    # Open file
+    with pymzml.run.Reader(path) as data:
+        # Serial
+        if offsets is None:
+            for spec in data:
+                level, cols, dtypes, record = _parse_spectrum(spec, accession,
+                                                              dtype)
+
+                if record is not None:
+                    yield level, cols, dtypes, record
+
+            return
+
+        # Reference parameter groups
+        ref_group = None
+        if data.info.get('referenceable_param_group_list', False):
+            ref_group = ElementTree.tostring(
+                data.info['referenceable_param_group_list_element'])
+
+        obo_version = data.OT.version
+
+    # Split into byte ranges of whole spectra, at most 64MB each
+    nranges = max(4 * workers, int(np.ceil((offsets[-1] - offsets[0]) / 2 ** 26)))
+    bounds = np.searchsorted(offsets[:-1],
+                             np.linspace(offsets[0], offsets[-1], nranges + 1))
+    bounds = np.unique(np.append(bounds, len(offsets) - 1))
+    ranges = [(offsets[a], offsets[b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    # Parallel, in file order
+    with mp.Pool(processes=workers) as p:
+        for res, cols, dtypes in p.imap(partial(_load_mzml_range, path,
+                                        accession=accession,
+                                        dtype=dtype,
+                                        obo_version=obo_version,
+                                        ref_group=ref_group),
+                                ranges):
+            for level in res.keys():
+                for record in res[level]:
+                    yield level, cols[level], dtypes[level], record
+
+
+def load_mzml(path, accession={}, dtype=None, workers=1):
     '''
     Loads in an mzML file, parsing for accession values, to yield a
-    :obj:`~pandas.DataFrame`.
+    :obj:`~pandas.DataFrame`. Spectra are decoded in a single pass over the
+    file.
 
     Parameters
     ----------
@@ -223,8 +646,14 @@ def load_mzml(path, accession={}, dtype=np.float32):
         Key-value pairs signaling which features to parse for in the mzML file.
         See :func:`~deimos.io.get_accessions` to obtain available values. Scan,
         frame, m/z, and intensity are parsed by default.
-    dtype : data type
-        Data type to encode values.
+    dtype : data type or dict
+        Data type for all columns, or per-column data types, e.g.
+        ``{'mz': np.float32}``. Unspecified columns default to uint32 for
+        scan/frame indices, float64 for m/z and precursor m/z, and float32
+        otherwise.
+    workers : int
+        Number of parallel decoding processes. Requires an uncompressed,
+        indexed mzML file; otherwise spectra are decoded serially.
 
     Returns
     -------
@@ -234,110 +663,103 @@ def load_mzml(path, accession={}, dtype=np.float32):
 
     '''
 
-    # Open file
-    data = pymzml.run.Reader(path)
-
-    # Ordered dict
-    accession = OrderedDict(accession)
-
-    # Result container
-    res = {}
-
-    # Row count container
-    counter = {}
+    # Per-level record buffers
+    res = defaultdict(list)
 
-    # Column name container
+    # Column name and data type containers
     cols = {}
+    dtypes = {}
 
-    # First pass: get nrows
-    N = defaultdict(lambda: 0)
-    for i, spec in enumerate(data):
-        # Get ms level
-        level = 'ms{}'.format(spec.ms_level)
+    # Single pass: parse
+    for level, c, d, record in _iter_spectra(path, OrderedDict(accession), dtype,
+                                             workers=workers):
+        cols[level] = c
+        dtypes[level] = d
+        res[level].append(record)
 
-        # Number of rows
-        N[level] += spec.mz.shape[0]
-
-    # Second pass: parse
-    for i, spec in enumerate(data):
-        # Number of rows
-        n = spec.mz.shape[0]
-
-        # No measurements
-        if n == 0:
-            continue
+    # Construct data frames
+    return {level: _build_frame(cols[level], dtypes[level], res[level])
+            for level in res.keys()}
 
-        # Dimension check
-        if len(spec.mz) != len(spec.i):
-            warnings.warn("m/z and intensity array dimension mismatch")
-            continue
 
-        # Scan/frame info
-        id_dict = spec.id_dict
-
-        # Check for precursor
-        precursor_info = {}
-        has_precursor = False
-        if spec.selected_precursors:
-            has_precursor = True
-            precursor_info = {
-                'precursor_mz': spec.selected_precursors[0].get('mz', None)}
-
-        # Get ms level
-        level = 'ms{}'.format(spec.ms_level)
-
-        # Columns
-        cols[level] = list(id_dict.keys()) \
-            + list(accession.keys()) \
-            + ['mz', 'intensity'] \
-            + list(precursor_info.keys())
-        m = len(cols[level])
-
-        # Subarray init
-        arr = np.empty((n, m), dtype=dtype)
-        inx = 0
-
-        # Populate scan/frame info
-        for k, v in id_dict.items():
-            arr[:, inx] = v
-            inx += 1
+def iter_mzml(path, accession={}, dtype=None, chunk_rows=1E7, workers=1):
+    '''
+    Iterates over an mzML file, parsing for accession values, to yield
+    :obj:`~pandas.DataFrame` chunks per MS level as spectra are decoded.
+    Memory usage scales with `chunk_rows` rather than file size.
 
-        # Populate accession fields
-        for k, v in accession.items():
-            arr[:, inx] = spec.get(v)
-            inx += 1
+    Parameters
+    ----------
+    path : str
+        Path to input mzML file.
+    accession : dict
+        Key-value pairs signaling which features to parse for in the mzML file.
+        See :func:`~deimos.io.get_accessions` to obtain available values. Scan,
+        frame, m/z, and intensity are parsed by default.
+    dtype : data type or dict
+        Data type for all columns, or per-column data types, e.g.
+        ``{'mz': np.float32}``. Unspecified columns default to uint32 for
+        scan/frame indices, float64 for m/z and precursor m/z, and float32
+        otherwise.
+    chunk_rows : int
+        Minimum number of rows per chunk. Chunks hold whole spectra, so may
+        exceed this size by up to one spectrum. The final chunk of each MS
+        level may be smaller.
+    workers : int
+        Number of parallel decoding processes. Requires an uncompressed,
+        indexed mzML file; otherwise spectra are decoded serially.
+
+    Yields
+    ------
+    level : str
+        MS level of the chunk, e.g. "ms1".
+    chunk : :obj:`~pandas.DataFrame`
+        Parsed feature coordinates and intensities.
 
-        # Populate m/z
-        arr[:, inx] = spec.mz
-        inx += 1
+    '''
 
-        # Populate intensity
-        arr[:, inx] = spec.i
-        inx += 1
+    # Per-level record buffers
+    res = defaultdict(list)
+    counter = defaultdict(int)
 
-        # Populate precursor information
-        if has_precursor:
-            for k, v in precursor_info.items():
-                arr[:, inx] = v
-                inx += 1
+    # Rows yielded per level, such that chunk indices continue
+    offset = defaultdict(int)
 
-        # Initialize output container
-        if level not in res:
-            res[level] = np.empty((N[level], m), dtype=dtype)
+    # Column name and data type containers
+    cols = {}
+    dtypes = {}
+
+    for level, c, d, record in _iter_spectra(path, OrderedDict(accession), dtype,
+                                             workers=workers):
+        cols[level] = c
+        dtypes[level] = d
+        res[level].append(record)
+        counter[level] += len(record[1])
+
+        # Flush full buffer
+        if counter[level] >= chunk_rows:
+            yield level, _build_frame(cols[level], dtypes[level], res[level],
+                                      offset=offset[level])
+            offset[level] += counter[level]
+            res[level] = []
             counter[level] = 0
 
-        # Insert subarray
-        res[level][counter[level]:counter[level] + n, :] = arr
-        counter[level] += n
-
-    # Construct data frames
+    # Flush remaining buffers
     for level in res.keys():
-        res[level] = pd.DataFrame(res[level], columns=cols[level])
+        if counter[level] > 0:
+            yield level, _build_frame(cols[level], dtypes[level], res[level],
+                                      offset=offset[level])
+
 
-    return res
+# Compression profiles, as (complib, complevel)
+_HDF_PROFILES = {'default': ('blosc', 5),
+                 'fast-write': ('blosc:lz4', 1),
+                 'balanced': ('blosc:zstd', 3),
+                 'archive': ('blosc:zstd', 7)}
 
 
-def save_hdf(path, data, key='ms1', complevel=5, **kwargs):
+def save_hdf(path, data, key='ms1', complevel=None, data_columns=None,
+             profile='default', complib=None, threads=None, **kwargs):
     '''
     Saves :obj:`~pandas.DataFrame` to HDF5 container.
 
@@ -350,16 +772,68 @@ def save_hdf(path, data, key='ms1', complevel=5, **kwargs):
     key : str
         Save to this level (group) of the HDF5 container. E.g., "ms1" or "ms2"
         for MS levels 1 or 2, respectively.
+    complevel : int
+        Compression level, 0-9. Overrides the level of `profile`.
+    data_columns : list, bool, or str
+        Columns to store as indexed, queryable data columns, such that the
+        `where` keyword of :func:`~deimos.io.load` only reads matching rows.
+        Selecting "detect" indexes all non-intensity columns. Reads scale with
+        the number of selected rows only if data are sorted by the queried
+        column (e.g. m/z) before saving. Indexing adds considerable write
+        time, so is disabled by default.
+    profile : str
+        Compression profile. "default" (blosc, level 5) as in prior releases,
+        "fast-write" (blosc:lz4, level 1) for intermediate files, "balanced"
+        (blosc:zstd, level 3), or "archive" (blosc:zstd, level 7) for
+        smallest files at several times the write time.
+    complib : str
+        Compression library, e.g. "blosc:lz4". Overrides the library of
+        `profile`.
+    threads : int
+        Number of blosc compression threads. Uses the PyTables default if
+        unspecified.
     kwargs
         Keyword arguments exposed by :meth:`~pandas.DataFrame.to_hdf`.
 
+    Output is always written through :meth:`~pandas.DataFrame.to_hdf`, so
+    files remain readable by :func:`~pandas.read_hdf`. As such, bitshuffle
+    and delta filters are not offered: pandas only forwards the compression
+    library and level to PyTables (blosc then applies byte shuffle), and
+    PyTables tables have no delta filter. A separate chunked h5py writer was
+    likewise left out, as `threads` already parallelizes compression.
+
     '''
 
-    data.to_hdf(path, key, format='table', complib='blosc',
-                complevel=complevel, **kwargs)
+    # Check profile
+    if profile not in _HDF_PROFILES:
+        raise ValueError('Profile must be one of {}.'.format(
+            ', '.join(_HDF_PROFILES.keys())))
+
+    # Profile defaults
+    if complib is None:
+        complib = _HDF_PROFILES[profile][0]
+    if complevel is None:
+        complevel = _HDF_PROFILES[profile][1]
+
+    # Autodetect
+    if data_columns == 'detect':
+        data_columns = [x for x in data.columns if x != 'intensity']
 
+    # Blosc threads
+    if threads is not None:
+        threads = tables.set_blosc_max_threads(threads)
 
-def load_hdf(path, key='ms1', columns=None, chunksize=1E7, meta=None):
+    try:
+        data.to_hdf(path, key=key, format='table', complib=complib,
+                    complevel=complevel, data_columns=data_columns, **kwargs)
+
+    # Restore blosc threads
+    finally:
+        if threads is not None:
+            tables.set_blosc_max_threads(threads)
+
+
+def load_hdf(path, key='ms1', columns=None, where=None, chunksize=1E7, meta=None):
     '''
     Loads data frame from HDF5 container(s). 
 
@@ -372,6 +846,8 @@ def load_hdf(path, key='ms1', columns=None, chunksize=1E7, meta=None):
         for MS levels 1 or 2, respectively.
     columns : list
         A list of columns names to return.
+    where : dict
+        Inclusive (low, high) bounds per column used to select rows.
     chunksize : int
         Dask partition chunksize. Unused when loading single file.
     meta : dict
@@ -398,16 +874,18 @@ def load_hdf(path, key='ms1', columns=None, chunksize=1E7, meta=None):
         return deimos.io.load_hdf_multi(paths,
                                         key=key,
                                         columns=columns,
+                                        where=where,
                                         chunksize=chunksize,
                                         meta=meta)
 
     # Single loader
-    return deimos.io.load_hdf_single(paths,
+    return deimos.io.load_hdf_single(paths[0],
                                      key=key,
-                                     columns=columns)
+                                     columns=columns,
+                                     where=where)
 
 
-def load_hdf_single(path, key='ms1', columns=None):
+def load_hdf_single(path, key='ms1', columns=None, where=None):
     '''
     Loads data frame from HDF5 container.
 
@@ -420,6 +898,11 @@ def load_hdf_single(path, key='ms1', columns=None):
         for MS levels 1 or 2, respectively.
     columns : list
         A list of columns names to return.
+    where : dict
+        Inclusive (low, high) bounds per column used to select rows. Bounds on
+        indexed data columns (see :func:`~deimos.io.save_hdf`) are evaluated
+        by PyTables, such that only matching rows are read. Bounds on other
+        columns are applied after reading.
 
     Returns
     -------
@@ -428,13 +911,84 @@ def load_hdf_single(path, key='ms1', columns=None):
 
     '''
 
-    return pd.read_hdf(path, key=key, columns=columns)
+    # No selection
+    if where is None:
+        return pd.read_hdf(path, key=key, columns=columns)
+
+    with pd.HDFStore(path, mode='r') as store:
+        # Indexed data columns
+        indexed = getattr(store.get_storer(key), 'data_columns', [])
+
+        # Push down finite bounds on indexed columns
+        terms = []
+        residual = {}
+        for k, (lb, ub) in where.items():
+            if k not in indexed:
+                residual[k] = (lb, ub)
+                continue
 
+            for op, x in [('>=', lb), ('<=', ub)]:
+                if np.isfinite(float(x)):
+                    terms.append('{} {} {!r}'.format(k, op, float(x)))
 
-def load_hdf_multi(paths, key='ms1', columns=None, chunksize=1E7, meta=None):
+                # Not expressible by PyTables, applied after reading
+                else:
+                    residual[k] = (lb, ub)
+
+        # Ensure residual columns are read
+        cols = columns
+        if (columns is not None) and (len(residual) > 0):
+            cols = list(columns) + [k for k in residual if k not in columns]
+
+        data = store.select(key, where=terms if len(terms) > 0 else None,
+                            columns=cols)
+
+    # Apply remaining bounds
+    if len(residual) > 0:
+        data = data.loc[_where_mask(data, residual)]
+
+        if columns is not None:
+            data = data[columns]
+
+    return data
+
+
+def _where_mask(data, where):
     '''
-    Loads data frame from HDF5 containers using Dask. Appends column to indicate
-    source filenames.
+    Evaluates inclusive per-column bounds.
+
+    Parameters
+    ----------
+    data : :obj:`~pandas.DataFrame` or :obj:`~dask.dataframe.DataFrame`
+        Feature coordinates and intensities.
+    where : dict
+        Inclusive (low, high) bounds per column.
+
+    Returns
+    -------
+    :obj:`~pandas.Series` or :obj:`~dask.dataframe.Series`
+        Boolean mask of rows within bounds.
+
+    '''
+
+    mask = None
+    for k, (lb, ub) in where.items():
+        test = (data[k] >= lb) & (data[k] <= ub)
+
+        if mask is None:
+            mask = test
+        else:
+            mask = mask & test
+
+    return mask
+
+
+def load_hdf_multi(paths, key='ms1', columns=None, where=None, chunksize=1E7, meta=None):
+    '''
+    Loads data frame from HDF5 containers using Dask. Appends columns to indicate
+    source file index ("sample_idx", smallest unsigned integer type) and
+    filename ("sample_id"). Sample names and meta data are stored as
+    categoricals with categories shared across samples.
 
     Parameters
     ----------
@@ -445,6 +999,9 @@ def load_hdf_multi(paths, key='ms1', columns=None, chunksize=1E7, meta=None):
         for MS levels 1 or 2, respectively.
     columns : list
         A list of columns names to return.
+    where : dict
+        Inclusive (low, high) bounds per column used to select rows. Applied
+        lazily per partition.
     chunksize : int
         Dask partition chunksize.
     meta : dict
@@ -457,23 +1014,80 @@ def load_hdf_multi(paths, key='ms1', columns=None, chunksize=1E7, meta=None):
 
     '''
 
+    # Ensure bounded columns are read
+    cols = columns
+    if (columns is not None) and (where is not None):
+        cols = list(columns) + [k for k in where if k not in columns]
+
     # Load as dask
     df = [dd.read_hdf(x, key=key, chunksize=int(
-        chunksize), columns=columns) for x in paths]
+        chunksize), columns=cols) for x in paths]
+
+    # Apply bounds
+    if where is not None:
+        df = [x[_where_mask(x, where)] for x in df]
+
+        if columns is not None:
+            df = [x[columns] for x in df]
+
+    # Sample labels
+    labels = {'sample_id': [os.path.splitext(os.path.basename(x))[0] for x in paths]}
+    if meta is not None:
+        labels.update(meta)
+
+    # Categories shared across samples
+    dtypes = {k: pd.CategoricalDtype(pd.unique(pd.Series(v).dropna()))
+              for k, v in labels.items()}
+
+    # Smallest integer type holding sample indices
+    idx_dtype = np.min_scalar_type(len(paths) - 1)
 
     # Label each sample
     for i in range(len(paths)):
-        df[i]['sample_idx'] = i  # force unique label in toy case
-        df[i]['sample_id'] = os.path.splitext(os.path.basename(paths[i]))[0]
+        codes = {'sample_idx': (i, idx_dtype)}
+        for k, v in labels.items():
+            code = -1 if pd.isna(v[i]) else dtypes[k].categories.get_loc(v[i])
+            codes[k] = (code, dtypes[k])
 
-        if meta is not None:
-            for k, v in meta.items():
-                df[i][k] = v[i]
+        df[i] = df[i].map_partitions(_label_partition, codes)
 
     # Concatenate results
     return dd.concat(df, axis=0)
 
 
+def _label_partition(df, codes):
+    '''
+    Assigns constant sample labels to a partition without materializing
+    per-row values.
+
+    Parameters
+    ----------
+    df : :obj:`~pandas.DataFrame`
+        Partition to label.
+    codes : dict
+        Column name to (value, data type) pairs. Values of categorical data
+        types are category codes.
+
+    Returns
+    -------
+    :obj:`~pandas.DataFrame`
+        Labeled partition.
+
+    '''
+
+    df = df.copy(deep=False)
+    n = len(df.index)
+
+    for k, (v, dtype) in codes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[k] = pd.Categorical.from_codes(np.full(n, v, dtype=np.int32),
+                                              dtype=dtype)
+        else:
+            df[k] = np.full(n, v, dtype=dtype)
+
+    return df
+
+
 def _save_hdf(path, data, dtype={}, compression_level=5):
     '''
     Deprecated version. Saves dictionary of :obj:`~pandas.DataFrame` to HDF5 container.
@@ -533,6 +1147,140 @@ def _load_hdf(path, level='ms1'):
         return pd.DataFrame({k: g[k] for k in list(g.keys())})
 
 
+def save_deimos(path, data, key='ms1'):
+    '''
+    Saves :obj:`~pandas.DataFrame` to DEIMoS container. The container is a
+    directory holding one raw, little-endian array file per column per key,
+    described by a JSON header. Saving to an existing key replaces it.
+
+    Parameters
+    ----------
+    path : str
+        Path to output directory.
+    data : :obj:`~pandas.DataFrame`
+        Feature coordinates and intensities to be saved. Columns must be of
+        numeric or boolean data type.
+    key : str
+        Save to this level (group) of the container. E.g., "ms1" or "ms2"
+        for MS levels 1 or 2, respectively.
+
+    '''
+
+    # Check data types
+    for c in data.columns:
+        if data[c].dtype.kind not in 'biuf':
+            raise ValueError('Column "{}" of type {} not supported by DEIMoS '
+                             'format.'.format(c, data[c].dtype))
+
+    # Read existing header
+    header = _read_deimos_header(path)
+
+    # Replace key
+    if os.path.exists(os.path.join(path, key)):
+        shutil.rmtree(os.path.join(path, key))
+    os.makedirs(os.path.join(path, key))
+
+    # Write columns
+    columns = []
+    for i, c in enumerate(data.columns):
+        arr = data[c].values
+        arr = arr.astype(arr.dtype.newbyteorder('<'), copy=False)
+        fn = '{}/{}.bin'.format(key, i)
+        arr.tofile(os.path.join(path, fn))
+        columns.append({'name': c, 'dtype': arr.dtype.str, 'file': fn})
+
+    # Write header
+    header['keys'][key] = {'rows': len(data.index), 'columns': columns}
+    with open(os.path.join(path, 'header.json'), 'w') as f:
+        json.dump(header, f, indent=2)
+
+
+def load_deimos(path, key='ms1', columns=None, where=None):
+    '''
+    Loads data frame from DEIMoS container. Columns are memory-mapped, so
+    only accessed data are read from disk. Modifications are not written
+    back to the container.
+
+    Parameters
+    ----------
+    path : str
+        Path to input directory.
+    key : str
+        Access this level (group) of the container. E.g., "ms1" or "ms2"
+        for MS levels 1 or 2, respectively.
+    columns : list
+        A list of columns names to return.
+    where : dict
+        Inclusive (low, high) bounds per column used to select rows. Selected
+        rows are copied into memory.
+
+    Returns
+    -------
+    :obj:`~pandas.DataFrame`
+        Feature coordinates and intensities for the specified level.
+
+    '''
+
+    # Read header
+    header = _read_deimos_header(path)
+    if key not in header['keys']:
+        raise KeyError('No object named {} in the file'.format(key))
+
+    header = header['keys'][key]
+    meta = OrderedDict([(x['name'], x) for x in header['columns']])
+
+    # Select columns
+    if columns is None:
+        columns = list(meta.keys())
+
+    # Memory map columns
+    data = OrderedDict()
+    for c in columns + [k for k in (where or {}) if k not in columns]:
+        if header['rows'] > 0:
+            data[c] = np.memmap(os.path.join(path, meta[c]['file']),
+                                dtype=meta[c]['dtype'],
+                                mode='c',
+                                shape=(header['rows'],))
+        else:
+            data[c] = np.empty(0, dtype=meta[c]['dtype'])
+
+    # Apply bounds
+    if where is not None:
+        mask = np.full(header['rows'], True, dtype=bool)
+        for k, (lb, ub) in where.items():
+            mask &= (data[k] >= lb) & (data[k] <= ub)
+
+        return pd.DataFrame({c: np.asarray(data[c][mask]) for c in columns},
+                            columns=columns)
+
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def _read_deimos_header(path):
+    '''
+    Reads the JSON header of a DEIMoS container.
+
+    Parameters
+    ----------
+    path : str
+        Path to DEIMoS directory.
+
+    Returns
+    -------
+    dict
+        Container header. Empty if the container does not exist.
+
+    '''
+
+    fn = os.path.join(path, 'header.json')
+
+    if os.path.exists(fn):
+        with open(fn, 'r') as f:
+            return json.load(f)
+
+    return {'format': 'deimos', 'version': 1, 'keys': {}}
+
+
 def save_mgf(path, features,
              groupby='index_ms1',
              precursor_mz='mz_ms1',
@@ -547,8 +1295,9 @@ def save_mgf(path, features,
     ----------
     path : str
         Path to output file.
-    features : :obj:`~pandas.DataFrame`
-        Precursor m/z and intensities paired to MS2 spectra.
+    features : :obj:`~pandas.DataFrame` or iterable of :obj:`~pandas.DataFrame`
+        Precursor m/z and intensities paired to MS2 spectra, or chunks thereof
+        to be written in turn.
     groupby : str or list of str
         Column(s) to group fragments by.
     precursor_mz : str
@@ -608,23 +1357,11 @@ def save_mgf(path, features,
     template += ('{}\n'
                  'END IONS\n\n')
     
-    # Open file object
-    with open(path, 'w') as f:
-        # Enumerate groups
-        for name, grp in features.groupby(by=groupby):
-            
-            # Format MS2 string
-            ms2_str = '\n'.join('{}\t{}'.format(a, b) for a, b in zip(grp[fragment_mz].values,
-                                                                      grp[fragment_intensity].values))
-            
-            # Precursor metadata values
-            values = list(grp[columns].values[0])
-            
-            # Add MS2 info
-            values += [ms2_str]
-            
-            # Write to template
-            f.write(template.format(*values))
+    # Write spectra
+    _write_spectra(path, features, template, columns,
+                   groupby=groupby,
+                   fragment_mz=fragment_mz,
+                   fragment_intensity=fragment_intensity)
 
 
 def save_msp(path, features,
@@ -641,8 +1378,9 @@ def save_msp(path, features,
     ----------
     path : str
         Path to output file.
-    features : :obj:`~pandas.DataFrame`
-        Precursor m/z and intensities paired to MS2 spectra.
+    features : :obj:`~pandas.DataFrame` or iterable of :obj:`~pandas.DataFrame`
+        Precursor m/z and intensities paired to MS2 spectra, or chunks thereof
+        to be written in turn.
     groupby : str or list of str
         Column(s) to group fragments by.
     precursor_mz : str
@@ -702,22 +1440,353 @@ def save_msp(path, features,
     template += ('Num Peaks: {}\n'
                  '{}\n\n')
     
+    # Write spectra
+    _write_spectra(path, features, template, columns,
+                   groupby=groupby,
+                   fragment_mz=fragment_mz,
+                   fragment_intensity=fragment_intensity,
+                   num_peaks=True)
+
+
+def _write_spectra(path, features, template, columns,
+                   groupby='index_ms1',
+                   fragment_mz='mz_ms2',
+                   fragment_intensity='intensity_ms2',
+                   num_peaks=False,
+                   buffer_size=2 ** 23):
+    '''
+    Writes grouped spectra to a text file according to a template. Each chunk
+    is sorted once by `groupby`, group boundaries are found by array
+    comparison, and fragment lines are formatted in a single pass.
+
+    Parameters
+    ----------
+    path : str
+        Path to output file.
+    features : :obj:`~pandas.DataFrame` or iterable of :obj:`~pandas.DataFrame`
+        Precursor m/z and intensities paired to MS2 spectra, or chunks
+        thereof. A group split across consecutive chunks is written as one
+        spectrum.
+    template : str
+        Spectrum template, formatted with precursor metadata values, the
+        number of peaks if `num_peaks` is True, then the fragment lines.
+    columns : list
+        Columns containing precursor metadata values.
+    groupby : str or list of str
+        Column(s) to group fragments by.
+    fragment_mz : str
+        Column containing fragment m/z values.
+    fragment_intensity : str
+        Column containing fragment intensity values.
+    num_peaks : bool
+        Signal whether the template expects the number of peaks.
+    buffer_size : int
+        Approximate number of characters buffered between writes.
+
+    '''
+
+    # Safely cast to list
+    groupby = deimos.utils.safelist(groupby)
+
+    # Cast single frame as chunk iterable
+    if isinstance(features, pd.DataFrame):
+        features = [features]
+
     # Open file object
     with open(path, 'w') as f:
-        # Enumerate groups
-        for name, grp in features.groupby(by=groupby):
-            # Number of MS2
-            n = len(grp.index)
-            
-            # Format MS2 string
-            ms2_str = '\n'.join('{}\t{}'.format(a, b) for a, b in zip(grp[fragment_mz].values,
-                                                                      grp[fragment_intensity].values))
-            
+        # Group rows carried over to the next chunk
+        carry = None
+
+        for chunk in itertools.chain(features, [None]):
+            # Last chunk
+            if chunk is None:
+                if carry is None:
+                    break
+                chunk = carry
+                carry = None
+                last = True
+            else:
+                if carry is not None:
+                    chunk = pd.concat((carry, chunk), ignore_index=True)
+                last = False
+
+            # Drop missing group labels
+            chunk = chunk.dropna(subset=groupby)
+
+            # Sort once
+            chunk = chunk.sort_values(by=groupby, kind='mergesort')
+            n = len(chunk.index)
+            if n == 0:
+                continue
+
+            # Group boundaries
+            change = np.full(n - 1, False, dtype=bool)
+            for g in groupby:
+                v = chunk[g].values
+                change |= v[1:] != v[:-1]
+            starts = np.concatenate(([0], np.flatnonzero(change) + 1))
+            stops = np.append(starts[1:], n)
+
+            # Hold last group until next chunk
+            if not last:
+                carry = chunk.iloc[starts[-1]:]
+                starts = starts[:-1]
+                stops = stops[:-1]
+
+            # Format MS2 lines
+            lines = list(map('{}\t{}'.format,
+                             chunk[fragment_mz].values.tolist(),
+                             chunk[fragment_intensity].values.tolist()))
+
             # Precursor metadata values
-            values = list(grp[columns].values[0])
-            
-            # Add MS2 info
-            values += [n, ms2_str]
-            
-            # Write to template
-            f.write(template.format(*values))
+            values = chunk[columns].iloc[starts].values
+
+            # Buffered write
+            buf = []
+            size = 0
+            for i, (a, b) in enumerate(zip(starts, stops)):
+                ms2_str = '\n'.join(lines[a:b])
+
+                if num_peaks is True:
+                    spectrum = template.format(*values[i], b - a, ms2_str)
+                else:
+                    spectrum = template.format(*values[i], ms2_str)
+
+                buf.append(spectrum)
+                size += len(spectrum)
+
+                if size >= buffer_size:
+                    f.write(''.join(buf))
+                    buf = []
+                    size = 0
+
+            f.write(''.join(buf))
+
+
+def load_mgf(path, dtype=None, chunk_size=2 ** 26):
+    '''
+    Loads spectra from MGF format.
+
+    Parameters
+    ----------
+    path : str
+        Path to input file.
+    dtype : data type or dict
+        Data type for m/z and intensity values, or per-column data types.
+        Defaults to float64 for m/z and float32 for intensity.
+    chunk_size : int
+        Number of bytes read per chunk.
+
+    Returns
+    -------
+    :obj:`dict` of :obj:`~pandas.DataFrame`
+        Per-spectrum header entries ("spectra"), with "offset" and "num_peaks"
+        columns locating each spectrum in the flat m/z and intensity table
+        ("peaks").
+
+    '''
+
+    return _read_spectra(path, fmt='mgf', dtype=dtype, chunk_size=chunk_size)
+
+
+def load_msp(path, dtype=None, chunk_size=2 ** 26):
+    '''
+    Loads spectra from MSP format.
+
+    Parameters
+    ----------
+    path : str
+        Path to input file.
+    dtype : data type or dict
+        Data type for m/z and intensity values, or per-column data types.
+        Defaults to float64 for m/z and float32 for intensity.
+    chunk_size : int
+        Number of bytes read per chunk.
+
+    Returns
+    -------
+    :obj:`dict` of :obj:`~pandas.DataFrame`
+        Per-spectrum header entries ("spectra"), with "offset" and "num_peaks"
+        columns locating each spectrum in the flat m/z and intensity table
+        ("peaks").
+
+    '''
+
+    return _read_spectra(path, fmt='msp', dtype=dtype, chunk_size=chunk_size)
+
+
+def _split_peaks(record):
+    '''
+    Splits a spectrum record into header and peak blocks. Peaks begin at the
+    first line starting with a number.
+
+    '''
+
+    match = re.search(rb'^[0-9.]', record, re.M)
+    if match is None:
+        return record, b''
+
+    return record[:match.start()], record[match.start():]
+
+
+def _parse_peaks_slow(block):
+    '''
+    Parses a peak block line by line, keeping the first two numbers of each
+    ";"-separated entry. Handles annotations, extra columns, and multiple
+    peaks per line.
+
+    '''
+
+    values = []
+    for entry in re.split(rb'[\n;]', re.sub(rb'"[^"]*"', b'', block)):
+        tokens = entry.replace(b',', b' ').split()[:2]
+        if len(tokens) == 2:
+            values.extend(float(x) for x in tokens)
+
+    return np.array(values, dtype=np.float64)
+
+
+def _parse_records(records, sep):
+    '''
+    Parses spectrum records into header entries and peak arrays.
+
+    '''
+
+    headers = []
+    blocks = []
+    counts = []
+    for record in records:
+        header, block = _split_peaks(record)
+
+        # Header entries
+        entries = {}
+        for line in header.split(b'\n'):
+            k, s, v = line.partition(sep)
+            if s:
+                entries[k.strip().decode('utf-8', 'replace')] = v.strip().decode('utf-8', 'replace')
+        headers.append(entries)
+
+        # Peak block and number of lines
+        block = block.strip()
+        blocks.append(block)
+        counts.append(block.count(b'\n') + 1 if block else 0)
+
+    counts = np.array(counts, dtype=np.int64)
+
+    # Parse all peaks at once, first two columns per line
+    values = np.empty((0, 2), dtype=np.float64)
+    if counts.sum() > 0:
+        try:
+            values = pd.read_csv(BytesIO(b'\n'.join(blocks)), sep=r'\s+',
+                                 header=None, usecols=[0, 1],
+                                 dtype=np.float64, float_precision='high').values
+        except (ValueError, pd.errors.ParserError):
+            values = None
+
+    # Fall back to line by line parsing per record
+    if (values is None) or (len(values) != counts.sum()) or np.isnan(values).any():
+        parsed = [_parse_peaks_slow(x) for x in blocks]
+        counts = np.array([len(x) // 2 for x in parsed], dtype=np.int64)
+        values = np.concatenate(parsed) if len(parsed) > 0 else np.array([])
+
+    return headers, values.reshape(-1, 2), counts
+
+
+def _read_spectra(path, fmt='mgf', dtype=None, chunk_size=2 ** 26):
+    '''
+    Reads MGF or MSP spectra in chunks of bytes. Records are split on their
+    terminator, header lines are parsed per record, and the peaks of a whole
+    chunk are converted in a single call.
+
+    Parameters
+    ----------
+    path : str
+        Path to input file.
+    fmt : str
+        One of "mgf" or "msp".
+    dtype : data type or dict
+        Data type for m/z and intensity values, or per-column data types.
+        Defaults to float64 for m/z and float32 for intensity.
+    chunk_size : int
+        Number of bytes read per chunk.
+
+    Returns
+    -------
+    :obj:`dict` of :obj:`~pandas.DataFrame`
+        Per-spectrum header entries ("spectra") and flat peak table ("peaks").
+
+    '''
+
+    # Record terminator and header separator
+    if fmt == 'mgf':
+        term, sep = b'END IONS', b'='
+    elif fmt == 'msp':
+        term, sep = b'\n\n', b':'
+    else:
+        raise ValueError('Only MGF and MSP formats currently supported.')
+
+    # Peak data types
+    mz_dtype = _column_dtype('mz', dtype)
+    intensity_dtype = _column_dtype('intensity', dtype)
+
+    headers = []
+    mz = []
+    intensity = []
+    counts = []
+    with open(path, 'rb') as f:
+        # Partial record carried over to the next chunk
+        carry = b''
+
+        while True:
+            chunk = f.read(int(chunk_size))
+            eof = len(chunk) < int(chunk_size)
+
+            # Normalize line endings
+            buf = carry + chunk.replace(b'\r', b'')
+            if eof:
+                buf += term
+
+            # Split complete records
+            records = buf.split(term)
+            carry = records.pop()
+
+            # Record bodies
+            if fmt == 'mgf':
+                records = [x[x.find(b'BEGIN IONS') + 10:] for x in records
+                           if b'BEGIN IONS' in x]
+            else:
+                records = [x for x in (x.strip() for x in records) if x]
+
+            # Parse
+            h, p, c = _parse_records(records, sep)
+            headers.append(pd.DataFrame(h))
+            mz.append(p[:, 0].astype(mz_dtype))
+            intensity.append(p[:, 1].astype(intensity_dtype))
+            counts.append(c)
+
+            if eof:
+                break
+
+    # Header table
+    spectra = pd.concat(headers, ignore_index=True)
+    spectra = spectra.drop(columns=[x for x in spectra.columns
+                                    if x.lower() == 'num peaks'])
+
+    # Cast numeric entries
+    for col in spectra.columns:
+        try:
+            spectra[col] = pd.to_numeric(spectra[col])
+        except (ValueError, TypeError):
+            pass
+
+    # Peak offsets
+    counts = np.concatenate(counts)
+    spectra['offset'] = np.cumsum(counts) - counts
+    spectra['num_peaks'] = counts
+
+    # Flat peak table
+    peaks = pd.DataFrame({'mz': np.concatenate(mz),
+                          'intensity': np.concatenate(intensity)},
+                         copy=False)
+
+    return {'spectra': spectra, 'peaks': peaks}
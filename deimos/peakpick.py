@@ -4,11 +4,69 @@ import pandas as pd
 import deimos
 
 
+def _footprint(features, dims, bins, scale_by=None, ref_res=None, scale=None):
+    '''
+    Scales bin widths according to `scale_by` and rounds up to the nearest
+    odd footprint.
+
+    '''
+
+    # Scaling
+    if None not in [scale_by, ref_res, scale]:
+        scale = deimos.utils.safelist(scale)
+        sf = np.min(np.diff(np.unique(features[scale_by]))) / ref_res
+
+        # Enumerate dimensions
+        for i, d in enumerate(dims):
+
+            # Scale
+            if d in scale:
+                bins[i] *= sf
+
+    # No scaling
+    elif not any([scale_by, ref_res, scale]):
+        pass
+
+    # Improper scaling kwargs
+    else:
+        raise ValueError(
+            '`scale_by`, `ref_res`, and `scale` must all be supplied')
+
+    return [np.ceil(x) // 2 * 2 + 1 for x in bins]
+
+
+def _lattice_index(features, index=None, factors=None, dims=['mz', 'drift_time', 'retention_time']):
+    '''
+    Lattice indices of features (MxN), from a precomputed index, factors,
+    or the features directly.
+
+    '''
+
+    # Check factors and index mutually exclusive
+    if (factors is not None) & (index is not None):
+        raise ValueError('Specify either `index`, `factors`, or neither.')
+
+    # Build index from features directly
+    if (factors is None) & (index is None):
+        index = {dim: pd.factorize(features[dim], sort=True)[0].astype(np.float32)
+                 for dim in dims}
+
+    # Build index from factors
+    if (factors is not None) & (index is None):
+        index = deimos.build_index(features, factors)
+
+    # Index built, shape appropriately
+    return np.vstack([index[dim] for dim in dims]).T
+
+
 def local_maxima(features, dims=['mz', 'drift_time', 'retention_time'],
                  bins=[37, 9, 37], scale_by=None, ref_res=None,
-                 scale=None):
+                 scale=None, tile_shape=None, workers=1, out=None):
     '''
-    N-dimensional non-maximum suppression peak detection method.
+    N-dimensional non-maximum suppression peak detection method. The dense
+    grid is always built in full, so peak memory scales with the number of
+    grid cells regardless of `tile_shape`; see :func:`sparse_local_maxima`
+    for a method that scales with the number of features.
 
     Parameters
     ----------
@@ -26,6 +84,15 @@ def local_maxima(features, dims=['mz', 'drift_time', 'retention_time'],
         Minimum acquisition resolution of `scale_by` dimension.
     scale : str or list
         Dimensions to scale, according to `scale_by`.
+    tile_shape : int, list, or None
+        Shape of blocks for tiled maximum filtering (see
+        :func:`deimos.filters.tiled`).
+    workers : int
+        Number of threads for tiled maximum filtering.
+    out : :obj:`~numpy.array` or None
+        Array to hold the maximum filtered grid, e.g. a :obj:`~numpy.memmap`
+        to keep it out of core. Must match the shape of the grid. Allocated
+        if None.
 
     Returns
     -------
@@ -41,29 +108,9 @@ def local_maxima(features, dims=['mz', 'drift_time', 'retention_time'],
     # Check dims
     deimos.utils.check_length([dims, bins])
 
-    # Scaling
-    if None not in [scale_by, ref_res, scale]:
-        scale = deimos.utils.safelist(scale)
-        sf = np.min(np.diff(np.unique(features[scale_by]))) / ref_res
-
-        # Enumerate dimensions
-        for i, d in enumerate(dims):
-
-            # Scale
-            if d in scale:
-                bins[i] *= sf
-
-    # No scaling
-    elif not any([scale_by, ref_res, scale]):
-        pass
-
-    # Improper scaling kwargs
-    else:
-        raise ValueError(
-            '`scale_by`, `ref_res`, and `scale` must all be supplied')
-
     # Footprint rounded up to nearest odd
-    bins = [np.ceil(x) // 2 * 2 + 1 for x in bins]
+    bins = _footprint(features, dims, bins, scale_by=scale_by,
+                      ref_res=ref_res, scale=scale)
     # bins_half = [np.ceil(x / 2) // 2 * 2 + 1 for x in bins]
     # bins_half[0] = 3
 
@@ -81,7 +128,14 @@ def local_maxima(features, dims=['mz', 'drift_time', 'retention_time'],
     # H = deimos.filters.sum(H, [1, 3, 3])
 
     # Peak detection
-    H = np.where(H == deimos.filters.maximum(H, bins), H, 0)
+    M = deimos.filters.tiled(deimos.filters.maximum, H, bins,
+                             tile_shape=tile_shape, workers=workers, out=out)
+
+    # Suppress non-maxima along the first dimension, avoiding a full mask
+    step = max(1, 2 ** 22 // max(int(np.prod(H.shape[1:])), 1))
+    for i in range(0, H.shape[0], step):
+        h = H[i:i + step]
+        h[h != M[i:i + step]] = 0
 
     # Convert to dataframe
     peaks = deimos.grid.grid2df(edges, H, dims=dims)
@@ -89,6 +143,67 @@ def local_maxima(features, dims=['mz', 'drift_time', 'retention_time'],
     return peaks
 
 
+def sparse_local_maxima(features, index=None, factors=None,
+                        dims=['mz', 'drift_time', 'retention_time'],
+                        bins=[37, 9, 37], scale_by=None, ref_res=None,
+                        scale=None):
+    '''
+    N-dimensional non-maximum suppression peak detection method, evaluated
+    directly on lattice indices. Equivalent to :func:`local_maxima`, but
+    cost scales with the number of features rather than the number of grid
+    cells. Features are not collapsed over omitted dimensions.
+
+    Parameters
+    ----------
+    features : :obj:`~pandas.DataFrame`
+        Input feature coordinates and intensities.
+    index : dict
+        Index of features in original data array.
+    factors : dict
+        Unique sorted values per dimension.
+    dims : str or list
+        Dimensions to perform peak detection in.
+    bins : float or list
+        Number of bins representing approximate peak width in each dimension.
+    scale_by : str
+        Dimension to scale bin widths by. Only applies when data is partitioned
+        by `scale_by` (see :func:`deimos.utils.partition`).
+    ref_res : float
+        Minimum acquisition resolution of `scale_by` dimension.
+    scale : str or list
+        Dimensions to scale, according to `scale_by`.
+
+    Returns
+    -------
+    :obj:`~pandas.DataFrame`
+        Coordinates of detected peaks and associated apex intensitites.
+
+    '''
+
+    # Safely cast to list
+    dims = deimos.utils.safelist(dims)
+    bins = deimos.utils.safelist(bins)
+
+    # Check dims
+    deimos.utils.check_length([dims, bins])
+
+    # Footprint rounded up to nearest odd
+    bins = _footprint(features, dims, bins, scale_by=scale_by,
+                      ref_res=ref_res, scale=scale)
+
+    # Lattice indices
+    index = _lattice_index(features, index=index, factors=factors, dims=dims)
+
+    # Values
+    V = features['intensity'].values
+
+    # Peak detection
+    mask = deimos.filters.sparse_local_maxima(index, V, radius=[x // 2 for x in bins])
+    mask &= V > 0
+
+    return features.loc[mask].reset_index(drop=True)
+
+
 def persistent_homology(features, index=None, factors=None, dims=['mz', 'drift_time', 'retention_time'],
                         radius=None):
     '''
@@ -126,21 +241,8 @@ def persistent_homology(features, index=None, factors=None, dims=['mz', 'drift_t
     if radius is not None:
         deimos.utils.check_length([dims, radius])
 
-    # Check factors and index mutually exclusive
-    if (factors is not None) & (index is not None):
-        raise ValueError('Specify either `index`, `factors`, or neither.')
-
-    # Build index from features directly
-    if (factors is None) & (index is None):
-        index = {dim: pd.factorize(features[dim], sort=True)[0].astype(np.float32)
-                 for dim in dims}
-
-    # Build index from factors
-    if (factors is not None) & (index is None):
-        index = deimos.build_index(features, factors)
-
-    # Index built, shape appropriately
-    index = np.vstack([index[dim] for dim in dims]).T
+    # Lattice indices
+    index = _lattice_index(features, index=index, factors=factors, dims=dims)
 
     # Values
     V = features['intensity'].values
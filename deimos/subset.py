@@ -1,5 +1,6 @@
 import multiprocessing as mp
 from functools import partial
+from multiprocessing import shared_memory
 
 import dask.dataframe as dd
 import numpy as np
@@ -32,10 +33,13 @@ def threshold(features, by='intensity', threshold=0):
     return features.loc[features[by] > threshold, :].reset_index(drop=True)
 
 
-def collapse(features, keep=['mz', 'drift_time', 'retention_time'], how=np.sum):
+def collapse(features, keep=['mz', 'drift_time', 'retention_time'], how=np.sum,
+             index=None, factors=None):
     '''
     Collpases input data such that only specified dimensions remain, according
-    to the supplied aggregation function.
+    to the supplied aggregation function. If an index or factors are supplied,
+    sum, max, min, mean, and count are computed over integer group keys,
+    raveled from the index, rather than by hashing coordinate values.
 
     Parameters
     ----------
@@ -45,6 +49,10 @@ def collapse(features, keep=['mz', 'drift_time', 'retention_time'], how=np.sum):
         Dimensions to keep during collapse operation.
     how : function or str
         Aggregation function for collapse operation.
+    index : dict
+        Index of features in original data array.
+    factors : dict
+        Unique sorted values per dimension.
 
     Returns
     -------
@@ -54,11 +62,126 @@ def collapse(features, keep=['mz', 'drift_time', 'retention_time'], how=np.sum):
 
     '''
 
+    # Safely cast to list
+    keep = deimos.utils.safelist(keep)
+
+    # Check factors and index mutually exclusive
+    if (factors is not None) & (index is not None):
+        raise ValueError('Specify either `index`, `factors`, or neither.')
+
+    # Build index from factors
+    if factors is not None:
+        index = deimos.build_index(features, {dim: factors[dim] for dim in keep})
+
+    # Supported aggregation
+    agg = None
+    if callable(how) or isinstance(how, str):
+        agg = _AGGREGATIONS.get(how)
+
+    if (index is not None) & (agg is not None) & (len(features.index) > 0):
+        res = _collapse_index(features, keep, agg, index)
+        if res is not None:
+            return res
+
     return features.groupby(by=keep,
                             as_index=False,
                             sort=False).agg({'intensity': how})
 
 
+_AGGREGATIONS = {np.sum: 'sum', 'sum': 'sum',
+                 np.max: 'max', 'max': 'max',
+                 np.min: 'min', 'min': 'min',
+                 np.mean: 'mean', 'mean': 'mean',
+                 'count': 'count'}
+
+
+def _collapse_index(features, keep, agg, index):
+    '''
+    Collapses features by integer group keys raveled from the index, groups
+    in order of first appearance. Keys are tabulated directly when the key
+    space is at most a few times the number of rows, otherwise hashed.
+    Returns None if the raveled keys would overflow.
+
+    '''
+
+    # Integer group keys
+    idx = [np.asarray(index[dim]).astype(np.int64) for dim in keep]
+    shape = [x.max() + 1 for x in idx]
+    if np.sum(np.log2(np.maximum(shape, 1).astype(np.float64))) >= 62:
+        return None
+
+    codes = np.ravel_multi_index(idx, shape)
+    size = int(np.prod(shape))
+    del idx
+
+    # Dense key space, first row of each key by bincount-sized table
+    if size <= max(4 * len(codes), 2 ** 20):
+        table = np.full(size, len(codes), dtype=np.int64)
+        np.minimum.at(table, codes, np.arange(len(codes)))
+
+        # Keys in order of first appearance
+        first = np.zeros(len(codes), dtype=bool)
+        first[table[table < len(codes)]] = True
+        first = np.flatnonzero(first)
+        n = len(first)
+
+        # Group per row
+        table[codes[first]] = np.arange(n)
+        group = table[codes]
+        del table
+
+    # Sparse key space, hashed integer keys
+    else:
+        group, uniques = pd.factorize(codes)
+        n = len(uniques)
+
+        # First row of each group
+        first = np.full(n, len(group), dtype=np.int64)
+        np.minimum.at(first, group, np.arange(len(group)))
+
+    del codes
+
+    V = features['intensity'].values
+
+    # Skip missing intensities, as groupby
+    valid = None
+    if np.issubdtype(V.dtype, np.floating):
+        valid = ~np.isnan(V)
+        if valid.all():
+            valid = None
+
+    if agg == 'count':
+        res = np.bincount(group if valid is None else group[valid],
+                          minlength=n).astype(np.int64)
+    elif agg in ['max', 'min']:
+        func = np.fmax if agg == 'max' else np.fmin
+        res = V[first].copy()
+        func.at(res, group, V)
+    elif np.issubdtype(V.dtype, np.integer):
+        res = np.zeros(n, dtype=np.int64)
+        np.add.at(res, group, V)
+    else:
+        res = np.bincount(group, weights=V if valid is None else np.where(valid, V, 0),
+                          minlength=n)
+
+    if agg == 'mean':
+        # Groups without intensities are missing
+        with np.errstate(invalid='ignore'):
+            res = res / np.bincount(group if valid is None else group[valid],
+                                    minlength=n)
+
+        # Match aggregated types of groupby
+        if np.issubdtype(V.dtype, np.floating):
+            res = res.astype(V.dtype)
+    elif agg != 'count':
+        res = res.astype(V.dtype, copy=False)
+
+    collapsed = {dim: features[dim].values[first] for dim in keep}
+    collapsed['intensity'] = res
+
+    return pd.DataFrame(collapsed)
+
+
 def locate(features, by=['mz', 'drift_time', 'retention_time'],
            loc=[0, 0, 0], tol=[0, 0, 0], return_index=False):
     '''
@@ -67,8 +190,8 @@ def locate(features, by=['mz', 'drift_time', 'retention_time'],
 
     Parameters
     ----------
-    features : :obj:`~pandas.DataFrame`
-        Input feature coordinates and intensities.
+    features : :obj:`~pandas.DataFrame` or :obj:`~deimos.subset.FeatureIndex`
+        Input feature coordinates and intensities, optionally indexed.
     by : str or list
         Dimension(s) by which to subset the data.
     loc : float or list
@@ -96,43 +219,113 @@ def locate(features, by=['mz', 'drift_time', 'retention_time'],
     # Check dims
     deimos.utils.check_length([by, loc, tol])
 
-    if features is None:
-        if return_index is True:
-            return None, None
-        else:
-            return None
+    return deimos.subset.slice(features, by=by,
+                               low=[x - dx for x, dx in zip(loc, tol)],
+                               high=[x + dx for x, dx in zip(loc, tol)],
+                               return_index=return_index)
 
-    # Store index
-    rindex = features.index.values
 
-    # Extend columns
-    cols = features.columns
-    cidx = [cols.get_loc(x) for x in by]
+def locate_many(features, by=['mz', 'drift_time', 'retention_time'],
+                locs=[[0, 0, 0]], tol=[0, 0, 0], relative=[False, False, False],
+                chunk_size=2 ** 24):
+    '''
+    Given many coordinates and tolerances, return the subset of the data
+    matching each, in one vectorized pass. Candidate windows of the first
+    dimension are found by binary search of a sorted index, and remaining
+    dimensions are masked in bulk over all candidates.
 
-    # Subset by each dim
-    features = features.values
-    idx = np.full(features.shape[0], True, dtype=bool)
-    for i, x, dx in zip(cidx, loc, tol):
-        idx *= (features[:, i] <= x + dx) & (features[:, i] >= x - dx)
+    Parameters
+    ----------
+    features : :obj:`~pandas.DataFrame` or :obj:`~deimos.subset.FeatureIndex`
+        Input feature coordinates and intensities, optionally indexed.
+    by : str or list
+        Dimension(s) by which to subset the data.
+    locs : :obj:`~numpy.array`
+        Coordinate locations (MxD).
+    tol : float or list
+        Tolerance in each dimension.
+    relative : bool or list
+        Whether to use relative or absolute tolerance per dimension.
+    chunk_size : int
+        Approximate number of candidate rows evaluated at once.
 
-    features = features[idx]
-    rindex = rindex[idx]
+    Returns
+    -------
+    :obj:`~pandas.DataFrame`
+        Subset of feature coordinates and intensities matching each
+        location, with the row index of each location in `query_idx`,
+        sorted by query.
 
-    if return_index is True:
-        # Data found
-        if features.shape[0] > 0:
-            return pd.DataFrame(features, index=rindex, columns=cols), idx
+    '''
 
-        # No data
-        return None, idx
-    else:
-        # Data found
-        if features.shape[0] > 0:
-            return pd.DataFrame(features, index=rindex, columns=cols)
+    # Safely cast to list
+    by = deimos.utils.safelist(by)
+    tol = deimos.utils.safelist(tol)
+    relative = deimos.utils.safelist(relative)
 
-        # No data
+    # Check dims
+    deimos.utils.check_length([by, tol, relative])
+
+    if features is None:
         return None
 
+    # Coordinates per query
+    locs = np.asarray(locs, dtype=float).reshape(-1, len(by))
+    tol = np.where(np.array(relative, dtype=bool), np.abs(locs) * tol, tol)
+    lb = locs - tol
+    ub = locs + tol
+
+    # Sort once
+    if not isinstance(features, FeatureIndex):
+        features = FeatureIndex(features, by=by[0])
+
+    # Primary window per query
+    if features.by in by:
+        i = by.index(features.by)
+        lo, hi = features.window(lb[:, i], ub[:, i])
+    else:
+        i = None
+        lo = np.zeros(len(locs), dtype=np.int64)
+        hi = np.full(len(locs), len(features), dtype=np.int64)
+
+    cnt = np.maximum(hi - lo, 0)
+
+    # Chunks of queries by number of candidates
+    bounds = np.searchsorted(np.cumsum(cnt), np.arange(chunk_size, cnt.sum(), chunk_size))
+    bounds = np.unique(np.concatenate(([0], bounds + 1, [len(locs)])).clip(0, len(locs)))
+
+    rows = [np.empty(0, dtype=np.int64)]
+    query = [np.empty(0, dtype=np.int64)]
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        # Expand candidate windows
+        c = cnt[a:b]
+        q = np.repeat(np.arange(a, b), c)
+        pos = np.repeat(lo[a:b] - np.cumsum(c) + c, c) + np.arange(c.sum())
+
+        # Mask remaining dims
+        mask = np.full(len(pos), True, dtype=bool)
+        for j, dim in enumerate(by):
+            if j != i:
+                x = features.column(dim)[pos]
+                mask &= (x <= ub[q, j]) & (x >= lb[q, j])
+
+        rows.append(features.order[pos[mask]])
+        query.append(q[mask])
+
+    rows = np.concatenate(rows)
+    query = np.concatenate(query)
+
+    # No data
+    if len(rows) == 0:
+        return None
+
+    # Sort by query, then row
+    order = np.lexsort((rows, query))
+    res = features.features.iloc[rows[order]].copy()
+    res['query_idx'] = query[order]
+
+    return res
+
 
 def locate_asym(features, by=['mz', 'drift_time', 'retention_time'],
                 loc=[0, 0, 0], low=[0, 0, 0], high=[0, 0, 0],
@@ -143,8 +336,8 @@ def locate_asym(features, by=['mz', 'drift_time', 'retention_time'],
 
     Parameters
     ----------
-    features : :obj:`~pandas.DataFrame`
-        Input feature coordinates and intensities.
+    features : :obj:`~pandas.DataFrame` or :obj:`~deimos.subset.FeatureIndex`
+        Input feature coordinates and intensities, optionally indexed.
     by : str or list
         Dimension(s) by which to subset the data.
     loc : float or list
@@ -199,8 +392,8 @@ def slice(features, by=['mz', 'drift_time', 'retention_time'],
 
     Parameters
     ----------
-    features : :obj:`~pandas.DataFrame`
-        Input feature coordinates and intensities.
+    features : :obj:`~pandas.DataFrame` or :obj:`~deimos.subset.FeatureIndex`
+        Input feature coordinates and intensities, optionally indexed.
     by : str or list
         Dimensions(s) by which to subset the data
     low : float or list
@@ -234,41 +427,187 @@ def slice(features, by=['mz', 'drift_time', 'retention_time'],
         else:
             return None
 
-    # Store index
-    rindex = features.index.values
+    # Prebuilt index
+    if isinstance(features, FeatureIndex):
+        pos = features.query(by=by, low=low, high=high)
+        features = features.features
 
-    # Extend columns
-    cols = features.columns
-    cidx = [cols.get_loc(x) for x in by]
+        idx = np.zeros(len(features.index), dtype=bool)
+        idx[pos] = True
 
     # Subset by each dim
-    features = features.values
-    idx = np.full(features.shape[0], True, dtype=bool)
-    for i, lb, ub in zip(cidx, low, high):
-        idx *= (features[:, i] <= ub) & (features[:, i] >= lb)
+    else:
+        idx = np.full(len(features.index), True, dtype=bool)
+        for dim, lb, ub in zip(by, low, high):
+            x = features[dim].values
+            idx &= (x <= ub) & (x >= lb)
 
-    features = features[idx]
-    rindex = rindex[idx]
+    features = features.loc[idx]
 
     if return_index is True:
         # Data found
-        if features.shape[0] > 0:
-            return pd.DataFrame(features, index=rindex, columns=cols), idx
+        if len(features.index) > 0:
+            return features, idx
 
         # No data
         return None, idx
     else:
         # Data found
-        if features.shape[0] > 0:
-            return pd.DataFrame(features, index=rindex, columns=cols)
+        if len(features.index) > 0:
+            return features
 
         # No data
         return None
 
 
+class FeatureIndex:
+    '''
+    Sorted index over feature coordinates for repeated subset queries. Rows
+    are sorted once by a primary dimension. Each query bounds the primary
+    dimension by binary search, then masks the remaining dimensions within
+    that window only, such that cost scales with the window rather than the
+    whole data. Accepted in place of a :obj:`~pandas.DataFrame` by
+    :func:`~deimos.subset.locate`, :func:`~deimos.subset.locate_asym`, and
+    :func:`~deimos.subset.slice`.
+
+    Attributes
+    ----------
+    features : :obj:`~pandas.DataFrame`
+        Input feature coordinates and intensities.
+    by : str
+        Primary dimension.
+    order : :obj:`~numpy.array`
+        Positional index of rows, sorted by `by`.
+
+    '''
+
+    def __init__(self, features, by='mz'):
+        '''
+        Initialize :obj:`~deimos.subset.FeatureIndex` instance.
+
+        Parameters
+        ----------
+        features : :obj:`~pandas.DataFrame`
+            Input feature coordinates and intensities.
+        by : str
+            Primary dimension to sort by.
+
+        '''
+
+        self.features = features
+        self.by = by
+
+        # Sort once
+        values = features[by].values
+        self.order = np.argsort(values, kind='stable')
+
+        # Sorted columns, cached as queried
+        self._columns = {by: values[self.order]}
+
+    def __len__(self):
+        '''
+        Number of indexed features.
+
+        '''
+
+        return len(self.order)
+
+    def column(self, dim):
+        '''
+        Values of a dimension in sorted order.
+
+        Parameters
+        ----------
+        dim : str
+            Dimension to return.
+
+        Returns
+        -------
+        :obj:`~numpy.array`
+            Values of `dim`, sorted by the primary dimension.
+
+        '''
+
+        if dim not in self._columns:
+            self._columns[dim] = self.features[dim].values[self.order]
+
+        return self._columns[dim]
+
+    def window(self, low, high):
+        '''
+        Bounds of the sorted positions within the primary dimension range.
+
+        Parameters
+        ----------
+        low : float or :obj:`~numpy.array`
+            Lower bound(s) of the primary dimension.
+        high : float or :obj:`~numpy.array`
+            Upper bound(s) of the primary dimension.
+
+        Returns
+        -------
+        lo, hi : int or :obj:`~numpy.array`
+            Sorted positions `order[lo:hi]` within bounds.
+
+        '''
+
+        keys = self._columns[self.by]
+
+        return (np.searchsorted(keys, low, side='left'),
+                np.searchsorted(keys, high, side='right'))
+
+    def query(self, by=['mz', 'drift_time', 'retention_time'],
+              low=[0, 0, 0], high=[0, 0, 0]):
+        '''
+        Positional index of features within bounds.
+
+        Parameters
+        ----------
+        by : str or list
+            Dimensions(s) by which to subset the data.
+        low : float or list
+            Lower bound(s) in each dimension.
+        high : float or list
+            Upper bound(s) in each dimension.
+
+        Returns
+        -------
+        :obj:`~numpy.array`
+            Positional index of features within bounds, in row order.
+
+        '''
+
+        # Safely cast to list
+        by = deimos.utils.safelist(by)
+        low = deimos.utils.safelist(low)
+        high = deimos.utils.safelist(high)
+
+        # Check dims
+        deimos.utils.check_length([by, low, high])
+
+        # Primary window
+        if self.by in by:
+            i = by.index(self.by)
+            lo, hi = self.window(low[i], high[i])
+        else:
+            i = None
+            lo, hi = 0, len(self)
+
+        # Mask remaining dims within window
+        mask = np.full(max(hi - lo, 0), True, dtype=bool)
+        for j, (dim, lb, ub) in enumerate(zip(by, low, high)):
+            if j != i:
+                x = self.column(dim)[lo:hi]
+                mask &= (x <= ub) & (x >= lb)
+
+        return np.sort(self.order[lo:hi][mask])
+
+
 class Partitions:
     '''
     Generator object that will lazily build and return each partition.
+    Values of `split_on` are sorted once, and each partition located by
+    binary search, rather than scanning the data per partition.
 
     Attributes
     ----------
@@ -313,8 +652,12 @@ class Partitions:
 
         '''
 
+        # Sort once
+        self._order, self._sorted = self._sort(self.features)
+
         # Unique to split on
-        idx = np.unique(self.features[self.split_on].values)
+        x = self._sorted
+        idx = x[np.concatenate(([True], x[1:] != x[:-1]))]
 
         # Number of partitions
         partitions = np.ceil(len(idx) / self.size)
@@ -350,6 +693,85 @@ class Partitions:
         self.bounds = bounds
         self.fbounds = fbounds
 
+    def _sort(self, features):
+        '''
+        Sorts `split_on` values of `features` once. Order is None if already
+        sorted.
+
+        '''
+
+        x = features[self.split_on].values
+        if np.all(x[1:] >= x[:-1]):
+            return None, x
+
+        order = np.argsort(x, kind='stable')
+        return order, x[order]
+
+    def _locate(self, x):
+        '''
+        Locates start and stop positions of each partition bound by binary
+        search of sorted `split_on` values `x`.
+
+        '''
+
+        return self._search(x, self.bounds)
+
+    def _locate_functional(self, x):
+        '''
+        Locates start and stop positions of each functional partition bound
+        by binary search of sorted `split_on` values `x`.
+
+        '''
+
+        return self._search(x, self.fbounds)
+
+    def _search(self, x, bounds):
+        '''
+        Start and stop positions of inclusive `bounds` in sorted values `x`.
+
+        '''
+
+        bounds = np.asarray(bounds).reshape(-1, 2)
+        if np.issubdtype(x.dtype, np.floating):
+            bounds = bounds.astype(x.dtype)
+
+        starts = np.searchsorted(x, bounds[:, 0], side='left')
+        stops = np.searchsorted(x, bounds[:, 1], side='right')
+
+        return starts, stops
+
+    def _partitions(self, features, order, x):
+        '''
+        Yields rows of `features` within each partition bound. Rows are
+        yielded in their original order, as contiguous views if `features`
+        is already sorted.
+
+        '''
+
+        for start, stop in zip(*self._locate(x)):
+            # No data
+            if stop <= start:
+                yield None
+
+            else:
+                yield features.iloc[_partition_rows(order, start, stop)]
+
+    def _reconcile(self, result):
+        '''
+        Masks each partition result to its functional bounds.
+
+        '''
+
+        masks = []
+        for res, (a, b) in zip(result, self.fbounds):
+            if res is None:
+                masks.append(None)
+            else:
+                x = res[self.split_on].values
+                masks.append((x >= a) & (x <= b))
+
+        return masks
+
     def __iter__(self):
         '''
         Yields each partition.
@@ -361,10 +783,10 @@ class Partitions:
 
         '''
 
-        for a, b in self.bounds:
-            yield slice(self.features, by=self.split_on, low=a, high=b)
+        yield from self._partitions(self.features, self._order, self._sorted)
 
-    def map(self, func, processes=1, **kwargs):
+    def map(self, func, processes=1, shared=False, same_length=False,
+            **kwargs):
         '''
         Maps `func` to each partition, then returns the combined result,
         accounting for overlap regions.
@@ -376,6 +798,15 @@ class Partitions:
         processes : int
             Number of parallel processes. If less than 2, a serial mapping is
             applied.
+        shared : bool
+            Signal whether to publish feature columns to shared memory once,
+            such that parallel workers receive partition offsets rather than
+            pickled partitions. Requires numeric columns and index.
+        same_length : bool
+            Signal whether `func` returns one row per input row, with input
+            index, columns, and `split_on` values, e.g. smoothed intensities.
+            If so, and `shared` is True, workers write results into a
+            preallocated shared output rather than pickling them back.
         kwargs
             Keyword arguments passed to `func`.
 
@@ -390,19 +821,41 @@ class Partitions:
         if processes < 2:
             result = [func(x, **kwargs) for x in self]
 
+        # Parallel, shared memory and output
+        elif (shared is True) and (same_length is True):
+            tasks = [(start, stop, a, b) for start, stop, (a, b)
+                     in zip(*self._locate(self._sorted), self.fbounds)]
+
+            # Output rows within functional bounds, in partition order
+            fstarts, fstops = self._locate_functional(self._sorted)
+            rows = np.concatenate([_partition_positions(self._order, start, stop)
+                                   for start, stop in zip(fstarts, fstops)])
+
+            result = _shared_map(func, kwargs, processes, tasks,
+                                 out=(self.split_on, rows),
+                                 a=(self.features, self._order))
+
+            return result.reset_index(drop=True)
+
+        # Parallel, shared memory
+        elif shared is True:
+            tasks = [(start, stop) for start, stop in zip(*self._locate(self._sorted))]
+            result = _shared_map(func, kwargs, processes, tasks,
+                                 a=(self.features, self._order))
+
         # Parallel
         else:
             with mp.Pool(processes=processes) as p:
                 result = list(p.imap(partial(func, **kwargs), self))
 
         # Reconcile overlap
-        result = [slice(result[i], by=self.split_on, low=a, high=b)
-                  for i, (a, b) in enumerate(self.fbounds)]
+        result = [res.loc[mask] if mask is not None else None
+                  for res, mask in zip(result, self._reconcile(result))]
 
         # Combine partitions
         return pd.concat(result).reset_index(drop=True)
 
-    def zipmap(self, func, b, processes=1, **kwargs):
+    def zipmap(self, func, b, processes=1, shared=False, **kwargs):
         '''
         Maps `func` to each partition pair resulting from the zip operation of
         `self` and `b`, then returns the combined result, accounting for
@@ -418,6 +871,10 @@ class Partitions:
         processes : int
             Number of parallel processes. If less than 2, a serial mapping is
             applied.
+        shared : bool
+            Signal whether to publish feature columns of both inputs to shared
+            memory once, such that parallel workers receive partition offsets
+            rather than pickled partitions. Requires numeric columns and index.
         kwargs
             Keyword arguments passed to `func`.
 
@@ -429,13 +886,20 @@ class Partitions:
         '''
 
         # Partition other dataset
-        partitions = (slice(b, by=self.split_on, low=a, high=b_)
-                      for a, b_ in self.bounds)
+        order, x = self._sort(b)
+        partitions = self._partitions(b, order, x)
 
         # Serial
         if processes < 2:
             result = [func(a, b_, **kwargs) for a, b_ in zip(self, partitions)]
 
+        # Parallel, shared memory
+        elif shared is True:
+            tasks = [(start, stop, start_b, stop_b) for start, stop, start_b, stop_b
+                     in zip(*self._locate(self._sorted), *self._locate(x))]
+            result = _shared_map(func, kwargs, processes, tasks,
+                                 a=(self.features, self._order), b=(b, order))
+
         # Parallel
         else:
             with mp.Pool(processes=processes) as p:
@@ -445,12 +909,9 @@ class Partitions:
         result = {'a': [x[0] for x in result], 'b': [x[1] for x in result]}
 
         # Reconcile overlap
-        tmp = [slice(result['a'][i], by=self.split_on, low=a, high=b_,
-                     return_index=True)
-               for i, (a, b_) in enumerate(self.fbounds)]
-
-        result['a'] = [x[0] for x in tmp]
-        idx = [x[1] for x in tmp]
+        idx = self._reconcile(result['a'])
+        result['a'] = [p.loc[i] if i is not None else None for p,
+                       i in zip(result['a'], idx)]
         result['b'] = [p.iloc[i, :] if i is not None else None for p,
                        i in zip(result['b'], idx)]
 
@@ -461,6 +922,240 @@ class Partitions:
         return result['a'], result['b']
 
 
+def _partition_rows(order, start, stop):
+    '''
+    Positional rows of a partition from `start` to `stop` in sorted order,
+    restored to original row order. Contiguous if `order` is None.
+
+    '''
+
+    if order is None:
+        return np.s_[start:stop]
+
+    return np.sort(order[start:stop])
+
+
+def _partition_positions(order, start, stop):
+    '''
+    Positional rows of a partition as an array, see :func:`_partition_rows`.
+
+    '''
+
+    if order is None:
+        return np.arange(start, stop)
+
+    return np.sort(order[start:stop])
+
+
+# Shared memory attached by each worker process
+_SHARED = {}
+
+
+def _share(features, order):
+    '''
+    Copies columns, index, and sort order of `features` into shared memory
+    blocks. Returns the blocks and a picklable spec to attach them.
+
+    '''
+
+    arrays = {'columns': {col: features[col].values for col in features.columns},
+              'index': features.index.values}
+    if order is not None:
+        arrays['order'] = order
+
+    # Extension arrays (e.g. nullable Int64) have no NumPy buffer
+    for col, x in list(arrays['columns'].items()) + [('index', arrays['index'])]:
+        if (not isinstance(x, np.ndarray)) or (x.dtype.kind not in 'biuf'):
+            raise ValueError('Shared memory requires numeric columns and index, '
+                             'got {} for "{}".'.format(x.dtype, col))
+
+    blocks = []
+    spec = {'index_name': features.index.name}
+
+    def publish(x):
+        name, dtype, shape = _allocate(x.shape, x.dtype, blocks)
+        np.ndarray(shape, dtype=dtype, buffer=blocks[-1].buf)[:] = x
+        return name, dtype, shape
+
+    spec['columns'] = {col: publish(x) for col, x in arrays['columns'].items()}
+    spec['index'] = publish(arrays['index'])
+    spec['order'] = publish(order) if order is not None else None
+
+    return blocks, spec
+
+
+def _allocate(shape, dtype, blocks):
+    '''
+    Creates a shared memory block for an array of `shape` and `dtype`,
+    appended to `blocks`. Returns its picklable spec.
+
+    '''
+
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) * dtype.itemsize
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    blocks.append(block)
+
+    return block.name, dtype.str, shape
+
+
+def _attach(spec):
+    '''
+    Attaches shared memory blocks described by `spec` in a worker process.
+
+    '''
+
+    return {'columns': {col: _attach_array(*x) for col, x in spec['columns'].items()},
+            'index': _attach_array(*spec['index']),
+            'index_name': spec['index_name'],
+            'order': _attach_array(*spec['order']) if spec['order'] is not None else None}
+
+
+def _attach_array(name, dtype, shape):
+    '''
+    Attaches a shared memory array in a worker process.
+
+    '''
+
+    block = shared_memory.SharedMemory(name=name)
+    _SHARED.setdefault('blocks', []).append(block)
+
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _shared_init(specs, func, kwargs, out=None):
+    '''
+    Worker initializer, attaches shared inputs and output, and stores the
+    mapped function.
+
+    '''
+
+    _SHARED['data'] = [_attach(spec) for spec in specs]
+    _SHARED['func'] = partial(func, **kwargs)
+
+    # Shared output
+    if out is None:
+        _SHARED['out'] = None
+    else:
+        _SHARED['out'] = {'split_on': out['split_on'],
+                          'columns': {col: _attach_array(*x)
+                                      for col, x in out['columns'].items()}}
+
+
+def _shared_frame(data, start, stop):
+    '''
+    Builds a partition from shared arrays by offsets into sorted order.
+
+    '''
+
+    # No data
+    if stop <= start:
+        return None
+
+    rows = _partition_rows(data['order'], start, stop)
+    index = pd.Index(data['index'][rows], name=data['index_name'])
+
+    return pd.DataFrame({col: x[rows] for col, x in data['columns'].items()},
+                        index=index)
+
+
+def _shared_task(task):
+    '''
+    Applies the mapped function to partitions given by offsets `task`.
+
+    '''
+
+    n = len(_SHARED['data'])
+    frames = [_shared_frame(data, *task[2 * i:2 * i + 2])
+              for i, data in enumerate(_SHARED['data'])]
+
+    result = _SHARED['func'](*frames)
+
+    # Return result
+    if _SHARED['out'] is None:
+        return result
+
+    # Write result to shared output
+    _shared_write(_SHARED['data'][0], frames[0], result, *task[:2],
+                  *task[2 * n:])
+
+
+def _shared_write(data, frame, result, start, stop, a, b):
+    '''
+    Writes rows of `result` within functional bounds `a` to `b` into shared
+    output, at the positions of the corresponding rows of input `frame`.
+
+    '''
+
+    # No data
+    if (frame is None) or (result is None):
+        return
+
+    # Check result matches input
+    if not result.index.equals(frame.index):
+        raise ValueError('Shared output requires `func` to return one row per '
+                         'input row, with input index.')
+
+    out = _SHARED['out']
+    rows = _partition_positions(data['order'], start, stop)
+
+    # Mask to functional bounds
+    x = frame[out['split_on']].values
+    mask = (x >= a) & (x <= b)
+    rows = rows[mask]
+
+    for col, y in out['columns'].items():
+        y[rows] = result[col].values[mask]
+
+
+def _shared_map(func, kwargs, processes, tasks, out=None, **inputs):
+    '''
+    Maps `func` over partition offsets `tasks` in a process pool, with input
+    features published once to shared memory. If `out`, a tuple of `split_on`
+    and output positions, is given, results are written to a preallocated
+    shared output shaped like the first input, then returned at those
+    positions.
+
+    '''
+
+    blocks = []
+    try:
+        specs = []
+        for features, order in inputs.values():
+            b, spec = _share(features, order)
+            blocks.extend(b)
+            specs.append(spec)
+
+        # Preallocate shared output like first input
+        if out is not None:
+            split_on, rows = out
+            features = next(iter(inputs.values()))[0]
+            out = {'split_on': split_on,
+                   'columns': {col: _allocate(features[col].shape,
+                                              features[col].dtype, blocks)
+                               for col in features.columns}}
+
+        with mp.Pool(processes=processes, initializer=_shared_init,
+                     initargs=(specs, func, kwargs, out)) as p:
+            result = list(p.imap(_shared_task, tasks))
+
+        # Return result
+        if out is None:
+            return result
+
+        # Gather shared output
+        named = {block.name: block for block in blocks}
+        return pd.DataFrame({col: np.ndarray(shape, dtype=dtype,
+                                             buffer=named[name].buf)[rows]
+                             for col, (name, dtype, shape)
+                             in out['columns'].items()})
+
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
 class MultiSamplePartitions:
     '''
     Generator object that will lazily build and return each partition constructed
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture()
+def make_lattice():
+    '''
+    Factory of synthetic features on a regular m/z, drift time, and retention
+    time lattice.
+
+    Returns
+    -------
+    function
+        Builds `n` features from lattice points of `shape`, drawn with or
+        without replacement, with integer intensities in [`low`, `high`) of
+        type `dtype`.
+
+    '''
+
+    def make(shape, n, low=1, high=1000, dtype=np.float32, replace=False):
+        rng = np.random.default_rng(0)
+        flat = rng.choice(np.prod(shape), n, replace=replace)
+        x, y, z = np.unravel_index(flat, shape)
+        return pd.DataFrame({'mz': x * 0.5 + 100,
+                             'drift_time': y * 0.25 + 10,
+                             'retention_time': z * 0.125 + 1,
+                             'intensity': rng.integers(low, high, n).astype(dtype)})
+
+    return make
+
+
+@pytest.fixture()
+def blobs():
+    '''
+    Dense two-dimensional grid of two Gaussian peaks, with apexes at m/z 104,
+    drift time 12 and m/z 111, drift time 11.
+
+    '''
+
+    x, y = np.meshgrid(np.arange(30), np.arange(20), indexing='ij')
+    intensity = 1000 * np.exp(-((x - 8) ** 2 + (y - 10) ** 2) / 8) \
+        + 500 * np.exp(-((x - 22) ** 2 + (y - 5) ** 2) / 8)
+    return pd.DataFrame({'mz': x.ravel() * 0.5 + 100,
+                         'drift_time': y.ravel() * 0.2 + 10,
+                         'intensity': intensity.ravel()})
@@ -32,6 +32,7 @@ def test_has_module(module):
                           ('collapse'),
                           ('locate'),
                           ('locate_asym'),
+                          ('locate_many'),
                           ('slice'),
                           ('partition'),
                           ('multi_sample_partition')])
@@ -76,10 +77,18 @@ def test_calibration_namespace(attr):
                           ('count'),
                           ('skew_pdf'),
                           ('kurtosis_pdf'),
+                          ('moments_pdf'),
+                          ('tiled'),
                           ('sparse_upper_star'),
+                          ('SparseLatticeOperator'),
+                          ('sparse_neighbors'),
+                          ('sparse_maximum_filter'),
+                          ('sparse_local_maxima'),
                           ('sparse_mean_filter'),
                           ('sparse_weighted_mean_filter'),
                           ('sparse_median_filter'),
+                          ('sparse_quantile_filter'),
+                          ('sparse_trimmed_mean_filter'),
                           ('smooth')])
 def test_filters_namespace(attr):
     assert hasattr(deimos.filters, attr)
@@ -116,6 +125,7 @@ def test_isotopes_namespace(attr):
 
 @pytest.mark.parametrize('attr',
                          [('local_maxima'),
+                          ('sparse_local_maxima'),
                           ('persistent_homology')])
 def test_peakpick_namespace(attr):
     assert hasattr(deimos.peakpick, attr)
@@ -135,7 +145,9 @@ def test_plot_namespace(attr):
                           ('collapse'),
                           ('locate'),
                           ('locate_asym'),
+                          ('locate_many'),
                           ('slice'),
+                          ('FeatureIndex'),
                           ('Partitions'),
                           ('partition'),
                           ('MultiSamplePartitions'),
@@ -162,6 +174,7 @@ def test_utils_namespace(attr):
                           (deimos.collapse, deimos.subset.collapse),
                           (deimos.locate, deimos.subset.locate),
                           (deimos.locate_asym, deimos.subset.locate_asym),
+                          (deimos.locate_many, deimos.subset.locate_many),
                           (deimos.slice, deimos.subset.slice),
                           (deimos.partition, deimos.subset.partition),
                           (deimos.multi_sample_partition, deimos.subset.multi_sample_partition)])
@@ -1,7 +1,8 @@
 import deimos
 import numpy as np
+import pandas as pd
 import pytest
-from scipy import signal
+from scipy import signal, stats
 
 
 @pytest.fixture()
@@ -24,11 +25,6 @@ def test_std(array, size, expected):
     assert (np.abs(result - expected) <= 1E-3).all()
 
 
-def test_std_pdf():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
-
-
 @pytest.mark.parametrize('array,size,expected',
                          [(np.arange(5.), 5, [2, 3, 4, 4, 4])])
 def test_maximum(array, size, expected):
@@ -43,6 +39,24 @@ def test_minimum(array, size, expected):
     assert (result == expected).all()
 
 
+@pytest.mark.parametrize('func,reduce',
+                         [('maximum', np.max),
+                          ('minimum', np.min)])
+@pytest.mark.parametrize('size',
+                         [([1, 1]),
+                          ([4, 7]),
+                          ([31, 2])])
+def test_extrema_footprint(func, reduce, size):
+    a = np.random.default_rng(0).random((20, 15))
+    result = getattr(deimos.filters, func)(a, size)
+
+    # Windows clipped to grid, matching constant padding
+    for i, j in np.ndindex(*a.shape):
+        window = a[max(i - size[0] // 2, 0):i + size[0] - size[0] // 2,
+                   max(j - size[1] // 2, 0):j + size[1] - size[1] // 2]
+        assert result[i, j] == reduce(window)
+
+
 @pytest.mark.parametrize('array,size,expected',
                          [(np.arange(5.), 5, [3., 6., 10., 10., 9.])])
 def test_sum(array, size, expected):
@@ -57,11 +71,6 @@ def test_mean(array, size, expected):
     assert (result == expected).all()
 
 
-def test_mean_pdf():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
-
-
 @pytest.mark.parametrize('array,size,expected',
                          [(np.arange(5.), 5, [0.43195254, 0.52385218, 0.5883779, 0.61199644, 0.58946036])])
 def test_matched_gaussian(array, size, expected):
@@ -76,36 +85,508 @@ def test_count(array, size, expected):
     assert (result == expected).all()
 
 
-def test_skew_pdf():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
-    
+@pytest.fixture()
+def pdf():
+    rng = np.random.default_rng(0)
+    a = rng.random((12, 9)) + 0.1
+    edges = [np.cumsum(rng.random(12)) + 500, np.linspace(1, 3, 9)]
+    return edges, a
+
+
+def _moments_reference(edges, a, size):
+    # Explicit weighted moments over each padded window
+    pad = [(s // 2, s - s // 2 - 1) for s in size]
+    a = np.pad(a, pad)
+    edges = [np.pad(e, p) for e, p in zip(edges, pad)]
+
+    res = {k: [np.empty(a.shape) for e in edges] for k in [1, 2, 3, 4]}
+    for j in np.ndindex(*[len(e) - np.sum(p) for e, p in zip(edges, pad)]):
+        sl = tuple(slice(x, x + s) for x, s in zip(j, size))
+        w = a[sl] / a[sl].sum()
+        grids = np.meshgrid(*[e[x] for e, x in zip(edges, sl)], indexing='ij')
+        for i, g in enumerate(grids):
+            mu = np.sum(w * g)
+            var = np.sum(w * (g - mu) ** 2)
+            res[1][i][j] = mu
+            res[2][i][j] = np.sqrt(var)
+            res[3][i][j] = np.sum(w * (g - mu) ** 3) / var ** 1.5
+            res[4][i][j] = np.sum(w * (g - mu) ** 4) / var ** 2 - 3
+
+    shape = tuple(len(e) - np.sum(p) for e, p in zip(edges, pad))
+    return {k: [x[tuple(slice(0, n) for n in shape)] for x in v]
+            for k, v in res.items()}
+
+
+@pytest.mark.parametrize('size',
+                         [([3, 3]),
+                          ([4, 3]),
+                          ([5, 3])])
+def test_moments_pdf(pdf, size):
+    edges, a = pdf
+    expected = _moments_reference(edges, a, size)
+    result = deimos.filters.moments_pdf(edges, a, size)
+
+    assert set(result.keys()) == {1, 2, 3, 4}
+    for k in result:
+        for r, e in zip(result[k], expected[k]):
+            assert r.shape == a.shape
+            assert np.allclose(r, e, rtol=1E-6, atol=1E-8)
+
+    # Reduced precision
+    result = deimos.filters.moments_pdf(edges, a, size, orders=[1, 2],
+                                        dtype=np.float32)
+    assert set(result.keys()) == {1, 2}
+    for k in result:
+        for r, e in zip(result[k], expected[k]):
+            assert r.dtype == np.float32
+            assert np.allclose(r, e, rtol=1E-4, atol=1E-4)
+
+
+@pytest.mark.parametrize('size',
+                         [([5, 3]),
+                          ([37, 4])])
+def test_moments_pdf_blocks(size):
+    # Long axis, far from zero, spanning several local origins
+    rng = np.random.default_rng(0)
+    edges = [np.sort(rng.uniform(100, 1000, 300)), np.linspace(0, 30, 5)]
+    a = rng.gamma(2, 500, (300, 5))
+    a[a < 500] = 0
+
+    # Windows with weight at a single position are undefined beyond order 2
+    with np.errstate(invalid='ignore'):
+        expected = _moments_reference(edges, a, size)
+    result = deimos.filters.moments_pdf(edges, a, size)
+
+    for k in result:
+        for r, e in zip(result[k], expected[k]):
+            assert np.allclose(r, e, rtol=1E-6, atol=1E-6, equal_nan=True)
+
+    result = deimos.filters.moments_pdf(edges, a, size, orders=[1, 2],
+                                        dtype=np.float32)
+    for k in result:
+        for r, e in zip(result[k], expected[k]):
+            assert np.allclose(r, e, rtol=1E-4, atol=1E-3, equal_nan=True)
+
+
+@pytest.mark.parametrize('orders',
+                         [(0),
+                          ([2, 5])])
+def test_moments_pdf_fail(pdf, orders):
+    edges, a = pdf
+    with pytest.raises(ValueError):
+        deimos.filters.moments_pdf(edges, a, 3, orders=orders)
+
+
+@pytest.mark.parametrize('func,order',
+                         [('mean_pdf', 1),
+                          ('std_pdf', 2),
+                          ('skew_pdf', 3),
+                          ('kurtosis_pdf', 4)])
+def test_moment_pdf_filters(pdf, func, order):
+    edges, a = pdf
+    expected = _moments_reference(edges, a, [3, 3])[order]
+    result = getattr(deimos.filters, func)(edges, a, 3)
+
+    assert len(result) == 2
+    for r, e in zip(result, expected):
+        assert np.allclose(r, e, rtol=1E-6, atol=1E-8)
+
+
+@pytest.mark.parametrize('func,size,tile_shape,workers',
+                         [('maximum', [5, 3, 7], [10, 7, 50], 1),
+                          ('minimum', 4, 8, 2),
+                          ('sum', [3, 3, 3], 8, 1),
+                          ('mean', [2, 5, 3], [10, 7, 50], 2),
+                          ('std', [5, 3, 3], 8, 1),
+                          ('matched_gaussian', [1, 0.5, 2], [10, 7, 50], 2),
+                          ('count', 3, None, 1)])
+def test_tiled(func, size, tile_shape, workers):
+    rng = np.random.default_rng(0)
+    a = rng.random((53, 41, 37))
+    a[a < 0.7] = 0
+
+    func = getattr(deimos.filters, func)
+    expected = func(a, size)
+    result = deimos.filters.tiled(func, a, size, tile_shape=tile_shape,
+                                  workers=workers)
+
+    assert result.shape == expected.shape
+    assert np.allclose(result, expected, atol=1E-6)
+
+
+def test_tiled_memmap(g3d, tmp_path):
+    a = np.memmap(tmp_path / 'a.dat', dtype=float, mode='w+', shape=g3d.shape)
+    a[:] = g3d
+    out = np.memmap(tmp_path / 'out.dat', dtype=float, mode='w+', shape=g3d.shape)
+
+    result = deimos.filters.tiled(deimos.filters.maximum, a, [5, 3, 5],
+                                  tile_shape=16, out=out)
+
+    assert result is out
+    assert np.array_equal(out, deimos.filters.maximum(g3d, [5, 3, 5]))
+
+
+@pytest.mark.parametrize('tile_shape,halo',
+                         [([10, 10], None),
+                          (0, None),
+                          (10, [1, 2])])
+def test_tiled_fail(g3d, tile_shape, halo):
+    with pytest.raises(ValueError):
+        deimos.filters.tiled(deimos.filters.maximum, g3d, 3,
+                             tile_shape=tile_shape, halo=halo)
+
+
+def _upper_star_reference(idx, V):
+    # Sequential union-find over points by descending intensity
+    order = np.argsort(-V, kind='stable')
+    rank = np.empty(len(V), dtype=int)
+    rank[order] = np.arange(len(V))
+
+    dist = np.abs(idx[:, None, :] - idx[None, :, :]).max(axis=-1)
+    root = {}
+    persistence = {}
+
+    def find(x):
+        while root[x] != x:
+            x = root[x]
+        return x
+
+    for i in order:
+        root[i] = i
+        roots = sorted({find(j) for j in np.flatnonzero(dist[i] <= 1)
+                        if j != i and j in root}, key=lambda x: rank[x])
+
+        if len(roots) == 0:
+            persistence[i] = V[i] - V.min()
+            continue
+
+        for r in roots[1:]:
+            persistence[r] = V[r] - V[i]
+            root[r] = roots[0]
+        root[i] = roots[0]
+
+    return persistence
 
-def test_kurtosis_pdf():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
-    
 
 def test_sparse_upper_star():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
+    idx = np.arange(6).reshape(-1, 1)
+    V = np.array([1, 5, 2, 4, 0, 3.5])
+
+    pidx, pers, labels = deimos.filters.sparse_upper_star(idx, V,
+                                                          return_labels=True)
+
+    assert pidx.tolist() == [1, 3, 5]
+    assert pers.tolist() == [5, 2, 3.5]
+    assert labels.tolist() == [1, 1, 1, 3, 3, 5]
+
+
+@pytest.mark.parametrize('seed',
+                         [(0),
+                          (1),
+                          (2)])
+def test_sparse_upper_star_reference(seed):
+    rng = np.random.default_rng(seed)
+    idx = np.argwhere(rng.random((12, 10, 3)) < 0.7)
+
+    # Ties included
+    V = rng.integers(0, 20, len(idx)).astype(float)
+
+    pidx, pers = deimos.filters.sparse_upper_star(idx, V)
+
+    assert dict(zip(pidx.tolist(), pers.tolist())) == _upper_star_reference(idx, V)
+
+
+@pytest.fixture()
+def lattice():
+    rng = np.random.default_rng(0)
+    idx = np.argwhere(rng.random((15, 12)) < 0.6).astype(np.float32)
+    V = rng.uniform(1, 100, len(idx)).astype(np.float32)
+    return idx, V
+
+
+def _neighbors(idx, radius):
+    # Dense neighbor mask under scaled Chebyshev distance
+    scale = np.array([2 if r < 1 else 1 / r for r in radius])
+    scaled = idx * scale
+    return np.abs(scaled[:, None, :] - scaled[None, :, :]).max(axis=-1) <= 1
+
+
+@pytest.mark.parametrize('backend',
+                         [('lattice'),
+                          ('kdtree')])
+@pytest.mark.parametrize('radius,pindex,half',
+                         [([0, 1], None, False),
+                          ([1, 1], None, True),
+                          ([2.5, 0.5], None, False),
+                          ([3, 2], None, True),
+                          ([1, 2], np.array([5, 0, 9]), False)])
+@pytest.mark.parametrize('duplicates',
+                         [(False),
+                          (True)])
+def test_sparse_neighbors(lattice, backend, radius, pindex, half, duplicates):
+    idx, V = lattice
+    if duplicates:
+        idx = np.concatenate((idx, idx[::4]))
+
+    mask = _neighbors(idx, radius)
+    if half:
+        mask = np.triu(mask, k=1)
+    if pindex is not None:
+        mask = mask[pindex]
+
+    I, J = deimos.filters.sparse_neighbors(idx, radius=radius, pindex=pindex,
+                                           half=half, backend=backend)
+
+    # Each pair found once
+    assert len(I) == mask.sum()
+    if half:
+        I, J = np.minimum(I, J), np.maximum(I, J)
+    res = np.zeros_like(mask)
+    res[I, J] = True
+    assert np.array_equal(res, mask)
+
+
+@pytest.mark.parametrize('radius',
+                         [([1, 1]),
+                          ([2.5, 0.5])])
+def test_sparse_neighbors_noninteger(lattice, radius):
+    idx, V = lattice
+    idx = idx * 0.75 + 0.25
+
+    # Falls back to KD-tree
+    mask = _neighbors(idx, radius)
+    I, J = deimos.filters.sparse_neighbors(idx, radius=radius)
+
+    res = np.zeros_like(mask)
+    res[I, J] = True
+    assert len(I) == mask.sum()
+    assert np.array_equal(res, mask)
+
+    # Public filters accept non-integer coordinates
+    mean = deimos.filters.sparse_mean_filter(idx, V, radius=radius)
+    assert np.allclose(mean, mask @ V / mask.sum(axis=1))
+
+    mean = deimos.filters.sparse_weighted_mean_filter(idx, V, np.ones_like(V),
+                                                      radius=radius)
+    assert np.allclose(mean, mask @ V / mask.sum(axis=1))
+
+    median = deimos.filters.sparse_median_filter(idx, V, radius=radius)
+    assert np.allclose(median, [np.median(V[m]) for m in mask])
+
+
+def test_sparse_neighbors_fail(lattice):
+    idx, V = lattice
+
+    with pytest.raises(ValueError):
+        deimos.filters.sparse_neighbors(idx, radius=[1, 1], pindex=[0], half=True)
+
+    with pytest.raises(ValueError):
+        deimos.filters.sparse_neighbors(idx, radius=[1, 1], backend='octree')
+
+
+@pytest.mark.parametrize('radius',
+                         [([2, 1, 3]),
+                          ([0, 1, 1]),
+                          ([5, 0, 2])])
+@pytest.mark.parametrize('fill',
+                         [(0.05),
+                          (0.5)])
+def test_sparse_maximum_filter(radius, fill):
+    rng = np.random.default_rng(1)
+    shape = (30, 20, 25)
+    flat = rng.choice(np.prod(shape), int(fill * np.prod(shape)), replace=False)
+    idx = np.column_stack(np.unravel_index(flat, shape)).astype(np.float32)
+    V = rng.integers(1, 50, len(flat)).astype(float)
+
+    # Dense reference
+    H = np.zeros(shape)
+    H[tuple(idx.astype(int).T)] = V
+    expected = deimos.filters.maximum(H, [2 * r + 1 for r in radius])
+    expected = expected[tuple(idx.astype(int).T)]
+
+    result = deimos.filters.sparse_maximum_filter(idx, V, radius=radius)
+    assert np.array_equal(result, expected)
+
+    result = deimos.filters.sparse_local_maxima(idx, V, radius=radius)
+    assert np.array_equal(result, V >= expected)
+
+
+def test_sparse_maximum_filter_large():
+    # Too large to linearize, neighbors by KD-tree
+    idx = np.array([[0, 0], [1, 1], [2 ** 40, 2 ** 40]], dtype=float)
+    V = np.array([1.0, 2.0, 0.5])
+
+    result = deimos.filters.sparse_maximum_filter(idx, V, radius=[1, 1])
+    assert result.tolist() == [2.0, 2.0, 0.5]
+
+    result = deimos.filters.sparse_local_maxima(idx, V, radius=[1, 1])
+    assert result.tolist() == [False, True, True]
+
+
+@pytest.mark.parametrize('radius',
+                         [([0, 1]),
+                          ([1, 1]),
+                          ([2, 0])])
+def test_sparse_mean_filter(lattice, radius):
+    idx, V = lattice
+    mask = _neighbors(idx, radius)
+
+    expected = (mask * V).sum(axis=1) / mask.sum(axis=1)
+    res = deimos.filters.sparse_mean_filter(idx, V, radius=radius)
+
+    assert res.dtype == V.dtype
+    assert np.allclose(res, expected, rtol=1E-5)
+
+
+@pytest.mark.parametrize('pindex',
+                         [(None),
+                          (np.array([3, 0, 17]))])
+def test_sparse_weighted_mean_filter(lattice, pindex):
+    idx, V = lattice
+    mask = _neighbors(idx, [2, 1])
+    if pindex is not None:
+        mask = mask[pindex]
+
+    expected = (mask @ (V[:, None] * idx)) / (mask @ V)[:, None]
+    res = deimos.filters.sparse_weighted_mean_filter(idx, idx, V, radius=[2, 1],
+                                                     pindex=pindex)
+
+    assert res.shape == expected.shape
+    assert np.allclose(res, expected, rtol=1E-5)
+
+
+def test_sparse_weighted_mean_filter_columns(lattice):
+    idx, V = lattice
+    op = deimos.filters.SparseLatticeOperator(idx, radius=[2, 1])
+
+    res = op.weighted_mean(idx, V)
+
+    for i in range(idx.shape[1]):
+        assert np.allclose(res[:, i], op.weighted_mean(idx[:, i], V))
+
+
+@pytest.mark.parametrize('workers',
+                         [(1),
+                          (3)])
+def test_sparse_median_filter(lattice, workers):
+    idx, V = lattice
+    mask = _neighbors(idx, [1, 1])
+
+    expected = [np.median(V[x]) for x in mask]
+    res = deimos.filters.sparse_median_filter(idx, V, radius=[1, 1],
+                                              workers=workers)
+
+    assert np.allclose(res, expected)
+
+
+@pytest.mark.parametrize('q',
+                         [(0),
+                          (0.1),
+                          (0.75),
+                          (1)])
+def test_sparse_quantile_filter(lattice, q):
+    idx, V = lattice
+    mask = _neighbors(idx, [2, 1])
+
+    expected = [np.quantile(V[x], q) for x in mask]
+    res = deimos.filters.sparse_quantile_filter(idx, V, q=q, radius=[2, 1])
+
+    assert np.allclose(res, expected)
+
+
+@pytest.mark.parametrize('proportion',
+                         [(0),
+                          (0.2),
+                          (0.4)])
+def test_sparse_trimmed_mean_filter(lattice, proportion):
+    idx, V = lattice
+    mask = _neighbors(idx, [2, 1])
+
+    expected = [stats.trim_mean(V[x], proportion) for x in mask]
+    res = deimos.filters.sparse_trimmed_mean_filter(idx, V, proportion=proportion,
+                                                    radius=[2, 1], workers=2)
+
+    assert np.allclose(res, expected)
+
+
+def test_sparse_order_statistic_fail(lattice):
+    idx, V = lattice
+    op = deimos.filters.SparseLatticeOperator(idx, radius=[1, 1])
+
+    with pytest.raises(ValueError):
+        op.quantile(V, q=1.5)
+
+    with pytest.raises(ValueError):
+        op.trimmed_mean(V, proportion=0.5)
+
+
+def test_sparse_lattice_operator(lattice):
+    idx, V = lattice
+    op = deimos.filters.SparseLatticeOperator(idx, radius=[1, 1])
+
+    # Iterations match repeated filtration
+    expected = V
+    for i in range(3):
+        expected = deimos.filters.sparse_mean_filter(idx, expected, radius=[1, 1])
+
+    assert op.shape == (len(V), len(V))
+    assert np.allclose(op.mean(V, iterations=3), expected, rtol=1E-5)
+
+    # Subset operator cannot iterate
+    op = deimos.filters.SparseLatticeOperator(idx, radius=[1, 1],
+                                              pindex=np.array([0, 1]))
+    assert op.shape == (2, len(V))
+
+    with pytest.raises(ValueError):
+        op.mean(V, iterations=2)
+
+
+@pytest.mark.parametrize('atol',
+                         [(0),
+                          (1E-2),
+                          (1.0)])
+def test_sparse_lattice_operator_active(atol):
+    # Isolated points and one dense cluster
+    rng = np.random.default_rng(0)
+    isolated = np.column_stack([np.arange(0, 600, 3), np.zeros(200)])
+    cluster = np.stack(np.meshgrid(np.arange(5), np.arange(5), indexing='ij'),
+                       axis=-1).reshape(-1, 2) + [1000, 0]
+    idx = np.vstack([isolated, cluster]).astype(np.float32)
+    V = rng.random(len(idx)) * 100
+
+    op = deimos.filters.SparseLatticeOperator(idx, radius=[1, 1])
+    expected = op.mean(V, iterations=6)
+    result, counts = op.mean(V, iterations=6, atol=atol, return_active=True)
+
+    # First iteration full, then cluster only
+    assert counts[0] == len(V)
+    assert (counts[1:] <= 25).all()
+    assert np.array_equal(result[:200], V[:200])
+    assert np.allclose(result, expected, atol=6 * atol)
+
+    # Exact without tolerance
+    if atol == 0:
+        assert len(counts) == 6
+        assert np.allclose(result, expected, rtol=1E-6)
+
 
+def test_smooth(lattice):
+    idx, V = lattice
+    features = pd.DataFrame({'mz': idx[:, 0] * 0.5 + 100,
+                             'drift_time': idx[:, 1] * 0.2 + 10,
+                             'intensity': V})
 
-def test_sparse_mean_filter():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
-    
+    res = deimos.filters.smooth(features, dims=['mz', 'drift_time'],
+                                radius=[1, 1], iterations=3)
+    expected = deimos.filters.SparseLatticeOperator(idx, radius=[1, 1]).mean(V, iterations=3)
 
-def test_sparse_weighted_mean_filter():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
-    
+    assert np.allclose(res['intensity'].values, expected)
+    assert np.array_equal(res['mz'].values, features['mz'].values)
 
-def test_sparse_median_filter():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
-    
+    res, counts = deimos.filters.smooth(features, dims=['mz', 'drift_time'],
+                                        radius=[1, 1], iterations=3, atol=0,
+                                        return_active=True)
 
-def test_smooth():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
+    assert np.allclose(res['intensity'].values, expected)
+    assert len(counts) <= 3
+    assert counts[0] == len(V)
@@ -58,3 +58,23 @@ def test_grid2df(ms1, dims, additional):
     # Check length
     assert len(df.loc[df['intensity'] > 0, :].index) == len(
         ms1.loc[ms1['intensity'] > 0, :].index)
+
+
+@pytest.mark.parametrize('dims',
+                         [(['mz', 'drift_time']),
+                          (['retention_time'])])
+def test_data2grid_collapse(make_lattice, dims):
+    features = make_lattice((50, 10, 20), 2000, high=100, dtype=float,
+                            replace=True)
+    features.loc[::50, 'intensity'] = np.nan
+
+    edges, grid = deimos.grid.data2grid(features, dims=dims)
+
+    # Summed across omitted dimensions
+    collapsed = deimos.collapse(features, keep=dims, how=np.sum)
+    idx = tuple(np.searchsorted(edge, collapsed[d].values)
+                for edge, d in zip(edges, dims))
+
+    assert np.allclose(grid[idx], collapsed['intensity'].values)
+    assert np.isclose(grid.sum(), features['intensity'].sum())
+    assert not np.isnan(grid).any()
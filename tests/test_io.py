@@ -1,6 +1,9 @@
+import gzip
 import os
+import shutil
 
 import deimos
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -19,9 +22,126 @@ def ms2():
                        key='ms2')
 
 
-def test_load_mzml():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
+@pytest.fixture()
+def mzml():
+    return deimos.load(localfile('resources/example_data.mzML'),
+                       accession={'drift_time': 'MS:1002476',
+                                  'retention_time': 'MS:1000016'})
+
+
+def test_load_mzml(mzml):
+    assert type(mzml) is dict
+    assert set(mzml.keys()) == {'ms1', 'ms2'}
+
+    for k, v in mzml.items():
+        assert type(v) is pd.DataFrame
+
+        for col in ['frame', 'scan', 'mz', 'drift_time',
+                    'retention_time', 'intensity']:
+            assert col in v.columns
+
+    assert 'precursor_mz' in mzml['ms2'].columns
+    assert len(mzml['ms1'].index) == 58
+    assert len(mzml['ms2'].index) == 49
+
+
+@pytest.mark.parametrize('dtype,expected',
+                         [(None, {'frame': np.uint32, 'scan': np.uint32,
+                                  'mz': np.float64, 'intensity': np.float32,
+                                  'drift_time': np.float32,
+                                  'precursor_mz': np.float64}),
+                          (np.float32, {'frame': np.float32, 'scan': np.float32,
+                                        'mz': np.float32, 'intensity': np.float32,
+                                        'drift_time': np.float32,
+                                        'precursor_mz': np.float32}),
+                          ({'mz': np.float32, 'scan': np.int64},
+                           {'frame': np.uint32, 'scan': np.int64,
+                            'mz': np.float32, 'intensity': np.float32,
+                            'drift_time': np.float32,
+                            'precursor_mz': np.float64})])
+def test_load_mzml_dtype(mzml, dtype, expected):
+    data = deimos.load(localfile('resources/example_data.mzML'),
+                       accession={'drift_time': 'MS:1002476',
+                                  'retention_time': 'MS:1000016'},
+                       dtype=dtype)
+
+    for col, dt in expected.items():
+        assert data['ms2'][col].dtype == dt
+
+    # Values match default policy up to precision
+    for k in mzml.keys():
+        for col in mzml[k].columns:
+            assert np.allclose(data[k][col].values, mzml[k][col].values)
+
+
+def test_load_mzml_workers(mzml):
+    parallel = deimos.load(localfile('resources/example_data.mzML'),
+                           accession={'drift_time': 'MS:1002476',
+                                      'retention_time': 'MS:1000016'},
+                           workers=2)
+
+    assert parallel.keys() == mzml.keys()
+
+    for k in mzml.keys():
+        assert parallel[k].equals(mzml[k])
+
+
+def test_load_mzml_workers_gz(mzml, tmp_path):
+    path = os.path.join(tmp_path, 'example_data.mzML.gz')
+    with open(localfile('resources/example_data.mzML'), 'rb') as f_in:
+        with gzip.open(path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+    with pytest.warns(UserWarning, match='uncompressed'):
+        res = deimos.load(path, accession={'drift_time': 'MS:1002476',
+                                           'retention_time': 'MS:1000016'},
+                          workers=2)
+
+    for k in mzml.keys():
+        assert res[k].equals(mzml[k])
+
+
+@pytest.mark.parametrize('chunk_rows,workers',
+                         [(1, 1),
+                          (20, 1),
+                          (1E7, 1),
+                          (20, 2)])
+def test_iter_mzml(mzml, chunk_rows, workers):
+    chunks = {}
+    for k, v in deimos.io.iter_mzml(localfile('resources/example_data.mzML'),
+                                    accession={'drift_time': 'MS:1002476',
+                                               'retention_time': 'MS:1000016'},
+                                    chunk_rows=chunk_rows,
+                                    workers=workers):
+        assert type(v) is pd.DataFrame
+        chunks.setdefault(k, []).append(v)
+
+    assert chunks.keys() == mzml.keys()
+
+    for k in mzml.keys():
+        if chunk_rows > len(mzml[k].index):
+            assert len(chunks[k]) == 1
+
+        combined = pd.concat(chunks[k])
+        assert combined.equals(mzml[k])
+
+        # Index continues across chunks
+        assert combined.index.equals(pd.RangeIndex(len(mzml[k].index)))
+
+
+def test_iter_mzml_append(mzml, tmp_path):
+    path = os.path.join(tmp_path, 'test_append.h5')
+    for k, v in deimos.io.iter_mzml(localfile('resources/example_data.mzML'),
+                                    accession={'drift_time': 'MS:1002476',
+                                               'retention_time': 'MS:1000016'},
+                                    chunk_rows=20):
+        deimos.save(path, v, key=k, mode='a', append=True)
+
+    for k in mzml.keys():
+        loaded = deimos.load(path, key=k)
+
+        assert loaded.index.is_unique
+        assert np.array_equal(loaded.values, mzml[k].values)
 
 
 def test_save(ms1, ms2):
@@ -45,26 +165,220 @@ def test_load(ms1, ms2):
     assert len(ms2.index) == 1991829
 
 
-def test_load_hdf_multi():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
+@pytest.mark.parametrize('ext,data_columns',
+                         [('.h5', None),
+                          ('.h5', ['mz']),
+                          ('.h5', 'detect'),
+                          ('.deimos', None)])
+def test_load_where(mzml, tmp_path, ext, data_columns):
+    path = os.path.join(tmp_path, 'test_where' + ext)
 
+    data = mzml['ms1'].sort_values(by='mz', ignore_index=True)
+    if ext == '.h5':
+        deimos.save(path, data, key='ms1', data_columns=data_columns)
+    else:
+        deimos.save(path, data, key='ms1')
 
-def test_save_mgf():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
+    where = {'mz': (200, 800), 'scan': (2, 4)}
+    expected = data.loc[(data['mz'] >= 200) & (data['mz'] <= 800)
+                        & (data['scan'] >= 2) & (data['scan'] <= 4)]
 
+    loaded = deimos.load(path, key='ms1', where=where)
+    assert np.array_equal(loaded.values, expected.values)
 
-def test_build_factors():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
+    # Open-ended bounds
+    for lb, ub in [(500, np.inf), (-np.inf, 500)]:
+        loaded = deimos.load(path, key='ms1', where={'mz': (lb, ub)})
+        assert np.array_equal(loaded.values,
+                              data.loc[(data['mz'] >= lb) & (data['mz'] <= ub)].values)
 
+    loaded = deimos.load(path, key='ms1', columns=['intensity'], where=where)
+    assert list(loaded.columns) == ['intensity']
+    assert np.array_equal(loaded['intensity'].values,
+                          expected['intensity'].values)
 
-def test_build_index():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
+
+@pytest.mark.parametrize('kwargs,complib,complevel',
+                         [({}, 'blosc', 5),
+                          ({'profile': 'fast-write'}, 'blosc:lz4', 1),
+                          ({'profile': 'balanced'}, 'blosc:zstd', 3),
+                          ({'profile': 'archive'}, 'blosc:zstd', 7),
+                          ({'profile': 'archive', 'complevel': 5}, 'blosc:zstd', 5),
+                          ({'complib': 'blosc:lz4hc', 'threads': 2}, 'blosc:lz4hc', 5)])
+def test_save_hdf_profile(mzml, tmp_path, kwargs, complib, complevel):
+    path = os.path.join(tmp_path, 'test_profile.h5')
+    deimos.save(path, mzml['ms1'], key='ms1', **kwargs)
+
+    with pd.HDFStore(path, mode='r') as store:
+        filters = store.get_storer('ms1').table.filters
+        assert filters.complib == complib
+        assert filters.complevel == complevel
+
+    assert deimos.load(path, key='ms1').equals(mzml['ms1'])
+
+
+def test_save_hdf_profile_fail(mzml, tmp_path):
+    with pytest.raises(ValueError):
+        deimos.save(os.path.join(tmp_path, 'test_profile.h5'), mzml['ms1'],
+                    key='ms1', profile='fastest')
+
+
+def test_save_load_deimos(mzml, tmp_path):
+    path = os.path.join(tmp_path, 'test_save.deimos')
+
+    for k, v in mzml.items():
+        deimos.save(path, v, key=k)
+
+    for k, v in mzml.items():
+        loaded = deimos.load(path, key=k)
+
+        assert type(loaded) is pd.DataFrame
+        assert loaded.equals(v)
+
+    # Subset columns
+    loaded = deimos.load(path, key='ms1', columns=['mz', 'intensity'])
+    assert list(loaded.columns) == ['mz', 'intensity']
+    assert isinstance(loaded['mz'].values, np.memmap)
+
+    # Overwrite key
+    deimos.save(path, mzml['ms1'].iloc[:5], key='ms1')
+    assert len(deimos.load(path, key='ms1').index) == 5
+
+
+def test_save_deimos_fail(tmp_path):
+    with pytest.raises(ValueError):
+        deimos.save(os.path.join(tmp_path, 'test_save.deimos'),
+                    pd.DataFrame({'mz': [1.0], 'label': ['a']}))
+
+
+def test_load_hdf_multi(mzml, tmp_path):
+    paths = [os.path.join(tmp_path, 'sample_{}.h5'.format(i)) for i in range(3)]
+    for path in paths:
+        deimos.save(path, mzml['ms1'], key='ms1')
+
+    meta = {'batch': ['a', 'b', 'a'], 'dose': [1.0, None, 2.0]}
+    data = deimos.load(paths, key='ms1', meta=meta, chunksize=20)
+
+    assert data['sample_idx'].dtype == np.uint8
+    for col in ['sample_id', 'batch', 'dose']:
+        assert isinstance(data[col].dtype, pd.CategoricalDtype)
+        assert data[col].cat.known
+
+    data = data.compute()
+    n = len(mzml['ms1'].index)
+
+    assert len(data.index) == 3 * n
+    assert data['sample_idx'].tolist() == [0] * n + [1] * n + [2] * n
+    assert data['sample_id'].tolist() == ['sample_0'] * n + ['sample_1'] * n + ['sample_2'] * n
+    assert list(data['batch'].cat.categories) == ['a', 'b']
+    assert data['batch'].tolist() == ['a'] * n + ['b'] * n + ['a'] * n
+    assert data['dose'].isna().sum() == n
+
+
+@pytest.fixture()
+def pairs():
+    return pd.DataFrame({'index_ms1': [2, 0, 1, 0, 2, 2, 1, 0],
+                         'mz_ms1': [300.5, 100.25, 200.0, 100.25, 300.5, 300.5, 200.0, 100.25],
+                         'mz_ms2': [50.5, 60.5, 70.5, 80.5, 90.5, 95.5, 99.5, 42.0],
+                         'intensity_ms2': [1, 2, 3, 4, 5, 6, 7, 8]})
+
+
+@pytest.mark.parametrize('ext,header,entry',
+                         [('.mgf', 'BEGIN IONS', 'PEPMASS={}\n'),
+                          ('.msp', 'PRECURSORMZ', 'PRECURSORMZ: {}\n')])
+def test_save_mgf_msp(pairs, tmp_path, ext, header, entry):
+    path = os.path.join(tmp_path, 'test_save' + ext)
+    deimos.save(path, pairs)
+
+    with open(path, 'r') as f:
+        contents = f.read()
+
+    # One spectrum per group, in group order
+    assert contents.count(header) == 3
+    positions = [contents.index(entry.format(x)) for x in [100.25, 200.0, 300.5]]
+    assert positions == sorted(positions)
+
+    # Fragments in input order within group
+    assert '60.5\t2\n80.5\t4\n42.0\t8\n' in contents
+
+    if ext == '.msp':
+        assert contents.count('Num Peaks: 3') == 2
+        assert contents.count('Num Peaks: 2') == 1
+
+    # Chunked input, groups split across chunks
+    chunked = os.path.join(tmp_path, 'test_save_chunked' + ext)
+    pairs = pairs.sort_values(by='index_ms1', kind='mergesort')
+    deimos.save(chunked, (pairs.iloc[i:i + 3] for i in range(0, 8, 3)))
+
+    with open(chunked, 'r') as f:
+        assert f.read() == contents
+
+
+def test_build_factors(mzml):
+    dims = ['mz', 'drift_time', 'retention_time']
+    factors = deimos.build_factors(mzml['ms1'], dims=dims)
+
+    for dim in dims:
+        assert factors[dim].dtype == mzml['ms1'][dim].dtype
+        assert np.array_equal(factors[dim], np.unique(mzml['ms1'][dim].values))
+
+
+@pytest.mark.parametrize('dtype',
+                         [(None),
+                          (np.float32)])
+def test_build_index(mzml, dtype):
+    dims = ['mz', 'drift_time', 'retention_time']
+    data = mzml['ms1']
+    assert data['mz'].dtype == np.float64
+
+    factors = deimos.build_factors(data, dims=dims)
+    if dtype is not None:
+        factors = {k: v.astype(dtype) for k, v in factors.items()}
+
+    index = deimos.build_index(data, factors)
+
+    # Each value indexes its own factor
+    for dim in dims:
+        x = data[dim].values.astype(factors[dim].dtype)
+        assert np.array_equal(factors[dim][index[dim].astype(int)], x)
 
 
 def test_get_accessions():
     with pytest.raises(NotImplementedError):
         raise NotImplementedError
+
+
+@pytest.mark.parametrize('ext',
+                         [('.mgf'),
+                          ('.msp')])
+def test_load_mgf_msp(pairs, tmp_path, ext):
+    path = os.path.join(tmp_path, 'test_load' + ext)
+    deimos.save(path, pairs)
+
+    for chunk_size in [2 ** 26, 64]:
+        data = deimos.io._read_spectra(path, fmt=ext[1:], chunk_size=chunk_size)
+        spectra = data['spectra']
+        peaks = data['peaks']
+
+        assert len(spectra.index) == 3
+        assert spectra['num_peaks'].tolist() == [3, 2, 3]
+        assert spectra['offset'].tolist() == [0, 3, 5]
+        assert peaks['mz'].tolist() == [60.5, 80.5, 42.0, 70.5, 99.5, 50.5, 90.5, 95.5]
+        assert peaks['intensity'].tolist() == [2, 4, 8, 3, 7, 1, 5, 6]
+
+
+def test_load_msp_annotated(tmp_path):
+    path = os.path.join(tmp_path, 'test_annotated.msp')
+    with open(path, 'w') as f:
+        f.write('Name: A\r\nPrecursorMZ: 100.5\r\nNum Peaks: 2\r\n'
+                '50 10 "b2/0.1"\r\n60.5 20 "y1"\r\n\r\n'
+                'Name: B\nPrecursorMZ: 200\nNum Peaks: 3\n'
+                '70 1; 80 2;\n90 3;\n')
+
+    data = deimos.load(path)
+
+    assert data['spectra']['Name'].tolist() == ['A', 'B']
+    assert data['spectra']['PrecursorMZ'].tolist() == [100.5, 200]
+    assert data['spectra']['num_peaks'].tolist() == [2, 3]
+    assert data['peaks']['mz'].tolist() == [50, 60.5, 70, 80, 90]
+    assert data['peaks']['intensity'].tolist() == [10, 20, 1, 2, 3]
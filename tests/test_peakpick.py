@@ -1,4 +1,6 @@
 import deimos
+import numpy as np
+import os
 import pandas as pd
 import pytest
 
@@ -94,6 +96,64 @@ def test_local_maxima_fail(ms1, dims, bins, scale_by, ref_res, scale):
                                      ref_res=ref_res, scale=scale)
         
 
-def test_persistent_homology():
-    with pytest.raises(NotImplementedError):
-        raise NotImplementedError
+@pytest.mark.parametrize('tile_shape,workers',
+                         [(8, 1),
+                          ([5, 30], 2)])
+def test_local_maxima_tiled(blobs, tile_shape, workers):
+    expected = deimos.peakpick.local_maxima(blobs, dims=['mz', 'drift_time'],
+                                            bins=[5, 5])
+    peaks = deimos.peakpick.local_maxima(blobs, dims=['mz', 'drift_time'],
+                                         bins=[5, 5], tile_shape=tile_shape,
+                                         workers=workers)
+
+    assert peaks.equals(expected)
+    assert peaks['mz'].tolist() == [104, 111]
+    assert peaks['drift_time'].tolist() == [12, 11]
+
+
+def test_local_maxima_memmap(blobs, tmp_path):
+    _, H = deimos.grid.data2grid(blobs, dims=['mz', 'drift_time'])
+    out = np.memmap(os.path.join(tmp_path, 'max.dat'), dtype=H.dtype,
+                    mode='w+', shape=H.shape)
+
+    expected = deimos.peakpick.local_maxima(blobs, dims=['mz', 'drift_time'],
+                                            bins=[5, 5])
+    peaks = deimos.peakpick.local_maxima(blobs, dims=['mz', 'drift_time'],
+                                         bins=[5, 5], tile_shape=8, out=out)
+
+    assert peaks.equals(expected)
+
+
+@pytest.mark.parametrize('bins,scale',
+                         [([5, 3, 7], None),
+                          ([3, 1, 1], None),
+                          ([2.7, 0.94, 3.64], 'drift_time')])
+def test_sparse_local_maxima(make_lattice, bins, scale):
+    features = make_lattice((40, 15, 30), 2000, high=100, dtype=float)
+    kwargs = {}
+    if scale is not None:
+        kwargs = {'scale_by': 'mz', 'ref_res': 0.25, 'scale': scale}
+
+    expected = deimos.peakpick.local_maxima(features, bins=bins, **kwargs)
+    dims = ['mz', 'drift_time', 'retention_time']
+
+    # Index from features, factors, or precomputed index
+    factors = deimos.build_factors(features, dims=dims)
+    for opts in [{}, {'factors': factors},
+                 {'index': deimos.build_index(features, factors)}]:
+        peaks = deimos.peakpick.sparse_local_maxima(features, bins=bins, **opts, **kwargs)
+        peaks = peaks.sort_values(by=dims, ignore_index=True)
+
+        assert len(peaks.index) > 0
+        assert np.array_equal(peaks[dims + ['intensity']].values,
+                              expected[dims + ['intensity']].values)
+
+
+def test_persistent_homology(blobs):
+    peaks = deimos.peakpick.persistent_homology(blobs,
+                                                dims=['mz', 'drift_time'])
+    peaks = peaks.loc[peaks['persistence'] > 100]
+
+    assert peaks['mz'].tolist() == [104, 111]
+    assert peaks['drift_time'].tolist() == [12, 11]
+    assert np.allclose(peaks['persistence'], [1000, 500], rtol=0.01)
@@ -39,6 +39,65 @@ def test_collapse(ms1, keep, how, length):
     assert len(collapsed.index) == length
 
 
+@pytest.mark.parametrize('keep,how',
+                         [(['mz', 'drift_time'], np.sum),
+                          (['mz', 'drift_time'], 'mean'),
+                          (['retention_time'], np.max),
+                          (['drift_time', 'retention_time'], np.min),
+                          (['mz'], 'count'),
+                          (['mz', 'drift_time', 'retention_time'], np.sum)])
+def test_collapse_index(make_lattice, keep, how):
+    features = make_lattice((400, 30, 20), 5000, dtype=np.uint32, replace=True)
+    dims = ['mz', 'drift_time', 'retention_time']
+
+    expected = deimos.collapse(features, keep=keep, how=how)
+
+    # Index from factors or precomputed index
+    factors = deimos.build_factors(features, dims=dims)
+    for opts in [{'factors': factors},
+                 {'index': deimos.build_index(features, factors)}]:
+        collapsed = deimos.collapse(features, keep=keep, how=how, **opts)
+
+        assert all(collapsed.columns == keep + ['intensity'])
+        assert np.array_equal(collapsed[keep].values, expected[keep].values)
+        assert np.allclose(collapsed['intensity'].values,
+                           expected['intensity'].values)
+        assert collapsed['intensity'].dtype == expected['intensity'].dtype
+
+    # Unsupported aggregation falls back to groupby
+    collapsed = deimos.collapse(features, keep=keep, how=np.median,
+                                factors=factors)
+    assert collapsed.equals(deimos.collapse(features, keep=keep, how=np.median))
+
+
+@pytest.mark.parametrize('how',
+                         [(np.sum),
+                          (np.max),
+                          (np.min),
+                          ('mean'),
+                          ('count')])
+def test_collapse_index_nan(how):
+    features = pd.DataFrame({'mz': [100.0, 100.0, 100.5, 100.5, 101.0],
+                             'intensity': [1.0, np.nan, np.nan, np.nan, 4.0]})
+    factors = deimos.build_factors(features, dims='mz')
+
+    # Missing intensities skipped, as groupby
+    expected = deimos.collapse(features, keep='mz', how=how)
+    collapsed = deimos.collapse(features, keep='mz', how=how, factors=factors)
+
+    assert collapsed.equals(expected)
+
+
+def test_collapse_fail():
+    features = pd.DataFrame({'mz': [100.0, 100.5],
+                             'intensity': [1.0, 2.0]})
+    factors = deimos.build_factors(features, dims='mz')
+
+    with pytest.raises(ValueError):
+        deimos.collapse(features, keep='mz', factors=factors,
+                        index=deimos.build_index(features, factors))
+
+
 @pytest.mark.parametrize('by,loc,tol,return_index',
                          [(['mz', 'drift_time', 'retention_time'],
                            [212.0, 17.2, 4.79],
@@ -253,6 +312,106 @@ def test_locate_asym_return_none(ms1, by, loc, low, high, relative, return_index
         assert subset is None
 
 
+@pytest.fixture()
+def features():
+    rng = np.random.default_rng(0)
+    n = 5000
+    return pd.DataFrame({'mz': np.round(rng.uniform(100, 1000, n), 2),
+                         'drift_time': np.round(rng.uniform(10, 40, n), 1),
+                         'retention_time': np.round(rng.uniform(0, 10, n), 1),
+                         'intensity': rng.integers(1, 1000, n).astype(np.uint32)},
+                        index=np.arange(n) * 2)
+
+
+@pytest.mark.parametrize('primary',
+                         [('mz'),
+                          ('drift_time')])
+def test_feature_index(features, primary):
+    index = deimos.subset.FeatureIndex(features, by=primary)
+    assert len(index) == len(features.index)
+
+    rng = np.random.default_rng(1)
+    by = ['mz', 'drift_time', 'retention_time']
+    for loc in features[by].values[rng.choice(len(features.index), 20)]:
+        tol = [5, 2, 1]
+
+        # Positional index matches full scan
+        idx = np.ones(len(features.index), dtype=bool)
+        for dim, x, dx in zip(by, loc, tol):
+            idx &= (features[dim] >= x - dx) & (features[dim] <= x + dx)
+
+        pos = index.query(by=by, low=loc - tol, high=loc + tol)
+        assert np.array_equal(pos, np.flatnonzero(idx))
+
+        # Transparent in locate and locate_asym
+        for func, kwargs in [(deimos.locate, {'tol': tol}),
+                             (deimos.locate_asym, {'low': [-x for x in tol], 'high': tol})]:
+            expected, expected_idx = func(features, by=by, loc=loc, return_index=True, **kwargs)
+            subset, subset_idx = func(index, by=by, loc=loc, return_index=True, **kwargs)
+
+            assert subset.equals(expected)
+            assert np.array_equal(subset_idx, expected_idx)
+
+    # Dimension other than primary only
+    subset = deimos.slice(index, by='retention_time', low=2, high=3)
+    assert subset.equals(deimos.slice(features, by='retention_time', low=2, high=3))
+
+    # No data
+    assert deimos.slice(index, by='mz', low=2000, high=3000) is None
+
+
+@pytest.mark.parametrize('relative,chunk_size',
+                         [([False, False, False], 2 ** 24),
+                          ([True, True, False], 2 ** 24),
+                          ([True, False, False], 10)])
+def test_locate_many(features, relative, chunk_size):
+    by = ['mz', 'drift_time', 'retention_time']
+    tol = [0.5, 1, 0.5]
+    if relative[0] is True:
+        tol[0] = 2E-3
+    if relative[1] is True:
+        tol[1] = 0.05
+
+    rng = np.random.default_rng(1)
+    locs = features[by].values[rng.choice(len(features.index), 50)]
+    locs = np.vstack([locs, [[5000, 0, 0]]])
+
+    # Reference loop over locate
+    expected = []
+    for i, loc in enumerate(locs):
+        t = [x * dx if rel is True else dx for x, dx, rel in zip(loc, tol, relative)]
+        subset = deimos.locate(features, by=by, loc=loc, tol=t)
+        if subset is not None:
+            expected.append(subset.assign(query_idx=i))
+    expected = pd.concat(expected)
+
+    for data in [features, deimos.subset.FeatureIndex(features, by='drift_time')]:
+        result = deimos.locate_many(data, by=by, locs=locs, tol=tol,
+                                    relative=relative, chunk_size=chunk_size)
+
+        assert result.equals(expected)
+        assert set(result['query_idx']) == set(range(50))
+
+
+def test_locate_many_return_none(features):
+    assert deimos.locate_many(None, by='mz', locs=[100], tol=1, relative=False) is None
+    assert deimos.locate_many(features, by='mz', locs=[5000, 6000], tol=1,
+                              relative=False) is None
+
+
+def test_slice_dtypes(features):
+    subset = deimos.slice(features, by='mz', low=200, high=300)
+
+    # Column types preserved, original index kept
+    assert subset.dtypes.equals(features.dtypes)
+    assert subset.equals(features.loc[(features['mz'] >= 200) & (features['mz'] <= 300)])
+
+
+@pytest.fixture()
+def lattice(make_lattice):
+    return make_lattice((100, 15, 20), 5000)
+
+
 class TestPartitions:
 
     @pytest.mark.parametrize('split_on,size,overlap',
@@ -309,6 +468,31 @@ class TestPartitions:
 
         assert i == 82
 
+    @pytest.mark.parametrize('presorted,dtype',
+                             [(False, np.float64),
+                              (True, np.float64),
+                              (False, np.float32)])
+    def test_iter_slice(self, features, presorted, dtype):
+        features['mz'] = features['mz'].astype(dtype)
+        if presorted is True:
+            features = features.sort_values(by='mz')
+
+        partitions = deimos.partition(features, split_on='mz', size=200,
+                                      overlap=0.5)
+
+        # Same rows and order as slicing each bound
+        for i, part in enumerate(partitions):
+            a, b = partitions.bounds[i]
+            assert part.equals(deimos.slice(features, by='mz', low=a, high=b))
+
+        assert i == len(partitions.bounds) - 1
+
+        # Rows kept after reconciling overlap
+        res = partitions.map(deimos.threshold, by='intensity', threshold=500)
+        expected = deimos.threshold(features, by='intensity', threshold=500)
+        assert np.array_equal(np.unique(res['mz'].values),
+                              np.unique(expected['mz'].values))
+
     @pytest.mark.parametrize('processes',
                              [(1),
                               (2)])
@@ -354,6 +538,75 @@ class TestPartitions:
         assert pres_a.equals(res_a)
         assert pres_b.equals(res_b)
 
+    @pytest.mark.parametrize('func,kwargs',
+                             [(deimos.threshold, {'by': 'intensity', 'threshold': 500}),
+                              (deimos.peakpick.persistent_homology, {}),
+                              (deimos.filters.smooth, {}),
+                              (deimos.peakpick.local_maxima, {'bins': [5, 3, 5]})])
+    def test_map_shared(self, lattice, func, kwargs):
+        partitions = deimos.partition(lattice, split_on='mz', size=20,
+                                      overlap=1)
+
+        expected = partitions.map(func, **kwargs)
+        res = partitions.map(func, processes=2, shared=True, **kwargs)
+
+        assert res.equals(expected)
+
+    @pytest.mark.parametrize('func,kwargs',
+                             [(deimos.filters.smooth, {}),
+                              (deimos.filters.smooth, {'radius': [0, 2, 2],
+                                                       'iterations': 2})])
+    def test_map_shared_same_length(self, lattice, func, kwargs):
+        partitions = deimos.partition(lattice.sample(frac=1, random_state=1),
+                                      split_on='mz', size=20, overlap=1)
+
+        expected = partitions.map(func, **kwargs)
+        res = partitions.map(func, processes=2, shared=True, same_length=True,
+                             **kwargs)
+
+        assert res.equals(expected)
+
+    def test_map_shared_same_length_fail(self, lattice):
+        partitions = deimos.partition(lattice, split_on='mz', size=20,
+                                      overlap=1)
+
+        with pytest.raises(ValueError):
+            partitions.map(deimos.threshold, processes=2, shared=True,
+                           same_length=True, threshold=1E3)
+
+    def test_zipmap_shared(self, lattice):
+        b = lattice.sample(frac=0.5, random_state=1)
+        b['mz'] += 1E-4
+
+        partitions = deimos.partition(lattice, split_on='mz', size=20,
+                                      overlap=1)
+
+        kwargs = {'dims': ['mz', 'drift_time'], 'tol': [1E-5, 0.01],
+                  'relative': [True, True]}
+        expected_a, expected_b = partitions.zipmap(deimos.alignment.tolerance,
+                                                   b, **kwargs)
+        res_a, res_b = partitions.zipmap(deimos.alignment.tolerance, b,
+                                         processes=2, shared=True, **kwargs)
+
+        assert res_a.equals(expected_a)
+        assert res_b.equals(expected_b)
+
+    def test_map_shared_fail(self, lattice):
+        lattice['label'] = 'a'
+        partitions = deimos.partition(lattice, split_on='mz', size=20,
+                                      overlap=1)
+
+        with pytest.raises(ValueError):
+            partitions.map(deimos.threshold, processes=2, shared=True)
+
+    def test_map_shared_extension_fail(self, lattice):
+        lattice['intensity'] = lattice['intensity'].round().astype('Int64')
+        partitions = deimos.partition(lattice, split_on='mz', size=20,
+                                      overlap=1)
+
+        with pytest.raises(ValueError):
+            partitions.map(deimos.threshold, processes=2, shared=True)
+
 
 @pytest.mark.parametrize('split_on,size,overlap',
                          [('mz', 1000, 0.05),
@@ -24,14 +24,18 @@ rule mzml2hdf:
         lambda wildcards: join('input', lookup[wildcards.id])
     output:
         join('output', 'parsed', '{id}.h5')
+    threads:
+        config.get('workers', 1)
     run:
-        # Read/parse mzml
-        data = deimos.load(input[0], accession=config['accession'])
-
-        # Enumerate MS levels
-        for k, v in data.items():
-            # Save as hdf5
-            deimos.save(output[0], v, key=k, mode='a')
+        # Read/parse mzml in chunks
+        for k, v in deimos.io.iter_mzml(input[0],
+                                        accession=config['accession'],
+                                        chunk_rows=config.get('chunk_rows', 1E7),
+                                        workers=threads):
+            # Append to hdf5
+            deimos.save(output[0], v, key=k, mode='a', append=True,
+                        profile=config.get('profile', 'balanced'),
+                        data_columns=config.get('data_columns'))
 
 
 # Build factors
@@ -75,8 +79,14 @@ rule threshold:
             # Threshold
             data = deimos.threshold(data, threshold=config['threshold'])
 
+            # Sort by m/z, such that indexed reads are contiguous
+            if config.get('data_columns'):
+                data = data.sort_values(by='mz', ignore_index=True)
+
             # Save
-            deimos.save(output[0], data, key=k, mode='a')   
+            deimos.save(output[0], data, key=k, mode='a',
+                        profile=config.get('profile', 'balanced'),
+                        data_columns=config.get('data_columns'))
 
 
 # Smooth data
@@ -103,10 +113,17 @@ rule smooth:
                                          factors=factors[k],
                                          dims=config['dims'],
                                          iterations=config['smooth']['iters'],
-                                         radius=config['smooth']['radius'])
+                                         radius=config['smooth']['radius'],
+                                         atol=config['smooth'].get('atol'))
+
+            # Sort by m/z, such that indexed reads are contiguous
+            if config.get('data_columns'):
+                data = data.sort_values(by='mz', ignore_index=True)
 
             # Save
-            deimos.save(output[0], data, key=k, mode='a')
+            deimos.save(output[0], data, key=k, mode='a',
+                        profile=config.get('profile', 'balanced'),
+                        data_columns=config.get('data_columns'))
 
 
 # Perform peak detection
@@ -134,5 +151,11 @@ rule peakpick:
                                                         dims=config['dims'],
                                                         radius=config['weighted_mean']['radius'])
 
+            # Sort by m/z, such that indexed reads are contiguous
+            if config.get('data_columns'):
+                peaks = peaks.sort_values(by='mz', ignore_index=True)
+
             # Save
-            deimos.save(output[0], peaks, key=k, mode='a')
+            deimos.save(output[0], peaks, key=k, mode='a',
+                        profile=config.get('profile', 'balanced'),
+                        data_columns=config.get('data_columns'))